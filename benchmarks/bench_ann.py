@@ -0,0 +1,159 @@
+"""Benchmark: recall@k, latency and memory of ANN index specs against exact search.
+
+Vectors come from an existing vector store (--store) or a synthetic
+clustered corpus. Each spec is built once, then queried one query at a time
+for every search parameter value in the sweep.
+
+    python benchmarks/bench_ann.py --vectors 100000 --dim 384 \\
+        --spec Flat --spec HNSW32 --spec IVF1024,PQ32 --spec IVF1024,SQ8 --spec SQ8
+    python benchmarks/bench_ann.py --store data/vector_store --json ann.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from ann_index import build_index, index_memory_bytes, normalize_spec, set_search_params  # noqa: E402
+from chunk_store import VECTORS_FILE  # noqa: E402
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around random centres, so partitioning indexes have structure to find."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(clusters, size=n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return np.ascontiguousarray(_unit_rows(vectors), dtype=np.float32)
+
+
+def make_queries(vectors: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    """Perturbed copies of stored vectors, like paraphrased questions."""
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.integers(len(vectors), size=n)]
+    noisy = picked + 0.1 * rng.standard_normal(picked.shape).astype(np.float32)
+    return np.ascontiguousarray(_unit_rows(noisy), dtype=np.float32)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Mean fraction of the exact top-k that the index returned."""
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    """Search one query at a time and report recall and latency percentiles."""
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, positions = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(positions[0])
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'recall': recall_at_k(np.array(found), truth),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def benchmark_spec(spec: str, vectors, queries, truth, k: int, nprobes, ef_searches) -> list:
+    """Build one spec and measure it for each applicable search parameter."""
+    start = time.perf_counter()
+    index = build_index(spec, vectors)
+    build_seconds = time.perf_counter() - start
+    if index is None:
+        print(f"   ⚠️  {spec}: too few vectors to train, skipped")
+        return []
+    
+    if "IVF" in spec:
+        sweep = [('nprobe', value) for value in nprobes]
+    elif "HNSW" in spec:
+        sweep = [('efSearch', value) for value in ef_searches]
+    else:
+        sweep = [(None, None)]
+    
+    rows = []
+    for param, value in sweep:
+        if param == 'nprobe':
+            set_search_params(index, nprobe=value)
+        elif param == 'efSearch':
+            set_search_params(index, ef_search=value)
+        rows.append({
+            'spec': spec,
+            'param': f"{param}={value}" if param else "",
+            'build_s': build_seconds,
+            'memory_mb': index_memory_bytes(index) / 2**20,
+            **measure(index, queries, truth, k),
+        })
+    return rows
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--store", type=Path, help="Benchmark the vectors of this vector store")
+    parser.add_argument("--vectors", type=int, default=100000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="Synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=1000, help="Number of queries")
+    parser.add_argument("--k", type=int, default=7, help="Neighbours per query (recall@k)")
+    parser.add_argument("--spec", action="append", help="FAISS index spec, repeatable")
+    parser.add_argument("--nprobe", default="1,4,16,64", help="IVF nprobe values to sweep")
+    parser.add_argument("--ef-search", default="16,64,256", help="HNSW efSearch values to sweep")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads")
+    parser.add_argument("--json", type=Path, help="Also write results to this JSON file")
+    args = parser.parse_args()
+    
+    faiss.omp_set_num_threads(args.threads)
+    if args.store:
+        vectors = np.ascontiguousarray(np.load(args.store / VECTORS_FILE), dtype=np.float32)
+    else:
+        vectors = synthetic_vectors(args.vectors, args.dim)
+    queries = make_queries(vectors, args.queries)
+    
+    nlist = max(1, int(np.sqrt(len(vectors))))
+    specs = args.spec or ["Flat", "HNSW32", f"IVF{nlist},PQ{vectors.shape[1] // 8}", f"IVF{nlist},SQ8", "SQ8"]
+    nprobes = [int(v) for v in args.nprobe.split(",")]
+    ef_searches = [int(v) for v in args.ef_search.split(",")]
+    
+    print(f"\n📐 {len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}")
+    _, truth = faiss.knn(queries, vectors, args.k)
+    
+    results = []
+    for spec in specs:
+        print(f"   building {normalize_spec(spec)}...")
+        results.extend(benchmark_spec(normalize_spec(spec), vectors, queries, truth, args.k, nprobes, ef_searches))
+    
+    print("\n" + "="*84)
+    print(f"{'spec':<20}{'param':<14}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p99 ms':>10}"
+          f"{'memory MB':>11}{'build s':>9}")
+    print("="*84)
+    for r in results:
+        print(f"{r['spec']:<20}{r['param']:<14}{r['recall']:>10.3f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}"
+              f"{r['memory_mb']:>11.1f}{r['build_s']:>9.1f}")
+    print("="*84 + "\n")
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'vectors': len(vectors),
+                'dim': int(vectors.shape[1]),
+                'queries': len(queries),
+                'k': args.k,
+                'results': results,
+            }, f, indent=2)
+        print(f"✓ Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
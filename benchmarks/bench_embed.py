@@ -0,0 +1,139 @@
+"""Benchmark: query embedding throughput with and without the micro-batcher.
+
+Closed-loop threads call embed_query as fast as they can, first on the
+embedding model directly (one forward pass per query) and then through
+EmbeddingBatcher. By default the model is a randomly initialized encoder
+with the shape of all-MiniLM-L6 (6 layers, 384 hidden) and a hashing
+tokenizer, so runs are offline; pass --model to use a real
+sentence-transformers model.
+
+    python benchmarks/bench_embed.py --concurrency 1,8,32,64
+    python benchmarks/bench_embed.py --model sentence-transformers/multi-qa-MiniLM-L6-cos-v1
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from config import EXAMPLE_QUESTIONS  # noqa: E402
+from embeddings import EmbeddingBatcher  # noqa: E402
+
+
+class RandomMiniLM(Embeddings):
+    """MiniLM-shaped BERT encoder with random weights and a hashing tokenizer."""
+    
+    def __init__(self, vocab_size: int = 30522):
+        import torch
+        from transformers import BertConfig, BertModel
+        
+        self.torch = torch
+        self.vocab_size = vocab_size
+        config = BertConfig(vocab_size=vocab_size, hidden_size=384, num_hidden_layers=6,
+                            num_attention_heads=12, intermediate_size=1536)
+        self.model = BertModel(config).eval()
+    
+    def _tokens(self, text: str) -> list:
+        return [101] + [1000 + zlib.crc32(word.encode()) % (self.vocab_size - 1000) for word in text.split()] + [102]
+    
+    def embed_documents(self, texts):
+        ids = [self._tokens(text) for text in texts]
+        width = max(len(row) for row in ids)
+        input_ids = self.torch.tensor([row + [0] * (width - len(row)) for row in ids])
+        mask = (input_ids != 0).long()
+        with self.torch.inference_mode():
+            hidden = self.model(input_ids=input_ids, attention_mask=mask).last_hidden_state
+        pooled = (hidden * mask.unsqueeze(-1)).sum(1) / mask.sum(1, keepdim=True)
+        pooled = self.torch.nn.functional.normalize(pooled, dim=-1)
+        return pooled.tolist()
+    
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def load_model(name: str) -> Embeddings:
+    if not name:
+        return RandomMiniLM()
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=name, model_kwargs={'device': 'cpu'},
+                                 encode_kwargs={'normalize_embeddings': True, 'batch_size': 32})
+
+
+def run(embeddings: Embeddings, concurrency: int, duration: float) -> dict:
+    """Closed-loop threads for `duration` seconds; every query is distinct."""
+    latencies = []
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+    
+    def worker(n: int):
+        i = 0
+        local = []
+        while time.perf_counter() < stop:
+            question = f"{EXAMPLE_QUESTIONS[i % len(EXAMPLE_QUESTIONS)]} ({n}-{i})"
+            start = time.perf_counter()
+            embeddings.embed_query(question)
+            local.append(time.perf_counter() - start)
+            i += 1
+        with lock:
+            latencies.extend(local)
+    
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'qps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="", help="sentence-transformers model (default: random MiniLM shape)")
+    parser.add_argument("--concurrency", default="1,8,32,64", help="Comma-separated thread counts")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per run")
+    parser.add_argument("--batch-size", type=int, default=32, help="Micro-batch size")
+    parser.add_argument("--wait-ms", type=float, default=2.0, help="Micro-batch window")
+    parser.add_argument("--json", type=Path, help="Also write results to this JSON file")
+    args = parser.parse_args()
+    
+    model = load_model(args.model)
+    model.embed_query("warm up")
+    results = []
+    print(f"\n{'threads':>8}{'direct q/s':>12}{'p99 ms':>9}{'batched q/s':>13}{'p99 ms':>9}{'mean batch':>12}{'speedup':>9}")
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        direct = run(model, concurrency, args.duration)
+        batcher = EmbeddingBatcher(model, max_batch_size=args.batch_size, max_wait_ms=args.wait_ms)
+        batched = run(batcher, concurrency, args.duration)
+        batched['mean_batch_size'] = batcher.stats()['mean_batch_size']
+        batcher.close()
+        results.append({'concurrency': concurrency, 'direct': direct, 'batched': batched})
+        print(f"{concurrency:>8}{direct['qps']:>12.0f}{direct['p99_ms']:>9.1f}{batched['qps']:>13.0f}"
+              f"{batched['p99_ms']:>9.1f}{batched['mean_batch_size']:>12.1f}{batched['qps'] / direct['qps']:>8.1f}x")
+    print()
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'model': args.model or 'random-minilm', 'results': results}, f, indent=2)
+        print(f"✓ Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
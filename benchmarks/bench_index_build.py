@@ -0,0 +1,134 @@
+"""Benchmark: one-pass FAISS build vs. the old per-batch merge_from loop.
+
+Each variant runs in a fresh process so peak memory is not shared between
+them. Embeddings are deterministic and offline by default; pass --model to
+use the configured sentence-transformers model instead.
+
+    python benchmarks/bench_index_build.py --chunks 20000 --dim 384
+"""
+
+import argparse
+import multiprocessing as mp
+import resource
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+
+def synthetic_chunks(n: int):
+    """Create n chunk-sized synthetic documents."""
+    from langchain.schema import Document
+    
+    words = ["diabetes", "insulin", "glucose", "hypertension", "renal", "cardiac",
+             "infection", "antibiotic", "dosage", "symptom", "diagnosis", "therapy"]
+    return [
+        Document(
+            page_content=" ".join(words[(i + j) % len(words)] for j in range(200)) + f" #{i}",
+            metadata={'source': f"synthetic_{i // 500}.pdf", 'page': i % 500 + 1}
+        )
+        for i in range(n)
+    ]
+
+
+def make_embeddings(dim: int, use_model: bool):
+    """Offline deterministic embeddings, or the configured model."""
+    if use_model:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        from config import settings
+        return HuggingFaceEmbeddings(
+            model_name=settings.embedding_model,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True, 'batch_size': 8}
+        )
+    
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+    return DeterministicFakeEmbedding(size=dim)
+
+
+def build_with_merge_loop(chunks, embeddings, batch_size: int = 100):
+    """The previous implementation: from_documents + merge_from per batch."""
+    from langchain_community.vectorstores import FAISS
+    
+    vector_store = None
+    for i in range(0, len(chunks), batch_size):
+        batch = chunks[i:i + batch_size]
+        if vector_store is None:
+            vector_store = FAISS.from_documents(batch, embeddings)
+        else:
+            vector_store.merge_from(FAISS.from_documents(batch, embeddings))
+    return vector_store
+
+
+def build_one_pass(chunks, embeddings):
+    """The current implementation: one matrix, one index.add, one docstore."""
+    from ingest import DocumentIngester
+    
+    ingester = DocumentIngester(embeddings=embeddings)
+    return ingester.build_vector_store(chunks, ingester.embed_chunks(chunks))
+
+
+def _run_variant(variant: str, n_chunks: int, dim: int, use_model: bool, queue):
+    """Build one variant and report time and memory to the parent."""
+    # Import both code paths up front so module loading is not measured
+    import ingest  # noqa: F401
+    from langchain_community.vectorstores import FAISS  # noqa: F401
+    
+    chunks = synthetic_chunks(n_chunks)
+    embeddings = make_embeddings(dim, use_model)
+    build = build_with_merge_loop if variant == "merge_loop" else build_one_pass
+    
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    start = time.perf_counter()
+    vector_store = build(chunks, embeddings)
+    elapsed = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    queue.put({
+        'variant': variant,
+        'chunks': vector_store.index.ntotal,
+        'seconds': elapsed,
+        'python_peak_mb': traced_peak / 2**20,
+        'rss_growth_mb': (rss_after - rss_before) / 1024,
+    })
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000, help="Number of synthetic chunks")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension (offline mode)")
+    parser.add_argument("--model", action="store_true", help="Use the configured embedding model")
+    args = parser.parse_args()
+    
+    ctx = mp.get_context("spawn")
+    results = []
+    for variant in ("merge_loop", "one_pass"):
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_variant, args=(variant, args.chunks, args.dim, args.model, queue))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0:
+            raise RuntimeError(f"{variant} benchmark failed (exit code {proc.exitcode})")
+        results.append(queue.get())
+    
+    print("\n" + "="*60)
+    print(f"FAISS build benchmark ({args.chunks} chunks)")
+    print("="*60)
+    print(f"{'variant':<12}{'seconds':>10}{'py peak MB':>14}{'RSS growth MB':>16}")
+    for r in results:
+        print(f"{r['variant']:<12}{r['seconds']:>10.2f}{r['python_peak_mb']:>14.1f}{r['rss_growth_mb']:>16.1f}")
+    
+    baseline, current = results
+    print(f"\nSpeedup: {baseline['seconds'] / current['seconds']:.2f}x")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Benchmark: ingest, retrieval and end-to-end RAG latency on synthetic corpora.
+
+For each corpus size a synthetic medical-looking corpus is written as text
+files (one chunk per paragraph), ingested with DocumentIngester, searched
+with Retriever and answered with RAGSystem. Embeddings are hashed
+bag-of-words vectors and the LLM is the local stub model with configurable
+latency, so runs are offline and repeatable. Results are written as JSON
+(tagged with the git commit) and can be compared with an earlier run.
+
+    python benchmarks/bench_rag.py --sizes 10000,100000
+    python benchmarks/bench_rag.py --sizes 1000000 --index IVF1024,SQ8 --concurrency 1,16,64
+    python benchmarks/bench_rag.py --compare benchmarks/results/bench_rag-abc1234.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from config import settings  # noqa: E402
+
+RESULTS_DIR = Path(__file__).parent / "results"
+CHUNKS_PER_FILE = 500
+
+TOPICS = {
+    "diabetes": "insulin glucose hba1c metformin thirst polyuria neuropathy retinopathy ketoacidosis",
+    "hypertension": "blood pressure systolic diastolic ace inhibitor amlodipine sodium stroke kidney",
+    "asthma": "bronchospasm inhaler salbutamol wheeze corticosteroid spirometry allergen airway",
+    "influenza": "fever cough myalgia oseltamivir vaccine virus respiratory droplet season",
+    "cardiology": "angina troponin statin atherosclerosis ecg arrhythmia atrial fibrillation anticoagulant",
+    "nephrology": "creatinine egfr dialysis proteinuria nephron electrolyte potassium edema",
+    "oncology": "tumor metastasis chemotherapy radiotherapy biopsy carcinoma lymphoma staging",
+    "infectious": "antibiotic bacteria culture sepsis penicillin resistance pathogen incubation",
+}
+FILLER = ("the patient may present with and is treated by in most cases clinical evidence shows "
+          "that risk factors include management of first line therapy monitoring of").split()
+
+
+class HashEmbeddings(Embeddings):
+    """Normalized hashed bag-of-words vectors: fast, offline and deterministic."""
+    
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+    
+    def _embed(self, text: str) -> list:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode()) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+    
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+    
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def write_corpus(directory: Path, n_chunks: int, chunk_chars: int, seed: int = 0) -> int:
+    """Write n_chunks paragraphs of about chunk_chars characters into text files."""
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    directory.mkdir(parents=True, exist_ok=True)
+    for file_no, start in enumerate(range(0, n_chunks, CHUNKS_PER_FILE)):
+        paragraphs = []
+        for i in range(start, min(start + CHUNKS_PER_FILE, n_chunks)):
+            topic = topics[i % len(topics)]
+            words = TOPICS[topic].split() + FILLER
+            text = f"{topic} note {i}:"
+            while len(text) < chunk_chars:
+                text += " " + rng.choice(words)
+            paragraphs.append(text)
+        (directory / f"corpus_{file_no:05d}.txt").write_text("\n\n".join(paragraphs), encoding='utf-8')
+    return n_chunks
+
+
+def make_queries(n: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    return [
+        f"what is the {' '.join(rng.sample(TOPICS[topic].split(), 3))} treatment for {topic} #{i}"
+        for i, topic in ((i, rng.choice(topics)) for i in range(n))
+    ]
+
+
+def percentiles(latencies_s: list) -> dict:
+    ms = np.array(latencies_s) * 1000
+    return {
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+    }
+
+
+def store_size_mb(path: Path) -> dict:
+    """On-disk size of the vector store by component."""
+    groups = {'vectors': ("vectors.npy",), 'index': ("index.faiss",), 'bm25': ("bm25_",),
+              'chunks': ("chunks.", "ids.", "meta.", "extra.", "strings.")}
+    sizes = {name: 0 for name in groups}
+    total = 0
+    for f in path.iterdir():
+        size = f.stat().st_size
+        total += size
+        for name, prefixes in groups.items():
+            if f.name.startswith(prefixes):
+                sizes[name] += size
+    return {**{name: size / 2**20 for name, size in sizes.items()}, 'total': total / 2**20}
+
+
+def bench_ingest(corpus: Path, store: Path, embeddings, index_type: str) -> dict:
+    from ingest import DocumentIngester
+    
+    ingester = DocumentIngester(embeddings=embeddings, index_type=index_type)
+    start = time.perf_counter()
+    vector_store = ingester.ingest(full_rebuild=True, data_dir=corpus, store_path=store)
+    seconds = time.perf_counter() - start
+    chunks = vector_store.index.ntotal
+    return {
+        'chunks': chunks,
+        'seconds': seconds,
+        'chunks_per_s': chunks / seconds,
+        'store_mb': store_size_mb(store),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def bench_retrieval(retriever, queries: list, k: int) -> dict:
+    """Sequential single-query latency, then one retrieve_batch over all queries."""
+    retriever.embeddings.clear()
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        t = time.perf_counter()
+        retriever.retrieve_with_ids(query, k=k)
+        latencies.append(time.perf_counter() - t)
+    sequential = time.perf_counter() - start
+    
+    retriever.embeddings.clear()
+    start = time.perf_counter()
+    retriever.retrieve_batch(queries, k=k)
+    batched = time.perf_counter() - start
+    return {
+        'queries': len(queries),
+        'qps': len(queries) / sequential,
+        'batch_qps': len(queries) / batched,
+        **percentiles(latencies),
+    }
+
+
+async def _run_concurrent(rag, queries: list, concurrency: int) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    
+    async def one(query):
+        async with semaphore:
+            t = time.perf_counter()
+            await rag.aquery(query)
+            latencies.append(time.perf_counter() - t)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in queries))
+    return latencies, time.perf_counter() - start
+
+
+def bench_rag(rag, queries: list, concurrency: int) -> dict:
+    """End-to-end aquery latency with `concurrency` requests in flight."""
+    from metrics import metrics
+    
+    rag.retriever.embeddings.clear()
+    metrics.reset()
+    latencies, seconds = asyncio.run(_run_concurrent(rag, queries, concurrency))
+    return {
+        'concurrency': concurrency,
+        'requests': len(queries),
+        'qps': len(queries) / seconds,
+        **percentiles(latencies),
+        'stages': metrics.summary(),
+    }
+
+
+def run_size(n_chunks: int, args, work_dir: Path) -> dict:
+    from llm_local import BatchingEngine, LocalLLM, StubModel
+    from rag import RAGSystem
+    from retriever import Retriever
+    
+    corpus, store = work_dir / f"corpus_{n_chunks}", work_dir / f"store_{n_chunks}"
+    if not corpus.exists():
+        print(f"\n📝 Writing {n_chunks} synthetic chunks...")
+        write_corpus(corpus, n_chunks, int(settings.chunk_size * 0.8))
+    
+    embeddings = HashEmbeddings(args.dim)
+    result = {'size': n_chunks, 'ingest': bench_ingest(corpus, store, embeddings, args.index)}
+    
+    retriever = Retriever(store, embeddings=embeddings, mode=args.mode)
+    queries = make_queries(args.queries)
+    result['retrieval'] = bench_retrieval(retriever, queries, settings.top_k)
+    
+    engine = BatchingEngine(
+        StubModel(step_delay=args.llm_token_ms / 1000, prefill_delay=args.llm_prefill_ms / 1000),
+        max_batch_size=args.llm_batch
+    )
+    rag = RAGSystem(retriever=retriever, llm=LocalLLM(engine=engine))
+    result['rag'] = [
+        bench_rag(rag, make_queries(args.rag_queries, seed=10 + c), c) for c in args.concurrency
+    ]
+    engine.close()
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def headline(result: dict) -> dict:
+    """Flat metrics of one corpus size, used for printing and comparison."""
+    values = {
+        'ingest chunks/s': result['ingest']['chunks_per_s'],
+        'store MB': result['ingest']['store_mb']['total'],
+        'retrieve QPS': result['retrieval']['qps'],
+        'retrieve p99 ms': result['retrieval']['p99_ms'],
+        'batch retrieve QPS': result['retrieval']['batch_qps'],
+    }
+    for run in result['rag']:
+        values[f"rag c={run['concurrency']} QPS"] = run['qps']
+        values[f"rag c={run['concurrency']} p99 ms"] = run['p99_ms']
+    return values
+
+
+def print_results(report: dict, baseline: dict = None):
+    old = {r['size']: headline(r) for r in baseline['results']} if baseline else {}
+    for result in report['results']:
+        print("\n" + "="*64)
+        print(f"{result['size']} chunks ({result['ingest']['chunks']} indexed)"
+              + (f" vs {baseline['commit']}" if baseline else ""))
+        print("="*64)
+        for name, value in headline(result).items():
+            line = f"{name:<28}{value:>14.1f}"
+            previous = old.get(result['size'], {}).get(name)
+            if previous:
+                line += f"{(value - previous) / previous * 100:>+12.1f}%"
+            print(line)
+    print()
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000", help="Corpus sizes in chunks, e.g. 10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension")
+    parser.add_argument("--index", default="Flat", help="FAISS index spec")
+    parser.add_argument("--mode", default="dense", choices=["dense", "hybrid"], help="Retrieval mode")
+    parser.add_argument("--queries", type=int, default=500, help="Retrieval queries per size")
+    parser.add_argument("--rag-queries", type=int, default=200, help="End-to-end requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,8,32", help="Concurrent requests to sweep")
+    parser.add_argument("--llm-prefill-ms", type=float, default=0.0, help="Stub LLM prompt processing time")
+    parser.add_argument("--llm-token-ms", type=float, default=5.0, help="Stub LLM time per decode step")
+    parser.add_argument("--llm-batch", type=int, default=64, help="Stub LLM continuous batch size")
+    parser.add_argument("--work-dir", type=Path, help="Keep corpora and stores here (default: temporary)")
+    parser.add_argument("--json", type=Path, help="Results file (default: benchmarks/results/bench_rag-<commit>.json)")
+    parser.add_argument("--compare", type=Path, help="Earlier results file to show changes against")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    
+    # Measure the pipeline itself: no cross-request answer reuse
+    settings.answer_cache_enabled = False
+    settings.coalesce_requests = False
+    
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'config': {key: (str(value) if isinstance(value, Path) else value) for key, value in vars(args).items()},
+        'results': [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = args.work_dir or Path(tmp)
+        for size in (int(s) for s in args.sizes.split(",")):
+            report['results'].append(run_size(size, args, work_dir))
+    
+    print_results(report, baseline)
+    
+    output = args.json or RESULTS_DIR / f"bench_rag-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
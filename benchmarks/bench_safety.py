@@ -0,0 +1,139 @@
+"""Benchmark: compiled safety matcher against per-phrase substring scans.
+
+Generates a synthetic phrase list (multi-word phrases over a mixed-language
+vocabulary, split between the emergency and personal advice categories) and
+synthetic queries (10% containing a phrase by default), checks that both
+methods agree, and reports compile time and per-query latency.
+
+    python benchmarks/bench_safety.py --phrases 10000 --queries 5000
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add src to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from safety import EMERGENCY, PERSONAL_ADVICE, SafetyClassifier, normalize_text  # noqa: E402
+
+VOCABULARY = (
+    "pain chest breathe bleeding heart attack stroke dose overdose fever child baby "
+    "dolor pecho respirar sangrado corazón urgence douleur poitrine saignement "
+    "schmerzen brust atmen blutung notfall should take what do have my symptoms "
+    "am i can't help now severe sudden heavily unconscious seizure pills too many"
+).split()
+
+
+def synthetic_phrases(n: int, seed: int = 0) -> dict:
+    """n distinct 2-4 word phrases, one in five of them emergency phrases."""
+    rng = random.Random(seed)
+    phrases = set()
+    while len(phrases) < n:
+        phrases.add(" ".join(rng.choices(VOCABULARY, k=rng.randint(2, 4))))
+    phrases = sorted(phrases)
+    rng.shuffle(phrases)
+    cut = n // 5
+    return {EMERGENCY: phrases[:cut], PERSONAL_ADVICE: phrases[cut:]}
+
+
+def synthetic_queries(n: int, phrases: dict, hit_rate: float = 0.1, seed: int = 1) -> list:
+    """Questions of 6-25 words; a hit_rate share of them contains one of the phrases."""
+    rng = random.Random(seed)
+    words = (
+        "what is the of for and how does a treatment cause symptoms diabetes blood pressure "
+        "insulin vaccine common cold asthma tablets side effects diet exercise sleep "
+        "cholesterol kidney liver infection antibiotics vitamin"
+    ).split()
+    all_phrases = [phrase for values in phrases.values() for phrase in values]
+    queries = []
+    for _ in range(n):
+        query = rng.choices(words, k=rng.randint(6, 25))
+        if rng.random() < hit_rate:
+            query.insert(rng.randrange(len(query)), rng.choice(all_phrases))
+        queries.append(" ".join(query))
+    return queries
+
+
+def naive_classify(phrases: dict, query: str):
+    """The previous method: one substring test per phrase, category by category."""
+    query = normalize_text(query)
+    for category, category_phrases in phrases.items():
+        if any(phrase in query for phrase in category_phrases):
+            return category
+    return None
+
+
+def time_per_query(fn, queries) -> dict:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - start)
+    latencies_us = np.array(latencies) * 1e6
+    return {
+        'p50_us': float(np.percentile(latencies_us, 50)),
+        'p99_us': float(np.percentile(latencies_us, 99)),
+        'mean_us': float(latencies_us.mean()),
+    }
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--phrases", type=int, default=10000, help="Number of phrases")
+    parser.add_argument("--queries", type=int, default=5000, help="Number of queries")
+    parser.add_argument("--hit-rate", type=float, default=0.1, help="Share of queries containing a phrase")
+    parser.add_argument("--json", type=Path, help="Also write results to this JSON file")
+    args = parser.parse_args()
+    
+    phrases = synthetic_phrases(args.phrases)
+    queries = synthetic_queries(args.queries, phrases, args.hit_rate)
+    normalized = {category: [normalize_text(p) for p in values] for category, values in phrases.items()}
+    
+    start = time.perf_counter()
+    classifier = SafetyClassifier(phrases)
+    compile_ms = (time.perf_counter() - start) * 1000
+    
+    mismatches = sum(
+        classifier.classify(query).category != naive_classify(normalized, query) for query in queries
+    )
+    flagged = sum(classifier.classify(query).category is not None for query in queries)
+    
+    results = {
+        'phrases': len(classifier),
+        'queries': len(queries),
+        'flagged': flagged,
+        'mismatches': mismatches,
+        'compile_ms': compile_ms,
+        'compiled': time_per_query(classifier.classify, queries),
+        'naive': time_per_query(lambda q: naive_classify(normalized, q), queries),
+    }
+    
+    print(f"\n🛡️  {results['phrases']} phrases, {len(queries)} queries ({flagged} flagged), "
+          f"compiled in {compile_ms:.0f} ms")
+    print("\n" + "="*52)
+    print(f"{'method':<12}{'p50 µs':>12}{'p99 µs':>12}{'mean µs':>12}")
+    print("="*52)
+    for method in ('compiled', 'naive'):
+        r = results[method]
+        print(f"{method:<12}{r['p50_us']:>12.1f}{r['p99_us']:>12.1f}{r['mean_us']:>12.1f}")
+    print("="*52)
+    print(f"Speedup (mean): {results['naive']['mean_us'] / results['compiled']['mean_us']:.0f}x")
+    if mismatches:
+        print(f"⚠️  {mismatches} queries classified differently")
+    print()
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Load test: throughput against latency for /chat at increasing concurrency.
+
+Replays a query log (text lines, or JSONL with a "query" field) or the Gradio
+example questions against a running API. Each concurrency level runs closed-
+loop clients for a fixed time and reports throughput, latency percentiles and
+errors; the saturation point is the first level where throughput stops
+growing (less than --knee gain over the previous level) or errors or p99
+exceed their limits. Every request gets a unique suffix so the answer cache
+and request coalescing don't serve repeats; --repeat sends the queries as is.
+
+With --spawn the mock Hugging Face endpoint (benchmarks/mock_hf.py) and the
+API are started as subprocesses, so the LLM latency is controlled and no
+tokens are spent. The spawned API runs with the answer cache and request
+coalescing off; it still loads the configured embedding model and vector
+store.
+
+    python benchmarks/loadtest.py --spawn --concurrency 1,2,4,8,16,32,64
+    python benchmarks/loadtest.py --url http://localhost:8000 --queries queries.jsonl --repeat
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional
+
+import httpx
+import numpy as np
+
+ROOT = Path(__file__).parent.parent
+
+# Add src to path for imports
+sys.path.insert(0, str(ROOT / "src"))
+
+from config import EXAMPLE_QUESTIONS  # noqa: E402
+
+
+def load_queries(path: Optional[Path]) -> List[str]:
+    """Queries from a text or JSONL log; the Gradio examples when no path is given."""
+    if path is None:
+        return list(EXAMPLE_QUESTIONS)
+    queries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                line = json.loads(line).get('query', '')
+            if line:
+                queries.append(line)
+    if not queries:
+        raise ValueError(f"No queries in {path}")
+    return queries
+
+
+async def run_level(client: httpx.AsyncClient, url: str, queries: List[str], concurrency: int,
+                    duration: float, warmup: float = 0.0, vary: bool = True) -> dict:
+    """Closed-loop clients for warmup + duration seconds; only the last `duration` is measured."""
+    latencies, errors = [], []
+    sent = 0
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop = measure_from + duration
+    
+    async def worker():
+        nonlocal sent
+        while time.perf_counter() < stop:
+            query = queries[sent % len(queries)]
+            if vary:
+                query = f"{query} (request {sent})"  # Defeats the answer cache and request coalescing
+            sent += 1
+            began = time.perf_counter()
+            try:
+                response = await client.post(url, json={'query': query})
+                ok = response.status_code == 200
+                reason = str(response.status_code)
+            except httpx.HTTPError as e:
+                ok, reason = False, type(e).__name__
+            ended = time.perf_counter()
+            if began < measure_from or ended > stop:
+                continue
+            if ok:
+                latencies.append(ended - began)
+            else:
+                errors.append(reason)
+    
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    
+    completed = len(latencies) + len(errors)
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        'concurrency': concurrency,
+        'requests': completed,
+        'errors': len(errors),
+        'error_rate': len(errors) / completed if completed else 0.0,
+        'error_reasons': {reason: errors.count(reason) for reason in sorted(set(errors))},
+        'rps': len(latencies) / duration,
+        'mean_ms': float(latencies_ms.mean()),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def find_saturation(levels: List[dict], knee: float = 0.1, max_error_rate: float = 0.01,
+                    slo_p99_ms: Optional[float] = None) -> Optional[dict]:
+    """First level past which adding clients no longer pays: throughput gains under
+    `knee` (a fraction), the error rate exceeds its limit, or p99 breaks the SLO.
+    Returns that level with a 'reason', or None when the sweep never saturates."""
+    for i, level in enumerate(levels):
+        if level['error_rate'] > max_error_rate:
+            return {**level, 'reason': f"error rate {level['error_rate']:.1%}"}
+        if slo_p99_ms is not None and level['p99_ms'] > slo_p99_ms:
+            return {**level, 'reason': f"p99 {level['p99_ms']:.0f} ms over SLO"}
+        if i > 0 and levels[i - 1]['rps'] > 0 and level['rps'] < levels[i - 1]['rps'] * (1 + knee):
+            return {**level, 'reason': f"throughput gain under {knee:.0%}"}
+    return None
+
+
+async def sweep(url: str, queries: List[str], concurrencies: List[int], duration: float,
+                warmup: float, vary: bool, timeout: float) -> List[dict]:
+    limits = httpx.Limits(max_connections=max(concurrencies), max_keepalive_connections=max(concurrencies))
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        levels = []
+        for concurrency in concurrencies:
+            level = await run_level(client, url, queries, concurrency, duration, warmup, vary)
+            print(f"  {concurrency:>5} clients  {level['rps']:>8.1f} req/s  p50 {level['p50_ms']:>8.0f} ms  "
+                  f"p99 {level['p99_ms']:>8.0f} ms  errors {level['error_rate']:.1%}")
+            levels.append(level)
+        return levels
+
+
+def _wait_healthy(url: str, process: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(map(str, process.args))} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} not healthy after {timeout:.0f}s")
+
+
+@contextmanager
+def spawn_stack(api_port: int, mock_port: int, mock_args: List[str], startup_timeout: float):
+    """Run the mock HF endpoint and the API as subprocesses for the duration of the block."""
+    env = {
+        **os.environ,
+        'HF_API_URL': f"http://127.0.0.1:{mock_port}/models/{{model}}",
+        'LLM_BACKEND': 'huggingface',
+        'API_PORT': str(api_port),
+        # Measure the pipeline itself and keep load test answers out of the real cache
+        'ANSWER_CACHE_ENABLED': 'false',
+        'COALESCE_REQUESTS': 'false',
+    }
+    processes = []
+    try:
+        processes.append(subprocess.Popen(
+            [sys.executable, str(ROOT / "benchmarks" / "mock_hf.py"), "--port", str(mock_port), *mock_args]
+        ))
+        _wait_healthy(f"http://127.0.0.1:{mock_port}/health", processes[-1], startup_timeout)
+        processes.append(subprocess.Popen(
+            [sys.executable, str(ROOT / "src" / "app_api.py")], env=env, stdout=subprocess.DEVNULL
+        ))
+        _wait_healthy(f"http://127.0.0.1:{api_port}/health", processes[-1], startup_timeout)
+        yield f"http://127.0.0.1:{api_port}"
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000", help="API base URL (ignored with --spawn)")
+    parser.add_argument("--queries", type=Path, help="Query log: text lines or JSONL with a 'query' field")
+    parser.add_argument("--repeat", action="store_true", help="Send queries unchanged (caches may serve repeats)")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="Comma-separated client counts")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds before each level")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--knee", type=float, default=0.1, help="Minimum throughput gain per level")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Error rate that counts as saturated")
+    parser.add_argument("--slo-p99-ms", type=float, help="p99 latency that counts as saturated")
+    parser.add_argument("--spawn", action="store_true", help="Start the mock HF endpoint and the API")
+    parser.add_argument("--api-port", type=int, default=8765)
+    parser.add_argument("--mock-port", type=int, default=8766)
+    parser.add_argument("--mock-latency-ms", type=float, default=800.0)
+    parser.add_argument("--mock-max-concurrent", type=int, default=0, help="Mock 429s above this many in flight")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--json", type=Path, help="Also write results to this JSON file")
+    args = parser.parse_args()
+    
+    queries = load_queries(args.queries)
+    concurrencies = [int(c) for c in args.concurrency.split(",")]
+    
+    def run(base_url: str) -> List[dict]:
+        print(f"\n🚦 {len(queries)} queries against {base_url}/chat, "
+              f"{args.duration:.0f}s per level (+{args.warmup:.0f}s warmup)\n")
+        return asyncio.run(sweep(f"{base_url}/chat", queries, concurrencies, args.duration,
+                                 args.warmup, not args.repeat, args.timeout))
+    
+    if args.spawn:
+        mock_args = ["--latency-ms", str(args.mock_latency_ms), "--max-concurrent", str(args.mock_max_concurrent)]
+        with spawn_stack(args.api_port, args.mock_port, mock_args, args.startup_timeout) as base_url:
+            levels = run(base_url)
+    else:
+        levels = run(args.url.rstrip("/"))
+    
+    saturation = find_saturation(levels, args.knee, args.max_error_rate, args.slo_p99_ms)
+    best = max(levels, key=lambda level: level['rps'])
+    print(f"\nPeak throughput: {best['rps']:.1f} req/s at {best['concurrency']} clients")
+    if saturation:
+        print(f"Saturation: {saturation['concurrency']} clients ({saturation['reason']})")
+    else:
+        print("Saturation: not reached, extend --concurrency")
+    print()
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'levels': levels, 'saturation': saturation, 'args': {
+                'queries': len(queries), 'duration': args.duration, 'vary': not args.repeat,
+                'spawn': args.spawn, 'mock_latency_ms': args.mock_latency_ms if args.spawn else None,
+            }}, f, indent=2)
+        print(f"✓ Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
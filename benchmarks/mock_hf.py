@@ -0,0 +1,107 @@
+"""Mock Hugging Face Inference API for load tests.
+
+Answers text-generation requests (plain and streamed) after a configurable
+latency, optionally failing a share of them with 503 "model loading" or
+rejecting requests above a concurrency limit with 429, like the hosted API
+under load. Point the chatbot at it with
+HF_API_URL=http://127.0.0.1:8081/models/{model}.
+
+    python benchmarks/mock_hf.py --port 8081 --latency-ms 800 --jitter-ms 200
+"""
+
+import argparse
+import asyncio
+import json
+import random
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class MockConfig:
+    """Behaviour of the mock endpoint."""
+    latency_ms: float = 800.0
+    jitter_ms: float = 200.0
+    tokens: int = 40
+    error_rate: float = 0.0
+    max_concurrent: int = 0  # 0 = unlimited
+
+
+config = MockConfig()
+app = FastAPI(title="Mock Hugging Face Inference API")
+_in_flight = 0
+
+
+def _answer(prompt: str) -> str:
+    question = prompt.rsplit("USER QUESTION:", 1)[-1].split("\n", 1)[0].strip()
+    words = f"According to [Source 1], here is general information about: {question}".split()
+    words += ["(mock)"] * max(0, config.tokens - len(words))
+    return " ".join(words[:max(config.tokens, 1)])
+
+
+def _latency() -> float:
+    return max(0.0, random.gauss(config.latency_ms, config.jitter_ms)) / 1000
+
+
+@app.post("/models/{model:path}")
+async def generate(model: str, request: Request):
+    global _in_flight
+    if config.max_concurrent and _in_flight >= config.max_concurrent:
+        return JSONResponse(status_code=429, content={"error": "Rate limit reached"}, headers={"Retry-After": "1"})
+    if random.random() < config.error_rate:
+        return JSONResponse(status_code=503, content={"error": f"Model {model} is currently loading", "estimated_time": 1.0})
+    
+    body = await request.json()
+    answer = _answer(body.get('inputs', ''))
+    _in_flight += 1
+    if not body.get('stream'):
+        try:
+            await asyncio.sleep(_latency())
+        finally:
+            _in_flight -= 1
+        return [{"generated_text": answer}]
+    
+    async def events():
+        global _in_flight
+        try:
+            pieces = answer.split(" ")
+            delay = _latency() / len(pieces)
+            for i, word in enumerate(pieces):
+                await asyncio.sleep(delay)
+                token = {"text": word if i == 0 else " " + word, "special": False}
+                yield f"data:{json.dumps({'token': token})}\n\n"
+        finally:
+            _in_flight -= 1
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "in_flight": _in_flight}
+
+
+def main():
+    """Run the mock endpoint."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms, help="Mean generation time")
+    parser.add_argument("--jitter-ms", type=float, default=config.jitter_ms, help="Standard deviation of the generation time")
+    parser.add_argument("--tokens", type=int, default=config.tokens, help="Words per answer")
+    parser.add_argument("--error-rate", type=float, default=config.error_rate, help="Share of requests failing with 503")
+    parser.add_argument("--max-concurrent", type=int, default=config.max_concurrent, help="429 above this many in flight (0 = off)")
+    args = parser.parse_args()
+    
+    config.latency_ms, config.jitter_ms, config.tokens = args.latency_ms, args.jitter_ms, args.tokens
+    config.error_rate, config.max_concurrent = args.error_rate, args.max_concurrent
+    print(f"🧪 Mock HF API on http://{args.host}:{args.port}/models/{{model}} "
+          f"({args.latency_ms:.0f}±{args.jitter_ms:.0f} ms)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
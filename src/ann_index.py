@@ -0,0 +1,83 @@
+"""Approximate nearest neighbour index construction and search parameters.
+
+Index specs are FAISS index_factory strings, for example:
+
+    Flat            exact search (the default)
+    HNSW32          graph index, 32 links per node; tune efSearch
+    IVF1024,PQ32    inverted file with 1024 lists and 32-byte product codes; tune nprobe
+    IVF1024,SQ8     inverted file with 8-bit scalar-quantized vectors
+    SQ8             8-bit scalar quantization, exact scan
+"""
+
+from typing import Optional
+
+import faiss
+import numpy as np
+
+
+# Training points FAISS wants per IVF list / PQ centroid before it warns
+TRAINING_POINTS_PER_CENTROID = 39
+
+
+def normalize_spec(spec: Optional[str]) -> str:
+    """Canonical spelling of an index spec ("" and None mean Flat)."""
+    spec = (spec or "Flat").replace(" ", "")
+    return "Flat" if spec.lower() == "flat" else spec
+
+
+def is_flat(spec: Optional[str]) -> bool:
+    return normalize_spec(spec) == "Flat"
+
+
+def min_training_points(index) -> int:
+    """Vectors needed to train an index without FAISS degrading it."""
+    needed = 0
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        needed = max(needed, ivf.nlist * TRAINING_POINTS_PER_CENTROID)
+        if hasattr(ivf, 'pq'):
+            needed = max(needed, ivf.pq.ksub * TRAINING_POINTS_PER_CENTROID)
+    pq = getattr(faiss.downcast_index(index), 'pq', None)
+    if pq is not None:
+        needed = max(needed, pq.ksub * TRAINING_POINTS_PER_CENTROID)
+    return needed
+
+
+def build_index(spec: str, vectors: np.ndarray):
+    """Build and fill an index from a float32 vector matrix.
+    
+    Returns None when the corpus is too small to train the requested index,
+    in which case callers should keep using exact search.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], normalize_spec(spec), faiss.METRIC_L2)
+    if not index.is_trained:
+        if len(vectors) < min_training_points(index):
+            return None
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def set_search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Apply search-time parameters that the index supports; others are ignored."""
+    if not isinstance(index, faiss.Index):
+        return
+    ivf = _extract_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    hnsw = getattr(faiss.downcast_index(index), 'hnsw', None)
+    if hnsw is not None and ef_search:
+        hnsw.efSearch = ef_search
+
+
+def index_memory_bytes(index) -> int:
+    """Serialized size of an index, a close proxy for its in-memory footprint."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def _extract_ivf(index):
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
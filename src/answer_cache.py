@@ -0,0 +1,201 @@
+"""Semantic answer cache for the RAG pipeline."""
+
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+
+CACHE_VERSION = 1
+
+
+@dataclass
+class CacheEntry:
+    """One cached answer."""
+    vector: np.ndarray
+    chunk_ids: Tuple[str, ...]
+    answer: str
+    created_at: float
+
+
+class SemanticAnswerCache:
+    """Cache of LLM answers keyed by query embedding and retrieved chunk set.
+    
+    A lookup hits when a stored entry retrieved exactly the same set of chunks
+    and its query embedding has cosine similarity >= threshold with the new
+    one. Entries expire after ttl seconds and the least recently used entry is
+    evicted at capacity. The cache is persisted to a JSON file.
+    """
+    
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        threshold: float = 0.95,
+        ttl: float = 86400,
+        max_size: int = 1000,
+        namespace: str = "",
+        persist_interval: float = 30.0
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self.namespace = namespace
+        self.persist_interval = persist_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._by_chunks: Dict[frozenset, List[int]] = {}
+        self._next_key = 0
+        self._dirty = False
+        self._last_saved = time.monotonic()
+        self._lock = threading.Lock()
+        
+        if path is not None:
+            self._load()
+    
+    def lookup(self, vector, chunk_ids: List[str]) -> Optional[Tuple[str, List[str]]]:
+        """Return (answer, cached chunk order) for a matching entry, or None."""
+        query = _unit(vector)
+        now = time.time()
+        
+        with self._lock:
+            best_key, best_score = None, self.threshold
+            for key in list(self._by_chunks.get(frozenset(chunk_ids), ())):
+                entry = self._entries[key]
+                if now - entry.created_at > self.ttl:
+                    self._remove(key)
+                    self.expired += 1
+                    continue
+                score = float(np.dot(entry.vector, query))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            
+            if best_key is None:
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            entry = self._entries[best_key]
+            return entry.answer, list(entry.chunk_ids)
+    
+    def store(self, vector, chunk_ids: List[str], answer: str):
+        """Cache an answer for a query embedding and its retrieved chunks."""
+        with self._lock:
+            self._add(CacheEntry(_unit(vector), tuple(chunk_ids), answer, time.time()))
+            self._dirty = True
+            due = time.monotonic() - self._last_saved >= self.persist_interval
+        
+        if due:
+            self.save()
+    
+    def save(self):
+        """Write the cache to disk if it changed since the last save."""
+        if self.path is None:
+            return
+        
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            data = {
+                'version': CACHE_VERSION,
+                'namespace': self.namespace,
+                'entries': [
+                    {
+                        'vector': base64.b64encode(entry.vector.tobytes()).decode('ascii'),
+                        'chunk_ids': list(entry.chunk_ids),
+                        'answer': entry.answer,
+                        'created_at': entry.created_at,
+                    }
+                    for entry in self._entries.values()
+                    if now - entry.created_at <= self.ttl
+                ],
+            }
+            self._dirty = False
+            self._last_saved = time.monotonic()
+        
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f"{self.path.suffix}.{os.getpid()}.tmp")  # Workers may save concurrently
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        tmp_path.replace(self.path)
+    
+    def clear(self):
+        """Drop all entries and reset counters."""
+        with self._lock:
+            self._entries.clear()
+            self._by_chunks.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expired = 0
+            self._dirty = True
+    
+    def stats(self) -> Dict[str, Any]:
+        """Cache size, hit/miss counters and entries dropped at capacity or after the TTL."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expired': self.expired,
+            }
+    
+    def _add(self, entry: CacheEntry):
+        key = self._next_key
+        self._next_key += 1
+        self._entries[key] = entry
+        self._by_chunks.setdefault(frozenset(entry.chunk_ids), []).append(key)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+    
+    def _remove(self, key: int):
+        entry = self._entries.pop(key)
+        chunk_set = frozenset(entry.chunk_ids)
+        keys = self._by_chunks[chunk_set]
+        keys.remove(key)
+        if not keys:
+            del self._by_chunks[chunk_set]
+    
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️  Ignoring unreadable answer cache {self.path}: {e}")
+            return
+        if data.get('version') != CACHE_VERSION or data.get('namespace') != self.namespace:
+            return
+        
+        now = time.time()
+        for item in data.get('entries', []):
+            if now - item['created_at'] > self.ttl:
+                continue
+            vector = np.frombuffer(base64.b64decode(item['vector']), dtype=np.float32).copy()
+            self._add(CacheEntry(vector, tuple(item['chunk_ids']), item['answer'], item['created_at']))
+
+
+def _unit(vector) -> np.ndarray:
+    """Return vector as a unit-length float32 array."""
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
@@ -1,13 +1,22 @@
 """FastAPI application for Medical RAG Chatbot."""
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
+import json
+import os
+import time
 import uvicorn
 
-from rag import RAGSystem
-from config import settings
+from config import settings, print_model_info
+from metrics import metrics
+from startup import BackgroundInitializer, startup_timer
+
+if TYPE_CHECKING:
+    from rag import RAGSystem
+    from retriever import Retriever
 
 
 # Request/Response models
@@ -36,6 +45,29 @@ class ChatResponse(BaseModel):
     disclaimer: Optional[str] = None
 
 
+class BatchChatRequest(BaseModel):
+    """Batch chat request model."""
+    queries: List[str] = Field(..., description="Medical questions", min_length=1, max_length=settings.batch_max_queries)
+    top_k: Optional[int] = Field(None, description="Number of sources to retrieve", ge=1, le=10)
+    include_disclaimer: bool = Field(True, description="Include medical disclaimer in responses")
+    concurrency: Optional[int] = Field(None, description="Maximum concurrent LLM calls", ge=1, le=64)
+
+
+class BatchChatItem(BaseModel):
+    """One answer in a batch response."""
+    query: str
+    answer: Optional[str] = None
+    sources: List[Source] = []
+    warning: Optional[str] = None
+    disclaimer: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchChatResponse(BaseModel):
+    """Batch chat response model."""
+    results: List[BatchChatItem]
+
+
 class HealthResponse(BaseModel):
     """Health check response."""
     status: str
@@ -60,17 +92,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    """Record end-to-end latency per route (streams: until the response starts)."""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.observe(
+        "http_request_seconds",
+        time.perf_counter() - start,
+        route=getattr(route, "path", "unmatched")
+    )
+    return response
+
+
 # Initialize RAG system
-rag_system: Optional[RAGSystem] = None
+rag_system: Optional["RAGSystem"] = None
+
+# Read-only retriever built once by the prefork parent and inherited by its workers
+shared_retriever: Optional["Retriever"] = None
+
+
+def _create_rag_system() -> "RAGSystem":
+    """Import and build the RAG system (on a background thread in lazy mode)."""
+    global rag_system
+    
+    # Deferred so the server can bind before langchain/FAISS/torch load
+    with startup_timer.phase("import RAG modules"):
+        from rag import RAGSystem
+    
+    rag_system = RAGSystem(retriever=shared_retriever)
+    startup_timer.mark_ready()
+    startup_timer.print_report()
+    return rag_system
+
+
+rag_initializer = BackgroundInitializer(_create_rag_system, name="RAG system")
+
+
+def _not_ready_error() -> HTTPException:
+    """503 error describing why the RAG system is not available."""
+    if rag_initializer.state in ('idle', 'warming'):
+        return HTTPException(status_code=503, detail="RAG system is warming up. Please retry shortly.")
+    return HTTPException(
+        status_code=503,
+        detail=f"RAG system not initialized. Please run ingestion first. Error: {rag_initializer.error}"
+    )
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize RAG system on startup."""
-    global rag_system
+    """Initialize RAG system on startup (in the background in lazy mode)."""
+    print("\n🚀 Starting Medical RAG Chatbot API...")
+    if settings.lazy_init:
+        rag_initializer.start()
+        print("⏳ Loading embedding model and vector store in the background (see /health)\n")
+        return
+    
     try:
-        print("\n🚀 Starting Medical RAG Chatbot API...")
-        rag_system = RAGSystem()
+        rag_initializer.get()
         print("✓ RAG system initialized successfully\n")
     except Exception as e:
         print(f"\n❌ Failed to initialize RAG system: {e}")
@@ -78,6 +159,13 @@ async def startup_event():
         raise
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Persist the answer cache (prefork workers exit without running atexit hooks)."""
+    if rag_system is not None and rag_system.answer_cache is not None:
+        rag_system.answer_cache.save()
+
+
 @app.get("/", response_model=HealthResponse)
 async def root():
     """Root endpoint."""
@@ -91,7 +179,12 @@ async def root():
 async def health():
     """Health check endpoint."""
     if rag_system is None:
-        raise HTTPException(status_code=503, detail="RAG system not initialized")
+        if rag_initializer.state in ('idle', 'warming'):
+            return JSONResponse(
+                status_code=503,
+                content={"status": "warming", "message": "Loading embedding model and vector store"}
+            )
+        raise _not_ready_error()
     
     return {
         "status": "healthy",
@@ -103,14 +196,11 @@ async def health():
 async def chat(request: ChatRequest):
     """Main chat endpoint for medical questions."""
     if rag_system is None:
-        raise HTTPException(
-            status_code=503,
-            detail="RAG system not initialized. Please run ingestion first."
-        )
+        raise _not_ready_error()
     
     try:
-        # Process query
-        result = rag_system.query(
+        # Process query (retrieval on a thread pool, async LLM call)
+        result = await rag_system.aquery(
             question=request.query,
             top_k=request.top_k,
             include_disclaimer=request.include_disclaimer
@@ -131,23 +221,116 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
 
+@app.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(request: BatchChatRequest):
+    """Answer many questions with one batched retrieval and concurrent LLM calls."""
+    if rag_system is None:
+        raise _not_ready_error()
+    
+    try:
+        results = await rag_system.aquery_batch(
+            questions=request.queries,
+            top_k=request.top_k,
+            include_disclaimer=request.include_disclaimer,
+            concurrency=request.concurrency
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing batch: {str(e)}")
+    
+    return BatchChatResponse(results=[
+        BatchChatItem(
+            query=result['query'],
+            answer=result.get('answer'),
+            sources=[Source(**source) for source in result.get('sources', [])],
+            warning=result.get('warning'),
+            disclaimer=result.get('disclaimer'),
+            error=result.get('error')
+        )
+        for result in results
+    ])
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Stream the answer as Server-Sent Events.
+    
+    Emits a `start` event with sources and warning, one `token` event per
+    generated piece of text, and a final `done` event with the full answer.
+    """
+    if rag_system is None:
+        raise _not_ready_error()
+    
+    async def event_stream():
+        try:
+            async for event in rag_system.astream_query(
+                question=request.query,
+                top_k=request.top_k,
+                include_disclaimer=request.include_disclaimer
+            ):
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            error = {'type': 'error', 'detail': f"Error processing query: {str(e)}"}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/stats")
 async def stats():
     """Get system statistics."""
     if rag_system is None:
-        raise HTTPException(status_code=503, detail="RAG system not initialized")
+        raise _not_ready_error()
     
+    llm_stats = rag_system.llm.stats() if hasattr(rag_system.llm, "stats") else {}
     return {
-        "model": settings.llm_model,
+        "model": llm_stats.get("model", settings.hf_model),
         "embedding_model": settings.embedding_model,
         "chunk_size": settings.chunk_size,
         "top_k": settings.top_k,
-        "vector_store": str(settings.vector_store_dir)
+        "vector_store": str(settings.vector_store_dir),
+        "worker_pid": os.getpid(),
+        "startup": startup_timer.report(),
+        "latency": metrics.summary(),
+        "http_latency": metrics.summary("http_request_seconds", label="route"),
+        "llm": llm_stats,
+        "query_cache": rag_system.retriever.cache_stats(),
+        "answer_cache": rag_system.answer_cache.stats() if rag_system.answer_cache else {},
+        "embed_batching": rag_system.retriever.batch_stats(),
+        "rerank": rag_system.retriever.rerank_stats(),
+        "coalescing": rag_system.single_flight.stats() if rag_system.single_flight else {}
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Latency histograms and counters in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _preload_retriever():
+    """Build the shared retriever in the prefork parent (workers fall back to their own on failure)."""
+    global shared_retriever
+    try:
+        with startup_timer.phase("import RAG modules"):
+            from retriever import Retriever
+        shared_retriever = Retriever()
+    except Exception as e:
+        print(f"\n❌ Failed to preload the retriever: {e}")
+
+
+def _serve_worker(sock):
+    """Run one prefork worker on the inherited listening socket."""
+    server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+    server.run(sockets=[sock])
+
+
 def main():
     """Run the FastAPI server."""
+    print_model_info()
     print("\n" + "="*60)
     print("🏥 Medical RAG Chatbot - FastAPI Server")
     print("="*60)
@@ -155,6 +338,21 @@ def main():
     print(f"API docs: http://{settings.api_host}:{settings.api_port}/docs")
     print("="*60 + "\n")
     
+    if settings.api_workers > 1:
+        from prefork import PreforkServer, fork_supported
+        
+        if fork_supported():
+            PreforkServer(
+                _serve_worker,
+                host=settings.api_host,
+                port=settings.api_port,
+                workers=settings.api_workers,
+                preload=_preload_retriever,
+                threads_per_worker=settings.worker_threads
+            ).run()
+            return
+        print("⚠️  API_WORKERS needs os.fork (not available on this platform), using one worker")
+    
     uvicorn.run(
         app,
         host=settings.api_host,
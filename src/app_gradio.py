@@ -1,7 +1,7 @@
 """Gradio web UI for Medical RAG Chatbot."""
 
 import gradio as gr
-from typing import List, Tuple
+from typing import Iterator, List, Optional, Tuple
 import traceback
 import sys
 from pathlib import Path
@@ -9,19 +9,39 @@ from pathlib import Path
 # Add src to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
-from rag import RAGSystem
-from config import settings
+from config import EXAMPLE_QUESTIONS, settings, print_model_info
+from startup import BackgroundInitializer, startup_timer
 
 
-# Initialize RAG system
-print("🏥 Initializing Medical RAG System for Gradio...")
-try:
-    rag_system = RAGSystem()
+# Seconds a chat message waits for a warming system before giving up
+WARMUP_WAIT_SECONDS = 120
+
+
+def _create_rag_system():
+    """Import and build the RAG system (on a background thread in lazy mode)."""
+    print("🏥 Initializing Medical RAG System for Gradio...")
+    with startup_timer.phase("import RAG modules"):
+        from rag import RAGSystem
+    
+    try:
+        system = RAGSystem()
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        print("Please run 'python src/ingest.py' first to create the vector store.\n")
+        raise
+    
     print("✓ System ready!\n")
-except Exception as e:
-    print(f"\n❌ Error: {e}")
-    print("Please run 'python src/ingest.py' first to create the vector store.\n")
-    raise
+    startup_timer.mark_ready()
+    startup_timer.print_report()
+    return system
+
+
+rag_initializer = BackgroundInitializer(_create_rag_system, name="RAG system")
+
+
+def get_rag_system():
+    """Return the RAG system, waiting for it while it warms up."""
+    return rag_initializer.get(timeout=WARMUP_WAIT_SECONDS)
 
 
 def format_sources_html(sources: List[dict]) -> str:
@@ -56,18 +76,10 @@ def chat_fn(message: str, history: List[Tuple[str, str]]) -> Tuple[str, str]:
             return "", "Please enter a question."
         
         # Query RAG system
-        result = rag_system.query(message, include_disclaimer=True)
+        result = get_rag_system().query(message, include_disclaimer=True)
         
         # Format answer
-        answer = result['answer']
-        
-        # Add warning if present
-        if result.get('warning'):
-            answer = f"⚠️ {result['warning']}\n\n{answer}"
-        
-        # Add disclaimer
-        if result.get('disclaimer'):
-            answer = f"{answer}\n\n---\n\n{result['disclaimer']}"
+        answer = format_answer(result['answer'], result.get('warning'), result.get('disclaimer'))
         
         # Format sources separately
         sources_html = format_sources_html(result.get('sources', []))
@@ -79,6 +91,46 @@ def chat_fn(message: str, history: List[Tuple[str, str]]) -> Tuple[str, str]:
         return error_msg, ""
 
 
+def stream_chat_fn(message: str) -> Iterator[Tuple[str, str]]:
+    """Process chat message, yielding the partial response as tokens arrive."""
+    try:
+        if not message.strip():
+            yield "", "Please enter a question."
+            return
+        
+        if rag_initializer.state == 'warming':
+            yield "⏳ The medical knowledge base is still loading, your answer will start shortly...", ""
+        
+        answer, warning, sources_html = "", None, ""
+        for event in get_rag_system().stream_query(message, include_disclaimer=True):
+            if event['type'] == 'start':
+                warning = event.get('warning')
+                sources_html = format_sources_html(event.get('sources', []))
+                yield format_answer("", warning), sources_html
+            elif event['type'] == 'token':
+                answer += event['text']
+                yield format_answer(answer, warning), sources_html
+            elif event['type'] == 'done':
+                yield format_answer(event['answer'], warning, event.get('disclaimer')), sources_html
+    
+    except Exception as e:
+        error_msg = f"❌ Error: {str(e)}\n\n{traceback.format_exc()}"
+        yield error_msg, ""
+
+
+def format_answer(answer: str, warning: Optional[str] = None, disclaimer: Optional[str] = None) -> str:
+    """Decorate an answer with its warning and disclaimer."""
+    # Add warning if present
+    if warning:
+        answer = f"⚠️ {warning}\n\n{answer}"
+    
+    # Add disclaimer
+    if disclaimer:
+        answer = f"{answer}\n\n---\n\n{disclaimer}"
+    
+    return answer
+
+
 # Custom CSS
 custom_css = """
 #chatbot {
@@ -98,13 +150,7 @@ custom_css = """
 """
 
 # Example queries
-examples = [
-    "What are the symptoms of diabetes?",
-    "How is hypertension diagnosed and treated?",
-    "What's the difference between a cold and the flu?",
-    "What are the risk factors for heart disease?",
-    "How can I prevent type 2 diabetes?",
-]
+examples = EXAMPLE_QUESTIONS
 
 # Build Gradio interface
 with gr.Blocks(css=custom_css, title="Medical RAG Chatbot", theme=gr.themes.Soft()) as demo:
@@ -172,7 +218,7 @@ with gr.Blocks(css=custom_css, title="Medical RAG Chatbot", theme=gr.themes.Soft
         - **Embeddings**: {embedding_model}
         - **Knowledge Base**: Medical documents
         """.format(
-            model=settings.llm_model,
+            model=settings.hf_model if settings.llm_backend == "huggingface" else settings.llm_model,
             embedding_model=settings.embedding_model
         )
     )
@@ -182,11 +228,11 @@ with gr.Blocks(css=custom_css, title="Medical RAG Chatbot", theme=gr.themes.Soft
         return "", history + [[user_message, None]]
     
     def bot_msg(history):
-        """Generate bot response."""
+        """Stream bot response into the last chat turn."""
         user_message = history[-1][0]
-        bot_response, sources_html = chat_fn(user_message, history[:-1])
-        history[-1][1] = bot_response
-        return history, sources_html
+        for bot_response, sources_html in stream_chat_fn(user_message):
+            history[-1][1] = bot_response
+            yield history, sources_html
     
     # Event handlers
     msg.submit(user_msg, [msg, chatbot], [msg, chatbot], queue=False).then(
@@ -204,6 +250,14 @@ def main():
     """Launch Gradio app."""
     import os
     
+    print_model_info()
+    
+    # Lazy mode binds the port first and loads models in the background
+    if settings.lazy_init:
+        rag_initializer.start()
+    else:
+        rag_initializer.get()
+    
     print("\n" + "="*60)
     print("🏥 Medical RAG Chatbot - Gradio Web UI")
     print("="*60)
@@ -0,0 +1,175 @@
+"""BM25 sparse index over chunk text, and reciprocal rank fusion.
+
+Postings are stored in CSR form as NumPy arrays (memory-mapped at query
+time): the postings of term t are docs[offsets[t]:offsets[t + 1]] with term
+frequencies tfs[...] in the same range. A query touches only the postings of
+its terms and is scored with array operations.
+
+    bm25_vocab.json                   terms, in term id order
+    bm25_offsets.npy                  int64, one entry per term + 1
+    bm25_docs.npy / bm25_tfs.npy      int32 chunk positions / uint16 term frequencies
+    bm25_doc_lens.npy                 int32 tokens per chunk
+"""
+
+import json
+import re
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+
+VOCAB_FILE = "bm25_vocab.json"
+OFFSETS_FILE = "bm25_offsets.npy"
+DOCS_FILE = "bm25_docs.npy"
+TFS_FILE = "bm25_tfs.npy"
+DOC_LENS_FILE = "bm25_doc_lens.npy"
+
+# Keeps drug names, ICD codes (E11.9), lab values (7.5) and hyphenated terms whole
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+_TF_MAX = np.iinfo(np.uint16).max
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens for BM25."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over chunk positions."""
+    
+    def __init__(
+        self,
+        vocab: Dict[str, int],
+        offsets: np.ndarray,
+        docs: np.ndarray,
+        tfs: np.ndarray,
+        doc_lens: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75
+    ):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(doc_lens)
+        self.avg_doc_len = float(np.mean(doc_lens)) if self.n_docs else 0.0
+        self._doc_norm = None
+    
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> "BM25Index":
+        """Build the index from chunk texts in position order."""
+        vocab: Dict[str, int] = {}
+        terms, docs, tfs, doc_lens = array('i'), array('i'), array('H'), array('i')
+        for position, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                terms.append(vocab.setdefault(term, len(vocab)))
+                docs.append(position)
+                tfs.append(min(tf, _TF_MAX))
+        
+        terms = np.frombuffer(terms, dtype=np.int32)
+        # Stable sort keeps each term's postings in position order
+        order = np.argsort(terms, kind='stable')
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocab)), out=offsets[1:])
+        return cls(
+            vocab,
+            offsets,
+            np.frombuffer(docs, dtype=np.int32)[order],
+            np.frombuffer(tfs, dtype=np.uint16)[order],
+            np.frombuffer(doc_lens, dtype=np.int32).copy(),
+        )
+    
+    def save(self, path: Path):
+        path = Path(path)
+        with open(path / VOCAB_FILE, 'w', encoding='utf-8') as f:
+            json.dump(list(self.vocab), f, ensure_ascii=False)
+        for name, values in [
+            (OFFSETS_FILE, self.offsets), (DOCS_FILE, self.docs),
+            (TFS_FILE, self.tfs), (DOC_LENS_FILE, self.doc_lens),
+        ]:
+            np.save(path / name, values)
+    
+    @classmethod
+    def load(cls, path: Path, use_mmap: bool = True) -> "BM25Index":
+        path = Path(path)
+        mmap_mode = 'r' if use_mmap else None
+        with open(path / VOCAB_FILE, 'r', encoding='utf-8') as f:
+            vocab = {term: i for i, term in enumerate(json.load(f))}
+        return cls(
+            vocab,
+            np.load(path / OFFSETS_FILE, mmap_mode=mmap_mode),
+            np.load(path / DOCS_FILE, mmap_mode=mmap_mode),
+            np.load(path / TFS_FILE, mmap_mode=mmap_mode),
+            np.load(path / DOC_LENS_FILE, mmap_mode=mmap_mode),
+        )
+    
+    @staticmethod
+    def exists(path: Path) -> bool:
+        path = Path(path)
+        return all((path / name).exists() for name in (VOCAB_FILE, OFFSETS_FILE, DOCS_FILE, TFS_FILE, DOC_LENS_FILE))
+    
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (scores, positions) by BM25, best first; only chunks sharing a term are returned."""
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids or k <= 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        
+        postings = []
+        for t in term_ids:
+            start, stop = self.offsets[t], self.offsets[t + 1]
+            postings.append((self.docs[start:stop], self.tfs[start:stop].astype(np.float32)))
+        
+        n_postings = sum(len(docs) for docs, _ in postings)
+        if n_postings * 8 > self.n_docs:
+            # Common terms: accumulate into a dense score array (no sort, no search)
+            candidates = None
+            if self._doc_norm is None:
+                self._doc_norm = self._norm(self.doc_lens)
+            norm = self._doc_norm
+            scores = np.zeros(self.n_docs, dtype=np.float32)
+        else:
+            candidates = np.unique(np.concatenate([docs for docs, _ in postings]))
+            norm = self._norm(self.doc_lens[candidates])
+            scores = np.zeros(len(candidates), dtype=np.float32)
+        
+        for docs, tf in postings:
+            df = len(docs)
+            idf = np.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            # A term lists each chunk once, so fancy-index += does not drop updates;
+            # postings and candidates are both sorted by position
+            rows = docs if candidates is None else np.searchsorted(candidates, docs)
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + norm[rows])
+        
+        if candidates is None:
+            candidates = np.flatnonzero(scores)
+            scores = scores[candidates]
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return scores[top], candidates[top].astype(np.int64)
+    
+    def _norm(self, doc_lens: np.ndarray) -> np.ndarray:
+        """Length normalization term k1 * (1 - b + b * |d| / avgdl)."""
+        return (self.k1 * (1 - self.b + self.b * doc_lens / self.avg_doc_len)).astype(np.float32)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int, rrf_k: int = 60) -> List[int]:
+    """Fuse ranked position lists: score = sum of 1 / (rrf_k + rank), best first."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking, start=1):
+            if position == -1:
+                continue
+            scores[int(position)] = scores.get(int(position), 0.0) + 1.0 / (rrf_k + rank)
+    # Ties keep the order in which positions were first seen
+    return sorted(scores, key=scores.get, reverse=True)[:k]
@@ -0,0 +1,270 @@
+"""Compact, memory-mapped on-disk storage for the vector store.
+
+Chunks are stored column by column instead of as a pickled docstore, and
+every file is opened with mmap, so opening is O(1) in corpus size and worker
+processes share pages through the OS page cache. Documents are materialized
+only for the positions a search returns.
+
+    chunks.bin / chunks.offsets.npy   UTF-8 chunk text, concatenated
+    ids.bin / ids.offsets.npy         chunk ids, concatenated
+    meta.npy                          typed metadata columns, one row per chunk
+    strings.json                      interned strings referenced by meta.npy
+    extra.bin / extra.offsets.npy     JSON for any other metadata keys (CSV/JSON fields)
+    vectors.npy                       exact float32 vectors, searched in place for Flat
+    index.faiss / index.json          ANN index built from vectors.npy, and its spec
+"""
+
+import json
+import mmap
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+
+from ann_index import build_index, is_flat, normalize_spec
+
+
+TEXT_FILE = "chunks.bin"
+IDS_FILE = "ids.bin"
+META_FILE = "meta.npy"
+STRINGS_FILE = "strings.json"
+EXTRA_FILE = "extra.bin"
+VECTORS_FILE = "vectors.npy"
+INDEX_FILE = "index.faiss"
+INDEX_META_FILE = "index.json"
+
+# Metadata keys stored as typed columns; -1 marks a missing value
+STRING_COLUMNS = ('source', 'file_type', 'category')
+INT_COLUMNS = ('page', 'row', 'index')
+META_DTYPE = np.dtype([(name, '<i4') for name in STRING_COLUMNS + INT_COLUMNS])
+MISSING = -1
+_INT32_MAX = np.iinfo(np.int32).max
+
+
+def _offsets_path(path: Path) -> Path:
+    return path.with_name(path.stem + ".offsets.npy")
+
+
+def _atomic_save_npy(path: Path, array: np.ndarray):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    tmp_path.replace(path)
+
+
+def _load_npy(path: Path, use_mmap: bool) -> np.ndarray:
+    return np.load(path, mmap_mode='r' if use_mmap else None)
+
+
+def _json_default(value):
+    # Loader metadata can contain numpy scalars (e.g. pandas row values)
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Metadata value of type {type(value).__name__} is not JSON serializable")
+
+
+class OffsetFile:
+    """Variable-length records in one file, located by an int64 offsets array."""
+    
+    def __init__(self, path: Path, use_mmap: bool = True):
+        self.path = path
+        self.offsets = _load_npy(_offsets_path(path), use_mmap)
+        with open(path, 'rb') as f:
+            if self.offsets[-1] == 0:
+                # mmap cannot map an empty file
+                self._data = b""
+            elif use_mmap:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._data = f.read()
+    
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, i: int) -> bytes:
+        return self._data[int(self.offsets[i]):int(self.offsets[i + 1])]
+    
+    @staticmethod
+    def write(path: Path, records: Iterable[bytes]):
+        """Write records and their offsets (files are replaced atomically)."""
+        offsets = [0]
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            for record in records:
+                f.write(record)
+                offsets.append(offsets[-1] + len(record))
+        _atomic_save_npy(_offsets_path(path), np.asarray(offsets, dtype=np.int64))
+        tmp_path.replace(path)
+
+
+class FlatVectorIndex:
+    """Exact L2 search over a (memory-mapped) vector matrix.
+    
+    Gives the same results as faiss.IndexFlatL2, but searches the matrix in
+    place instead of copying it into the index, which FAISS does even when
+    asked to mmap a flat index.
+    """
+    
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+        self.ntotal, self.d = vectors.shape
+    
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        if self.ntotal == 0:
+            shape = (len(queries), k)
+            return np.full(shape, np.inf, dtype=np.float32), np.full(shape, -1, dtype=np.int64)
+        return faiss.knn(queries, self.vectors, k)
+
+
+class ChunkStore:
+    """Chunk ids, text and metadata by index position, read on demand."""
+    
+    def __init__(self, path: Path, use_mmap: bool = True):
+        self.path = Path(path)
+        self.texts = OffsetFile(self.path / TEXT_FILE, use_mmap)
+        self.ids = OffsetFile(self.path / IDS_FILE, use_mmap)
+        self.extra = OffsetFile(self.path / EXTRA_FILE, use_mmap)
+        self.meta = _load_npy(self.path / META_FILE, use_mmap)
+        with open(self.path / STRINGS_FILE, 'r', encoding='utf-8') as f:
+            self.strings: List[str] = json.load(f)
+        if not (len(self.texts) == len(self.ids) == len(self.extra) == len(self.meta)):
+            raise ValueError(f"Chunk store columns in {self.path} are out of sync")
+    
+    def __len__(self) -> int:
+        return len(self.texts)
+    
+    @staticmethod
+    def exists(path: Path) -> bool:
+        path = Path(path)
+        return all((path / name).exists() for name in (TEXT_FILE, IDS_FILE, META_FILE, STRINGS_FILE, EXTRA_FILE))
+    
+    def chunk_id(self, position: int) -> str:
+        return self.ids[position].decode('utf-8')
+    
+    def text(self, position: int) -> str:
+        return self.texts[position].decode('utf-8')
+    
+    def metadata(self, position: int) -> Dict[str, Any]:
+        row = self.meta[position]
+        metadata: Dict[str, Any] = {}
+        for name in STRING_COLUMNS:
+            if row[name] != MISSING:
+                metadata[name] = self.strings[row[name]]
+        for name in INT_COLUMNS:
+            if row[name] != MISSING:
+                metadata[name] = int(row[name])
+        extra = self.extra[position]
+        if extra:
+            metadata.update(json.loads(extra))
+        return metadata
+    
+    def lookup(self, position: int) -> Tuple[str, Document]:
+        """Chunk id and document at an index position."""
+        return self.chunk_id(position), Document(page_content=self.text(position), metadata=self.metadata(position))
+    
+    def documents(self) -> Iterable[Tuple[str, Document]]:
+        """All (id, document) pairs in position order."""
+        for position in range(len(self)):
+            yield self.lookup(position)
+    
+    @staticmethod
+    def write(path: Path, ids: List[str], documents: List[Document]):
+        """Write chunks in index position order."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        
+        strings: Dict[str, int] = {}
+        meta = np.full(len(documents), MISSING, dtype=META_DTYPE)
+        extras = []
+        for row, doc in zip(meta, documents):
+            extra = {}
+            for key, value in doc.metadata.items():
+                # Values of an unexpected type keep their exact type via the JSON column
+                if key in STRING_COLUMNS and isinstance(value, str):
+                    row[key] = strings.setdefault(value, len(strings))
+                elif key in INT_COLUMNS and isinstance(value, (int, np.integer)) \
+                        and not isinstance(value, bool) and 0 <= value <= _INT32_MAX:
+                    row[key] = value
+                else:
+                    extra[key] = value
+            extras.append(json.dumps(extra, ensure_ascii=False, default=_json_default).encode('utf-8') if extra else b"")
+        
+        OffsetFile.write(path / TEXT_FILE, (doc.page_content.encode('utf-8') for doc in documents))
+        OffsetFile.write(path / IDS_FILE, (doc_id.encode('utf-8') for doc_id in ids))
+        OffsetFile.write(path / EXTRA_FILE, extras)
+        _atomic_save_npy(path / META_FILE, meta)
+        with open(path / STRINGS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(list(strings), f, ensure_ascii=False)
+
+
+def save_index(path: Path, index, spec: Optional[str] = None) -> str:
+    """Save the exact vectors of a flat index and, unless spec is Flat, an ANN index built from them.
+    
+    The exact vectors are always kept so the store can be reloaded for
+    incremental ingest and re-indexed with another spec. Returns the spec
+    actually built, which is Flat when the corpus is too small to train.
+    """
+    path = Path(path)
+    spec = normalize_spec(spec)
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.empty((0, index.d), dtype=np.float32)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    _atomic_save_npy(path / VECTORS_FILE, vectors)
+    
+    ann = None if is_flat(spec) else build_index(spec, vectors)
+    index_path = path / INDEX_FILE
+    if ann is not None:
+        tmp_path = path / (INDEX_FILE + ".tmp")
+        faiss.write_index(ann, str(tmp_path))
+        tmp_path.replace(index_path)
+    elif index_path.exists():
+        index_path.unlink()
+    
+    built = spec if ann is not None else "Flat"
+    with open(path / INDEX_META_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'spec': spec, 'built': built, 'ntotal': int(index.ntotal), 'dim': int(index.d)}, f)
+    return built
+
+
+def saved_index_spec(path: Path) -> Optional[str]:
+    """The index spec requested when the store was saved, or None if unknown."""
+    try:
+        with open(Path(path) / INDEX_META_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f).get('spec')
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def open_index(path: Path, use_mmap: bool = True):
+    """Open the search index of a vector store directory for querying.
+    
+    ANN indexes are read with FAISS's mmap IO flag, falling back to a
+    regular read for types that do not support it. Flat stores are served
+    from the mmap'd vector matrix.
+    """
+    path = Path(path)
+    index_path = path / INDEX_FILE
+    if index_path.exists():
+        if use_mmap:
+            try:
+                return faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                pass
+        return faiss.read_index(str(index_path))
+    return FlatVectorIndex(_load_npy(path / VECTORS_FILE, use_mmap))
+
+
+def load_index(path: Path):
+    """Load the exact vectors of a vector store directory into a modifiable flat index."""
+    vectors = np.load(Path(path) / VECTORS_FILE)
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return index
+
+
+def has_store(path: Path) -> bool:
+    """True if the directory holds a vector store written by save_index and ChunkStore.write."""
+    path = Path(path)
+    return ChunkStore.exists(path) and (path / VECTORS_FILE).exists()
@@ -14,10 +14,16 @@ PROJECT_ROOT = Path(__file__).parent.parent
 # Data directories
 RAW_DATA_DIR = PROJECT_ROOT / "data" / "raw"
 VECTOR_STORE_DIR = PROJECT_ROOT / "data" / "vector_store"
+CACHE_DIR = PROJECT_ROOT / "data" / "cache"
 
-# Ensure directories exist
-RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
-VECTOR_STORE_DIR.mkdir(parents=True, exist_ok=True)
+# Example questions shown in the Gradio UI and replayed by the load tester
+EXAMPLE_QUESTIONS = [
+    "What are the symptoms of diabetes?",
+    "How is hypertension diagnosed and treated?",
+    "What's the difference between a cold and the flu?",
+    "What are the risk factors for heart disease?",
+    "How can I prevent type 2 diabetes?",
+]
 
 
 class Settings(BaseSettings):
@@ -29,33 +35,100 @@ class Settings(BaseSettings):
     # Hugging Face API (FREE - for production deployment on Render)
     huggingface_api_key: str = os.getenv("HUGGINGFACE_API_KEY", "")
     hf_model: str = os.getenv("HF_MODEL", "mistralai/Mistral-7B-Instruct-v0.2")
+    hf_api_url: str = os.getenv("HF_API_URL", "")  # Endpoint override, "{model}" is substituted
+    
+    # LLM transport - connection pool, retries, rate limit and circuit breaker
+    llm_max_connections: int = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "4"))
+    llm_backoff_base: float = 0.5  # Seconds; full jitter up to base * 2^attempt
+    llm_backoff_max: float = 20.0
+    llm_timeout: float = float(os.getenv("LLM_TIMEOUT", "60"))  # Total seconds per answer, retries included
+    llm_rate_limit: float = float(os.getenv("LLM_RATE_LIMIT", "0"))  # Requests per second per process (0 = off)
+    llm_breaker_failures: int = 5  # Consecutive failures that open the circuit
+    llm_breaker_reset: float = 30.0  # Seconds before a probe request is let through
     
     # Embeddings - Using multi-qa model optimized for medical Q&A
     embedding_model: str = os.getenv("EMBEDDING_MODEL", "sentence-transformers/multi-qa-MiniLM-L6-cos-v1")
     
-    # Legacy local models (for Ollama if needed)
+    # Local models - in-process CPU generation with continuous batching
     use_local_models: bool = os.getenv("USE_LOCAL_MODELS", "false").lower() == "true"
-    llm_model: str = os.getenv("LLM_MODEL", "llama3")
+    llm_model: str = os.getenv("LLM_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")  # Hugging Face Hub causal LM
+    local_max_batch_size: int = int(os.getenv("LOCAL_MAX_BATCH", "8"))  # Sequences decoded together
+    local_threads: int = int(os.getenv("LOCAL_THREADS", "0"))  # PyTorch CPU threads (0 = default)
+    
+    # LLM backend - "huggingface" (Inference API), "local" (llm_model on CPU) or "stub" (deterministic, offline)
+    llm_backend: str = os.getenv("LLM_BACKEND", "local" if use_local_models else "huggingface")
     
     # LLM settings - Optimized for accuracy
     temperature: float = 0.2  # Slightly higher for more natural responses
     max_tokens: int = 800  # More tokens for detailed medical explanations
+    context_token_budget: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2048"))  # Prompt tokens for retrieved chunks
+    context_dedup_threshold: float = 0.8  # Word 5-gram Jaccard above which a chunk counts as a duplicate
     
     # Chunking - Optimized for medical content
     chunk_size: int = 1500  # Larger chunks for better medical context
     chunk_overlap: int = 300  # More overlap to preserve medical relationships
     
+    # Ingestion - processes used for PDF text extraction (1 = sequential)
+    ingest_workers: int = int(os.getenv("INGEST_WORKERS", "1"))
+    # Streaming ingest memory ceiling in MB (0 = no limit)
+    ingest_memory_mb: int = int(os.getenv("INGEST_MEMORY_MB", "0"))
+    
     # Retrieval - More sources for comprehensive answers
     top_k: int = 7  # Retrieve more relevant documents
+    retrieval_workers: int = int(os.getenv("RETRIEVAL_WORKERS", "4"))  # Threads for retrieval in async requests
+    query_cache_size: int = int(os.getenv("QUERY_CACHE_SIZE", "1024"))  # Cached query embeddings (0 = off)
+    embed_batching: bool = os.getenv("EMBED_BATCHING", "true").lower() == "true"  # Encode concurrent queries together
+    embed_batch_size: int = int(os.getenv("EMBED_BATCH_SIZE", "32"))  # Most queries per forward pass
+    embed_batch_wait_ms: float = float(os.getenv("EMBED_BATCH_WAIT_MS", "2"))  # How long the first query waits for others
+    mmap_index: bool = os.getenv("MMAP_INDEX", "true").lower() == "true"  # Share index/chunk pages across workers
+    index_type: str = os.getenv("INDEX_TYPE", "Flat")  # FAISS spec: Flat, HNSW32, IVF1024,PQ32, IVF1024,SQ8, SQ8
+    ivf_nprobe: int = int(os.getenv("IVF_NPROBE", "16"))  # IVF lists probed per query (recall vs. latency)
+    hnsw_ef_search: int = int(os.getenv("HNSW_EF_SEARCH", "64"))  # HNSW candidate list size per query
+    retrieval_mode: str = os.getenv("RETRIEVAL_MODE", "dense")  # "dense" or "hybrid" (BM25 + dense, fused by RRF)
+    hybrid_candidates: int = int(os.getenv("HYBRID_CANDIDATES", "50"))  # Results taken from each ranker before fusion
+    rrf_k: int = 60  # Reciprocal rank fusion constant
+    
+    # Reranking - cross-encoder rescoring of a wider candidate set
+    rerank_enabled: bool = os.getenv("RERANK", "false").lower() == "true"
+    rerank_model: str = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    rerank_candidates: int = int(os.getenv("RERANK_CANDIDATES", "30"))  # Chunks scored per query
+    rerank_top_n: int = int(os.getenv("RERANK_TOP_N", "4"))  # Chunks kept when top_k is not given
+    rerank_budget_ms: float = float(os.getenv("RERANK_BUDGET_MS", "200"))  # Skip reranking above this estimate
+    rerank_max_concurrent: int = int(os.getenv("RERANK_MAX_CONCURRENT", "2"))  # Skip when this many are running
+    rerank_cache_size: int = int(os.getenv("RERANK_CACHE_SIZE", "20000"))  # Cached (query, chunk) scores
+    
+    # Batch queries - concurrent LLM calls per batch and maximum batch size
+    llm_concurrency: int = int(os.getenv("LLM_CONCURRENCY", "8"))
+    batch_max_queries: int = 1000
+    
+    # Safety - JSON file {category: [phrases]} added to the built-in emergency / personal advice lists
+    safety_phrases_path: str = os.getenv("SAFETY_PHRASES", "")
+    
+    # Metrics - per-stage latency histograms for /metrics and /stats
+    metrics_enabled: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    
+    # Request coalescing - concurrent identical questions share one computation
+    coalesce_requests: bool = os.getenv("COALESCE_REQUESTS", "true").lower() == "true"
+    
+    # Semantic answer cache - reuse answers for near-identical questions with the same sources
+    answer_cache_enabled: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    answer_cache_threshold: float = 0.95  # Minimum cosine similarity between query embeddings
+    answer_cache_ttl: int = 86400  # Seconds
+    answer_cache_size: int = 1000
     
     # Server
+    lazy_init: bool = os.getenv("LAZY_INIT", "true").lower() == "true"  # Bind first, load models in the background
     api_host: str = "0.0.0.0"
-    api_port: int = 8000
+    api_port: int = int(os.getenv("API_PORT", "8000"))
+    api_workers: int = int(os.getenv("API_WORKERS", "1"))  # >1: prefork workers sharing one preloaded retriever
+    worker_threads: int = int(os.getenv("WORKER_THREADS", "0"))  # Torch/FAISS threads per worker (0 = cores / workers)
     gradio_port: int = 7860
     
     # Paths
     raw_data_dir: Path = RAW_DATA_DIR
     vector_store_dir: Path = VECTOR_STORE_DIR
+    answer_cache_path: Path = CACHE_DIR / "answer_cache.json"
     
     # Medical safety
     medical_disclaimer: str = (
@@ -72,19 +145,29 @@ class Settings(BaseSettings):
 # Global settings instance
 settings = Settings()
 
-# Display model info
-if settings.use_huggingface:
-    print(f"\n✓ Using HUGGING FACE API (FREE):")
-    print(f"  - LLM: {settings.hf_model}")
-    print(f"  - Embeddings: {settings.embedding_model}")
-    if not settings.huggingface_api_key:
-        print("  ⚠️  No API key set - using free tier (rate limited)")
-        print("  Get free key at: https://huggingface.co/settings/tokens")
-    print("  Perfect for Render deployment!\n")
-elif settings.use_local_models:
-    print(f"\n✓ Using LOCAL models (Ollama):")
-    print(f"  - Embeddings: {settings.embedding_model}")
-    print(f"  - LLM: {settings.llm_model}")
-    print("  Models will be downloaded on first run (may take a few minutes)\n")
-else:
-    print("\n✓ Using API-based models\n")
+
+def ensure_directories():
+    """Create the data directories if they do not exist."""
+    settings.raw_data_dir.mkdir(parents=True, exist_ok=True)
+    settings.vector_store_dir.mkdir(parents=True, exist_ok=True)
+
+
+def print_model_info():
+    """Display model info."""
+    if settings.llm_backend == "stub":
+        print("\n✓ Using the STUB model (deterministic answers, offline)\n")
+    elif settings.llm_backend == "huggingface":
+        print(f"\n✓ Using HUGGING FACE API (FREE):")
+        print(f"  - LLM: {settings.hf_model}")
+        print(f"  - Embeddings: {settings.embedding_model}")
+        if not settings.huggingface_api_key:
+            print("  ⚠️  No API key set - using free tier (rate limited)")
+            print("  Get free key at: https://huggingface.co/settings/tokens")
+        print("  Perfect for Render deployment!\n")
+    elif settings.llm_backend == "local":
+        print(f"\n✓ Using LOCAL models (CPU):")
+        print(f"  - Embeddings: {settings.embedding_model}")
+        print(f"  - LLM: {settings.llm_model}")
+        print("  Models will be downloaded on first run (may take a few minutes)\n")
+    else:
+        print("\n✓ Using API-based models\n")
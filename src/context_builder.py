@@ -0,0 +1,233 @@
+"""Token-budgeted packing of retrieved chunks into the LLM prompt."""
+
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Set
+
+from langchain.schema import Document
+
+
+# Characters per token assumed when the model tokenizer cannot be loaded
+CHARS_PER_TOKEN = 4
+
+# Shortest shared boundary text treated as splitter overlap
+MIN_OVERLAP_CHARS = 32
+
+# Word n-gram size for near-duplicate detection
+SHINGLE_SIZE = 5
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class TokenCounter:
+    """Counts and truncates text in tokens of the target model.
+    
+    The tokenizer is loaded on first use; if it is unavailable (offline,
+    gated model) counts fall back to a characters-per-token estimate.
+    """
+    
+    def __init__(self, model_name: str, tokenizer=None):
+        self.model_name = model_name
+        self._tokenizer = tokenizer
+        self._loaded = tokenizer is not None
+        self._lock = threading.Lock()
+    
+    @property
+    def tokenizer(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        from transformers import AutoTokenizer
+                        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                    except Exception as e:
+                        print(f"⚠️  Tokenizer for {self.model_name} unavailable ({e}), estimating tokens")
+                    self._loaded = True
+        return self._tokenizer
+    
+    def count(self, text: str) -> int:
+        tokenizer = self.tokenizer
+        if tokenizer is None:
+            return -(-len(text) // CHARS_PER_TOKEN)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of text that fits in max_tokens."""
+        tokenizer = self.tokenizer
+        if tokenizer is None:
+            return text[:max_tokens * CHARS_PER_TOKEN]
+        ids = tokenizer.encode(text, add_special_tokens=False)
+        return text if len(ids) <= max_tokens else tokenizer.decode(ids[:max_tokens])
+
+
+@dataclass
+class PackedContext:
+    """Prompt context and what packing removed."""
+    text: str
+    tokens_before: int
+    tokens_after: int
+    duplicates_dropped: int = 0
+    overlaps_trimmed: int = 0
+    truncated: int = 0
+    chunks_dropped: int = 0
+    source_ids: List[int] = field(default_factory=list)
+    
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'tokens_before': self.tokens_before,
+            'tokens_after': self.tokens_after,
+            'tokens_saved': self.tokens_saved,
+            'duplicates_dropped': self.duplicates_dropped,
+            'overlaps_trimmed': self.overlaps_trimmed,
+            'truncated': self.truncated,
+            'chunks_dropped': self.chunks_dropped,
+        }
+
+
+class ContextBuilder:
+    """Builds the CONTEXT DOCUMENTS section within a token budget.
+    
+    Chunks are taken in retrieval order. A chunk that is a near duplicate of
+    an earlier one is dropped; text an earlier chunk of the same source
+    already contains because of splitter overlap is cut from its start or end.
+    Chunks are added whole while they fit, the next one is truncated to the
+    remaining budget, and the rest are dropped. Kept chunks keep their
+    original [Source N] number so citations match the returned sources.
+    """
+    
+    def __init__(
+        self,
+        counter: TokenCounter,
+        token_budget: int = 2048,
+        dedup_threshold: float = 0.8,
+        min_chunk_tokens: int = 64
+    ):
+        self.counter = counter
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+        self.min_chunk_tokens = min_chunk_tokens
+        
+        self.requests = 0
+        self.tokens_before = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+    
+    def build(self, docs: List[Document]) -> PackedContext:
+        parts: List[str] = []
+        source_ids: List[int] = []
+        tokens_before = tokens_after = 0
+        duplicates = overlaps = truncated = dropped = 0
+        kept: List[Document] = []
+        kept_shingles: List[Set[int]] = []
+        
+        for i, doc in enumerate(docs, 1):
+            header = f"[Source {i}] (from {doc.metadata.get('source', 'Unknown')}):\n"
+            full_tokens = self.counter.count(header + doc.page_content)
+            tokens_before += full_tokens
+            
+            content_shingles = _shingles(doc.page_content)
+            if any(_jaccard(content_shingles, seen) >= self.dedup_threshold for seen in kept_shingles):
+                duplicates += 1
+                continue
+            
+            content = doc.page_content
+            for earlier in kept:
+                if earlier.metadata.get('source') == doc.metadata.get('source'):
+                    # Neighbouring chunks may have been retrieved in either order
+                    trimmed = _strip_leading_overlap(earlier.page_content, content)
+                    trimmed = _strip_trailing_overlap(trimmed, earlier.page_content)
+                    if len(trimmed) != len(content):
+                        overlaps += 1
+                        content = trimmed
+            if not content.strip():
+                duplicates += 1
+                continue
+            
+            part = header + content
+            part_tokens = full_tokens if content is doc.page_content else self.counter.count(part)
+            remaining = self.token_budget - tokens_after
+            if part_tokens > remaining:
+                header_tokens = self.counter.count(header)
+                if remaining - header_tokens < self.min_chunk_tokens:
+                    dropped += len(docs) - i + 1
+                    break
+                part = header + self.counter.truncate(content, remaining - header_tokens)
+                part_tokens = self.counter.count(part)
+                truncated += 1
+            
+            parts.append(part)
+            source_ids.append(i)
+            tokens_after += part_tokens
+            kept.append(doc)
+            kept_shingles.append(content_shingles)
+        
+        packed = PackedContext(
+            text="\n\n".join(parts),
+            tokens_before=tokens_before,
+            tokens_after=tokens_after,
+            duplicates_dropped=duplicates,
+            overlaps_trimmed=overlaps,
+            truncated=truncated,
+            chunks_dropped=dropped,
+            source_ids=source_ids,
+        )
+        with self._lock:
+            self.requests += 1
+            self.tokens_before += packed.tokens_before
+            self.tokens_saved += packed.tokens_saved
+        return packed
+    
+    def stats(self) -> Dict[str, Any]:
+        """Totals over all packed requests."""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'token_budget': self.token_budget,
+                'tokens_before': self.tokens_before,
+                'tokens_saved': self.tokens_saved,
+                'saved_ratio': self.tokens_saved / self.tokens_before if self.tokens_before else 0.0,
+            }
+
+
+def _shingles(text: str) -> Set[int]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {hash(tuple(words))} if words else set()
+    return {hash(tuple(words[i:i + SHINGLE_SIZE])) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _strip_leading_overlap(previous: str, text: str) -> str:
+    """Cut the start of text that repeats the end of previous (splitter overlap)."""
+    probe = text[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return text
+    start = previous.find(probe)
+    while start != -1:
+        if text.startswith(previous[start:]):
+            return text[len(previous) - start:].lstrip()
+        start = previous.find(probe, start + 1)
+    return text
+
+
+def _strip_trailing_overlap(text: str, following: str) -> str:
+    """Cut the end of text that repeats the start of following."""
+    probe = following[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return text
+    start = text.find(probe)
+    while start != -1:
+        if following.startswith(text[start:]):
+            return text[:start].rstrip()
+        start = text.find(probe, start + 1)
+    return text
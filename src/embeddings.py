@@ -0,0 +1,229 @@
+"""Embedding helpers shared by retrieval components."""
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Deque, List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Normalize query text so trivially different spellings share a cache key."""
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with a size-bounded LRU cache for query vectors.
+    
+    Queries are normalized into the cache key only: a miss embeds the text
+    as given (case-sensitive models see the original spelling) and later
+    variants of the same key reuse that vector. Document embedding is passed
+    through uncached.
+    """
+    
+    def __init__(self, base: Embeddings, max_size: int = 1024):
+        self.base = base
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return vector.tolist()
+            self.misses += 1
+        
+        # Embed outside the lock so concurrent misses do not serialize
+        vector = np.asarray(self.base.embed_query(text), dtype=np.float32)
+        
+        if self.max_size > 0:
+            with self._lock:
+                self._cache[key] = vector
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        
+        return vector.tolist()
+    
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Embed many queries as one float32 matrix.
+        
+        Cache hits are served from the cache and all misses are encoded in a
+        single batched call. This relies on embed_query(q) being equal to
+        embed_documents([q])[0], which holds for HuggingFaceEmbeddings.
+        """
+        keys = [normalize_query(text) for text in texts]
+        vectors: Dict[str, np.ndarray] = {}
+        
+        with self._lock:
+            for key in keys:
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    vectors[key] = vector
+                else:
+                    self.misses += 1
+        
+        # First original spelling of each missed key
+        misses: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                misses.setdefault(key, text)
+        if misses:
+            embedded = np.asarray(self.base.embed_documents(list(misses.values())), dtype=np.float32)
+            with self._lock:
+                for key, vector in zip(misses, embedded):
+                    vectors[key] = vector
+                    if self.max_size > 0:
+                        # Copy so a cached row does not pin the whole batch matrix
+                        self._cache[key] = vector.copy()
+                        self._cache.move_to_end(key)
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        
+        return np.stack([vectors[key] for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+    
+    def clear(self):
+        """Drop all cached vectors and reset counters."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Cache size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._cache),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class EmbeddingBatcher(Embeddings):
+    """Encodes concurrent embed_query calls together in one forward pass.
+    
+    Callers block on a future while a dispatcher thread collects the texts
+    that arrive within `max_wait_ms` of the first one (or `max_batch_size`
+    of them, whichever comes first) and encodes them with a single
+    embed_documents call. Like embed_queries, this relies on embed_query(q)
+    being equal to embed_documents([q])[0]. Document embedding is passed
+    through unbatched.
+    """
+    
+    def __init__(self, base: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        self.base = base
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.embedded = 0
+        self.largest_batch = 0
+        self._pending: Deque[Tuple[str, Future]] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._closed = False
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.submit(text).result()
+    
+    def submit(self, text: str) -> Future:
+        """Queue one query text; the future resolves to its vector."""
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Embedding batcher is closed")
+            self._ensure_thread()
+            self._pending.append((text, future))
+            self._cond.notify()
+        return future
+    
+    def close(self):
+        """Stop the dispatcher after it drains the queue."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Batch counters."""
+        with self._cond:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'batches': self.batches,
+                'embedded': self.embedded,
+                'mean_batch_size': self.embedded / self.batches if self.batches else 0.0,
+                'largest_batch': self.largest_batch,
+                'pending': len(self._pending),
+            }
+    
+    def _ensure_thread(self):
+        # Started lazily, and again in a forked worker, which inherits no threads
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._thread.start()
+    
+    def _next_batch(self) -> List[Tuple[str, Future]]:
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if self._pending:
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch_size))]
+            if batch:
+                self.batches += 1
+                self.embedded += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+            return batch
+    
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return  # Closed and drained
+            # Identical texts in one window are encoded once
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = dict(zip(texts, self.base.embed_documents(texts)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for text, future in batch:
+                future.set_result(list(vectors[text]))
@@ -1,11 +1,20 @@
 """Document ingestion and vector store creation."""
 
+import argparse
+import hashlib
 import json
+import os
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from tqdm import tqdm
 
+import faiss
+import numpy as np
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.schema import Document
@@ -16,21 +25,173 @@ try:
 except ImportError:
     PdfReader = None
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 import pandas as pd
 
-from config import settings
+from config import settings, ensure_directories, print_model_info
+from ann_index import normalize_spec
+from bm25 import BM25Index
+from chunk_store import ChunkStore, has_store, load_index, save_index, saved_index_spec
+
+
+# Supported input formats
+SUPPORTED_EXTENSIONS = ['.txt', '.pdf', '.csv', '.json']
+
+# Chunks passed to the embedding model per call
+EMBED_BATCH_SIZE = 100
+
+# PDF pages extracted per worker task in parallel mode
+PDF_PAGES_PER_TASK = 50
+
+# Streaming pipeline: smallest batch under memory pressure, and how often
+# (in chunks) the process RSS is checked against the memory limit
+MIN_EMBED_BATCH_SIZE = 8
+MEMORY_CHECK_INTERVAL = 16
+
+# Ingest manifest (lives next to the FAISS index)
+MANIFEST_NAME = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(file_path: Path, block_size: int = 1 << 20) -> str:
+    """Compute the SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_chunk_id(file_name: str, file_hash: str, seq: int) -> str:
+    """Deterministic docstore id for the seq-th chunk of one file version."""
+    return f"{file_name}::{file_hash[:16]}::{seq:06d}"
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB (0.0 if unknown)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        # Peak rather than current RSS, but still a usable upper bound
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return 0.0
+
+
+def _extract_pdf_pages(file_path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Extract the text of pages [start, stop) of a PDF as (page_num, text) pairs.
+    
+    Module-level so it can run in worker processes.
+    """
+    reader = PdfReader(file_path)
+    return [
+        (page_num + 1, reader.pages[page_num].extract_text())
+        for page_num in range(start, stop)
+    ]
+
+
+class IngestManifest:
+    """Persistent record of what has been embedded into the vector store.
+    
+    For every source file it stores the content hash, the docstore ids of its
+    chunks and the FAISS ids (index positions) of their vectors, so a re-run
+    only embeds new or changed files and deletes the vectors of removed ones.
+    """
+    
+    def __init__(self, files: Dict[str, Dict[str, Any]] = None, settings_key: Dict[str, Any] = None):
+        self.files = files or {}
+        self.settings_key = settings_key or self.current_settings_key()
+    
+    @staticmethod
+    def current_settings_key() -> Dict[str, Any]:
+        """Settings that invalidate every stored vector when they change."""
+        return {
+            'embedding_model': settings.embedding_model,
+            'chunk_size': settings.chunk_size,
+            'chunk_overlap': settings.chunk_overlap,
+        }
+    
+    @classmethod
+    def load(cls, path: Path) -> Optional["IngestManifest"]:
+        """Load a manifest, or return None if missing or unreadable."""
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if data.get('version') != MANIFEST_VERSION:
+            return None
+        return cls(files=data.get('files', {}), settings_key=data.get('settings', {}))
+    
+    def save(self, path: Path):
+        """Write the manifest atomically."""
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': MANIFEST_VERSION,
+                'settings': self.settings_key,
+                'files': self.files,
+            }, f, indent=2, sort_keys=True)
+        tmp_path.replace(path)
+    
+    def is_compatible(self) -> bool:
+        """Whether stored vectors were built with the current settings."""
+        return self.settings_key == self.current_settings_key()
+    
+    def diff(self, file_hashes: Dict[str, str]) -> Dict[str, List[str]]:
+        """Classify files as new, changed, unchanged or removed."""
+        result = {'new': [], 'changed': [], 'unchanged': [], 'removed': []}
+        for name, file_hash in sorted(file_hashes.items()):
+            entry = self.files.get(name)
+            if entry is None:
+                result['new'].append(name)
+            elif entry.get('sha256') != file_hash:
+                result['changed'].append(name)
+            else:
+                result['unchanged'].append(name)
+        result['removed'] = sorted(set(self.files) - set(file_hashes))
+        return result
+    
+    def update_faiss_ids(self, index_to_docstore_id: Dict[int, str]):
+        """Refresh stored FAISS ids from the store's position -> id mapping."""
+        positions = {doc_id: idx for idx, doc_id in index_to_docstore_id.items()}
+        for entry in self.files.values():
+            entry['faiss_ids'] = [int(positions[cid]) for cid in entry['chunk_ids'] if cid in positions]
 
 
 class DocumentIngester:
     """Handles document loading, chunking, and indexing."""
     
-    def __init__(self):
-        print("Loading embeddings model (this may take a moment)...")
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=settings.embedding_model,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True, 'batch_size': 8, 'show_progress_bar': False}
-        )
+    def __init__(
+        self,
+        embeddings=None,
+        workers: int = None,
+        batch_size: int = EMBED_BATCH_SIZE,
+        memory_limit_mb: int = None,
+        index_type: str = None
+    ):
+        self.workers = workers if workers is not None else settings.ingest_workers
+        self.index_type = normalize_spec(index_type if index_type is not None else settings.index_type)
+        self.batch_size = batch_size
+        self.memory_limit_mb = memory_limit_mb if memory_limit_mb is not None else settings.ingest_memory_mb
+        self.failed_files: Dict[str, Exception] = {}
+        
+        if embeddings is None:
+            print("Loading embeddings model (this may take a moment)...")
+            embeddings = HuggingFaceEmbeddings(
+                model_name=settings.embedding_model,
+                model_kwargs={'device': 'cpu'},
+                encode_kwargs={'normalize_embeddings': True, 'batch_size': 8, 'show_progress_bar': False}
+            )
+        self.embeddings = embeddings
         
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=settings.chunk_size,
@@ -49,26 +210,121 @@ class DocumentIngester:
         print(f"\n📂 Loading documents from: {data_dir}")
         
         # Get all files
-        supported_extensions = ['.txt', '.pdf', '.csv', '.json']
-        files = [f for f in data_dir.iterdir() if f.suffix.lower() in supported_extensions]
+        files = self.list_files(data_dir)
         
         if not files:
             print(f"⚠️  No documents found in {data_dir}")
-            print(f"   Supported formats: {', '.join(supported_extensions)}")
+            print(f"   Supported formats: {', '.join(SUPPORTED_EXTENSIONS)}")
             print(f"   Creating sample document for demo...")
             return self._create_sample_documents()
         
-        for file_path in tqdm(files, desc="Loading files"):
+        for file_path, docs in tqdm(self.iter_file_documents(files), total=len(files), desc="Loading files"):
             try:
-                docs = self._load_file(file_path)
-                documents.extend(docs)
-                print(f"   ✓ Loaded {len(docs)} chunks from {file_path.name}")
+                docs = list(docs)
             except Exception as e:
                 print(f"   ✗ Error loading {file_path.name}: {e}")
+                continue
+            documents.extend(docs)
+            print(f"   ✓ Loaded {len(docs)} chunks from {file_path.name}")
         
         print(f"\n✓ Total documents loaded: {len(documents)}")
         return documents
     
+    def iter_documents(self, files: List[Path]) -> Iterator[Document]:
+        """Stream documents from files in order (generator form of load_documents).
+        
+        Files that fail to load are reported and recorded in failed_files;
+        documents already yielded for a failed file are the caller's to discard.
+        """
+        self.failed_files = {}
+        for file_path, docs in self.iter_file_documents(files):
+            try:
+                yield from docs
+            except Exception as e:
+                self.failed_files[file_path.name] = e
+                print(f"   ✗ Error loading {file_path.name}: {e}")
+    
+    def iter_file_documents(self, files: List[Path]) -> Iterator[Tuple[Path, Iterator[Document]]]:
+        """Yield (file_path, documents) per file in input order.
+        
+        Documents are produced lazily (page by page for PDFs) and loading
+        errors surface while iterating them. With more than one worker, PDF
+        page ranges are extracted on a process pool, at most two tasks per
+        worker ahead of the consumer; pages come back in order, so the output
+        is identical to the sequential path.
+        """
+        if self.workers <= 1:
+            for file_path in files:
+                yield file_path, self._iter_file(file_path)
+            return
+        
+        # (file_idx, start, stop) tasks for every PDF page range
+        tasks, errors = deque(), {}
+        for file_idx, file_path in enumerate(files):
+            if file_path.suffix.lower() != '.pdf' or PdfReader is None:
+                continue
+            try:
+                n_pages = len(PdfReader(str(file_path)).pages)
+            except Exception as e:
+                errors[file_idx] = e
+                continue
+            for start in range(0, n_pages, PDF_PAGES_PER_TASK):
+                tasks.append((file_idx, start, min(start + PDF_PAGES_PER_TASK, n_pages)))
+        
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = deque()
+            
+            def fill(file_idx: int):
+                # Drop work left over from files whose stream was abandoned
+                while in_flight and in_flight[0][0] < file_idx:
+                    in_flight.popleft()[1].cancel()
+                while tasks and tasks[0][0] < file_idx:
+                    tasks.popleft()
+                while tasks and len(in_flight) < 2 * self.workers:
+                    idx, start, stop = tasks.popleft()
+                    in_flight.append((idx, pool.submit(_extract_pdf_pages, str(files[idx]), start, stop)))
+            
+            def iter_pdf(file_idx: int, file_path: Path) -> Iterator[Document]:
+                if file_idx in errors:
+                    raise errors[file_idx]
+                while True:
+                    fill(file_idx)
+                    if not in_flight or in_flight[0][0] != file_idx:
+                        return
+                    future = in_flight.popleft()[1]
+                    fill(file_idx)
+                    yield from self._iter_pdf_documents(file_path, future.result())
+            
+            for file_idx, file_path in enumerate(files):
+                if file_path.suffix.lower() == '.pdf' and PdfReader is not None:
+                    yield file_path, iter_pdf(file_idx, file_path)
+                else:
+                    # Other formats load here while the pool extracts PDFs
+                    fill(file_idx)
+                    yield file_path, self._iter_file(file_path)
+    
+    def list_files(self, data_dir: Path = None) -> List[Path]:
+        """List supported files in the data directory, sorted by name."""
+        if data_dir is None:
+            data_dir = settings.raw_data_dir
+        if not data_dir.is_dir():
+            return []
+        return sorted(
+            (f for f in data_dir.iterdir() if f.is_file() and f.suffix.lower() in SUPPORTED_EXTENSIONS),
+            key=lambda f: f.name
+        )
+    
+    def _iter_file(self, file_path: Path) -> Iterator[Document]:
+        """Lazily load a single file (PDFs page by page)."""
+        if file_path.suffix.lower() == '.pdf':
+            if PdfReader is None:
+                raise ImportError("pypdf is required for PDF support. Install with: pip install pypdf")
+            reader = PdfReader(str(file_path))
+            pages = ((page_num, page.extract_text()) for page_num, page in enumerate(reader.pages, start=1))
+            yield from self._iter_pdf_documents(file_path, pages)
+        else:
+            yield from self._load_file(file_path)
+    
     def _load_file(self, file_path: Path) -> List[Document]:
         """Load a single file based on its extension."""
         suffix = file_path.suffix.lower()
@@ -102,22 +358,20 @@ class DocumentIngester:
         if PdfReader is None:
             raise ImportError("pypdf is required for PDF support. Install with: pip install pypdf")
         
-        documents = []
-        reader = PdfReader(str(file_path))
-        
-        for page_num, page in enumerate(reader.pages, start=1):
-            text = page.extract_text()
+        return list(self._iter_file(file_path))
+    
+    def _iter_pdf_documents(self, file_path: Path, pages: Iterable[Tuple[int, str]]) -> Iterator[Document]:
+        """Build page documents from (page_num, text) pairs, skipping blank pages."""
+        for page_num, text in pages:
             if text.strip():
-                documents.append(Document(
+                yield Document(
                     page_content=text,
                     metadata={
                         'source': file_path.name,
                         'page': page_num,
                         'file_type': 'pdf'
                     }
-                ))
-        
-        return documents
+                )
     
     def _load_csv(self, file_path: Path) -> List[Document]:
         """Load a CSV file (expects 'text' or 'content' column)."""
@@ -262,22 +516,107 @@ Prevention: Hand hygiene, avoiding close contact with sick individuals, annual f
         print(f"   ✓ Created {len(chunks)} chunks")
         return chunks
     
-    def create_vector_store(self, chunks: List[Document]) -> FAISS:
-        """Create FAISS vector store from document chunks."""
-        print("\n🔢 Generating embeddings and creating vector store...")
+    def iter_chunks(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Split documents into chunks one document at a time (generator form of chunk_documents)."""
+        for document in documents:
+            yield from self.text_splitter.split_documents([document])
+    
+    def iter_embedded_batches(
+        self,
+        items: Iterable[Tuple[str, Document]],
+        batch_size: int = None
+    ) -> Iterator[Tuple[List[str], List[Document], np.ndarray]]:
+        """Group (chunk_id, chunk) pairs into batches and embed each batch.
+        
+        With a memory limit, a batch is flushed early and the batch size halved
+        whenever process RSS is above the limit, so the pipeline's working set
+        is bounded by the batch size rather than by the corpus size.
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+        ids, chunks = [], []
+        
+        for chunk_id, chunk in items:
+            ids.append(chunk_id)
+            chunks.append(chunk)
+            
+            flush = len(chunks) >= batch_size
+            if (not flush and self.memory_limit_mb and len(chunks) % MEMORY_CHECK_INTERVAL == 0
+                    and current_rss_mb() > self.memory_limit_mb):
+                batch_size = max(MIN_EMBED_BATCH_SIZE, len(chunks) // 2)
+                flush = True
+            
+            if flush:
+                yield ids, chunks, self._embed_texts([chunk.page_content for chunk in chunks])
+                ids, chunks = [], []
         
-        # Process in batches to avoid rate limits
-        batch_size = 100
-        vector_store = None
+        if chunks:
+            yield ids, chunks, self._embed_texts([chunk.page_content for chunk in chunks])
+    
+    def add_embedded_batches(
+        self,
+        batches: Iterable[Tuple[List[str], List[Document], np.ndarray]],
+        vector_store: Optional[FAISS] = None
+    ) -> Optional[FAISS]:
+        """Add embedded batches to a single index (streaming form of create_vector_store)."""
+        for ids, chunks, matrix in tqdm(batches, desc="Embedding batches"):
+            if vector_store is None:
+                vector_store = self.build_vector_store(chunks, matrix, ids)
+            else:
+                vector_store.add_embeddings(
+                    zip([chunk.page_content for chunk in chunks], matrix),
+                    metadatas=[chunk.metadata for chunk in chunks],
+                    ids=ids
+                )
+        return vector_store
+    
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed texts as a float32 matrix."""
+        return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+    
+    def embed_chunks(self, chunks: List[Document], batch_size: int = None) -> np.ndarray:
+        """Embed chunks into one preallocated float32 matrix."""
+        if batch_size is None:
+            batch_size = self.batch_size
+        matrix = None
         
         for i in tqdm(range(0, len(chunks), batch_size), desc="Embedding batches"):
-            batch = chunks[i:i + batch_size]
+            vectors = self._embed_texts([chunk.page_content for chunk in chunks[i:i + batch_size]])
             
-            if vector_store is None:
-                vector_store = FAISS.from_documents(batch, self.embeddings)
-            else:
-                batch_store = FAISS.from_documents(batch, self.embeddings)
-                vector_store.merge_from(batch_store)
+            if matrix is None:
+                matrix = np.empty((len(chunks), vectors.shape[1]), dtype=np.float32)
+            matrix[i:i + len(vectors)] = vectors
+        
+        return matrix
+    
+    def build_vector_store(
+        self,
+        chunks: List[Document],
+        matrix: np.ndarray,
+        ids: Optional[List[str]] = None
+    ) -> FAISS:
+        """Add an embedding matrix to a single index and fill the docstore in one go."""
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in chunks]
+        if not (len(chunks) == len(ids) == len(matrix)):
+            raise ValueError("chunks, ids and embedding matrix must have the same length")
+        
+        index = faiss.IndexFlatL2(matrix.shape[1])
+        index.add(matrix)
+        
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore(dict(zip(ids, chunks))),
+            index_to_docstore_id=dict(enumerate(ids))
+        )
+    
+    def create_vector_store(self, chunks: List[Document], ids: Optional[List[str]] = None) -> FAISS:
+        """Create FAISS vector store from document chunks."""
+        print("\n🔢 Generating embeddings and creating vector store...")
+        
+        matrix = self.embed_chunks(chunks)
+        vector_store = self.build_vector_store(chunks, matrix, ids)
         
         print(f"   ✓ Vector store created with {len(chunks)} chunks")
         return vector_store
@@ -288,36 +627,172 @@ Prevention: Hand hygiene, avoiding close contact with sick individuals, annual f
             path = settings.vector_store_dir
         
         print(f"\n💾 Saving vector store to: {path}")
-        vector_store.save_local(str(path))
+        path.mkdir(parents=True, exist_ok=True)
+        ids = [vector_store.index_to_docstore_id[i] for i in range(vector_store.index.ntotal)]
+        docs = [vector_store.docstore.search(doc_id) for doc_id in ids]
+        ChunkStore.write(path, ids, docs)
+        # Positions shift when chunks are deleted, so the sparse index is rebuilt on every save
+        BM25Index.build(doc.page_content for doc in docs).save(path)
+        built = save_index(path, vector_store.index, self.index_type)
+        if built != self.index_type:
+            print(f"   ⚠️  Too few chunks to train a {self.index_type} index, using exact search")
+        else:
+            print(f"   ✓ Index type: {built}")
+        
+        # Pickled docstore written by earlier versions
+        legacy_docstore = path / "index.pkl"
+        if legacy_docstore.exists():
+            legacy_docstore.unlink()
         print("   ✓ Vector store saved successfully")
     
-    def ingest(self) -> FAISS:
-        """Full ingestion pipeline."""
+    def load_vector_store(self, path: Path = None) -> Optional[FAISS]:
+        """Load a previously saved vector store, or None if there is none."""
+        if path is None:
+            path = settings.vector_store_dir
+        
+        if not has_store(path):
+            return None
+        
+        try:
+            ids, docs = [], []
+            for doc_id, doc in ChunkStore(path, use_mmap=False).documents():
+                ids.append(doc_id)
+                docs.append(doc)
+            return FAISS(
+                embedding_function=self.embeddings,
+                index=load_index(path),
+                docstore=InMemoryDocstore(dict(zip(ids, docs))),
+                index_to_docstore_id=dict(enumerate(ids))
+            )
+        except Exception as e:
+            print(f"   ⚠️  Could not load existing vector store ({e}), rebuilding")
+            return None
+    
+    def _ingest_samples(self, path: Path) -> FAISS:
+        """Index the built-in sample documents (no manifest is kept)."""
+        documents = self._create_sample_documents()
+        chunks = self.chunk_documents(documents)
+        vector_store = self.create_vector_store(chunks)
+        self.save_vector_store(vector_store, path)
+        
+        manifest_path = path / MANIFEST_NAME
+        if manifest_path.exists():
+            manifest_path.unlink()
+        return vector_store
+    
+    def ingest(
+        self,
+        full_rebuild: bool = False,
+        data_dir: Path = None,
+        store_path: Path = None
+    ) -> FAISS:
+        """Full ingestion pipeline.
+        
+        Only new or changed files are embedded; vectors of changed and removed
+        files are deleted. Pass full_rebuild=True to re-embed everything.
+        """
         print("\n" + "="*60)
         print("🏥 Medical RAG Chatbot - Document Ingestion")
         print("="*60)
         
-        # Load documents
-        documents = self.load_documents()
+        if data_dir is None:
+            data_dir = settings.raw_data_dir
+        if store_path is None:
+            store_path = settings.vector_store_dir
+        manifest_path = store_path / MANIFEST_NAME
         
-        if not documents:
-            raise ValueError("No documents loaded. Please add files to the data/raw directory.")
+        files = self.list_files(data_dir)
+        if not files:
+            print(f"⚠️  No documents found in {data_dir}")
+            print(f"   Supported formats: {', '.join(SUPPORTED_EXTENSIONS)}")
+            print(f"   Creating sample document for demo...")
+            return self._ingest_samples(store_path)
         
-        # Chunk documents
-        chunks = self.chunk_documents(documents)
+        # Reuse the existing store only if it was built with the same settings
+        manifest = None if full_rebuild else IngestManifest.load(manifest_path)
+        vector_store = None
+        if manifest is not None and manifest.is_compatible():
+            vector_store = self.load_vector_store(store_path)
+        if vector_store is None:
+            manifest = IngestManifest()
+        
+        print(f"\n🔎 Hashing {len(files)} files in: {data_dir}")
+        file_paths = {f.name: f for f in files}
+        file_hashes = {name: file_sha256(f) for name, f in file_paths.items()}
+        changes = manifest.diff(file_hashes)
+        
+        print(f"   New: {len(changes['new'])}, changed: {len(changes['changed'])}, "
+              f"unchanged: {len(changes['unchanged'])}, removed: {len(changes['removed'])}")
+        
+        # Drop vectors of changed and removed files
+        stale_ids = []
+        for name in changes['changed'] + changes['removed']:
+            stale_ids.extend(manifest.files.pop(name)['chunk_ids'])
+        if stale_ids and vector_store is not None:
+            print(f"\n🗑️  Removing {len(stale_ids)} stale chunks")
+            vector_store.delete(stale_ids)
+        
+        # Stream new or changed files: load -> split -> embed in batches -> add to index
+        to_load = [file_paths[name] for name in changes['new'] + changes['changed']]
+        file_chunk_ids: Dict[str, List[str]] = {}
+        failed: Dict[str, Exception] = {}
+        
+        def identified_chunks() -> Iterator[Tuple[str, Document]]:
+            for file_path, docs in self.iter_file_documents(to_load):
+                name = file_path.name
+                ids = file_chunk_ids[name] = []
+                try:
+                    for chunk in self.iter_chunks(docs):
+                        ids.append(make_chunk_id(name, file_hashes[name], len(ids)))
+                        yield ids[-1], chunk
+                except Exception as e:
+                    failed[name] = e
+                    print(f"   ✗ Error loading {name}: {e}")
+                    continue
+                print(f"   ✓ Loaded {len(ids)} chunks from {name}")
+        
+        if to_load:
+            print(f"\n🔢 Streaming {len(to_load)} files into the vector store...")
+            vector_store = self.add_embedded_batches(
+                self.iter_embedded_batches(identified_chunks()), vector_store
+            )
+        
+        # Chunks of files that failed part-way through were already indexed
+        partial_ids = [cid for name in failed for cid in file_chunk_ids[name]]
+        if partial_ids:
+            vector_store.delete(partial_ids)
+        
+        embedded = 0
+        for name, ids in file_chunk_ids.items():
+            if name in failed:
+                continue
+            embedded += len(ids)
+            manifest.files[name] = {
+                'sha256': file_hashes[name],
+                'chunk_ids': ids,
+                'faiss_ids': [],
+            }
         
-        # Create vector store
-        vector_store = self.create_vector_store(chunks)
+        if vector_store is None or not vector_store.index_to_docstore_id:
+            raise ValueError("No documents loaded. Please add files to the data/raw directory.")
         
-        # Save to disk
-        self.save_vector_store(vector_store)
+        index_changed = saved_index_spec(store_path) != self.index_type
+        if not (file_chunk_ids or stale_ids or index_changed) and has_store(store_path):
+            print("\n✓ Vector store is up to date, nothing to embed")
+        else:
+            self.save_vector_store(vector_store, store_path)
+        manifest.update_faiss_ids(vector_store.index_to_docstore_id)
+        manifest.save(manifest_path)
         
         print("\n" + "="*60)
         print("✅ Ingestion complete!")
         print("="*60)
-        print(f"   Documents: {len(documents)}")
-        print(f"   Chunks: {len(chunks)}")
-        print(f"   Vector store: {settings.vector_store_dir}")
+        print(f"   Files: {len(manifest.files)}")
+        print(f"   Chunks embedded this run: {embedded}")
+        if resource is not None:
+            print(f"   Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+        print(f"   Chunks total: {len(vector_store.index_to_docstore_id)}")
+        print(f"   Vector store: {store_path}")
         print("\n   Next steps:")
         print("   1. Run the API: python src/app_api.py")
         print("   2. Or run Gradio UI: python src/app_gradio.py")
@@ -328,9 +803,39 @@ Prevention: Hand hygiene, avoiding close contact with sick individuals, annual f
 
 def main():
     """CLI entry point."""
+    parser = argparse.ArgumentParser(description="Ingest documents into the vector store.")
+    parser.add_argument(
+        "--full", action="store_true",
+        help="Ignore the ingest manifest and re-embed every file"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=settings.ingest_workers,
+        help="Processes used for PDF text extraction (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=EMBED_BATCH_SIZE,
+        help="Chunks embedded and added to the index per batch (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--max-memory-mb", type=int, default=settings.ingest_memory_mb,
+        help="Shrink embedding batches when RSS exceeds this many MB, 0 = no limit (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--index", default=settings.index_type,
+        help="FAISS index spec: Flat, HNSW32, IVF1024,PQ32, IVF1024,SQ8, SQ8 (default: %(default)s)"
+    )
+    args = parser.parse_args()
+    
+    print_model_info()
+    ensure_directories()
     try:
-        ingester = DocumentIngester()
-        ingester.ingest()
+        ingester = DocumentIngester(
+            workers=args.workers,
+            batch_size=args.batch_size,
+            memory_limit_mb=args.max_memory_mb,
+            index_type=args.index
+        )
+        ingester.ingest(full_rebuild=args.full)
     except Exception as e:
         print(f"\n❌ Error during ingestion: {e}")
         raise
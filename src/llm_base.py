@@ -0,0 +1,258 @@
+"""Backend-independent LLM interface: prompting, safety checks and answer formatting."""
+
+from contextlib import aclosing, closing
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
+import asyncio
+import time
+from langchain.schema import Document
+from config import settings
+from context_builder import ContextBuilder, PackedContext, TokenCounter
+from metrics import STAGE_METRIC, metrics
+from safety import get_classifier
+
+# Appended to every generated answer
+ANSWER_DISCLAIMER = "\n\n⚕️ **Medical Disclaimer**: This information is for educational purposes only and should not replace professional medical advice. Please consult a qualified healthcare provider for medical concerns."
+
+BACKENDS = ("huggingface", "local", "stub")
+
+
+class StreamInterrupted(Exception):
+    """The backend failed after part of the answer had been streamed."""
+
+
+class BaseLLM:
+    """Medical-specific prompting on top of a text generation backend.
+    
+    Subclasses implement _complete, _acomplete, _stream and _astream for one
+    prompt; everything that turns retrieved chunks into a prompt and the
+    generated text into an answer lives here.
+    """
+    
+    backend = "base"
+    
+    def __init__(self, model: str, token_counter: Optional[TokenCounter] = None):
+        self.model = model
+        
+        # Tokenizer of the target model, loaded on first use
+        self.context_builder = ContextBuilder(
+            token_counter or TokenCounter(model),
+            token_budget=settings.context_token_budget,
+            dedup_threshold=settings.context_dedup_threshold
+        )
+        
+        # Compiled once per process and shared by all backends
+        self.safety = get_classifier(settings.safety_phrases_path)
+        
+        self.system_prompt = """You are an expert medical information assistant with deep knowledge of anatomy, physiology, pathology, and clinical medicine. Provide accurate, evidence-based answers from the provided medical literature.
+
+RESPONSE GUIDELINES:
+1. ACCURACY: Answer ONLY from the provided context. Do not add external information.
+2. CITATIONS: Cite sources for EVERY medical fact using [Source X] notation.
+3. CLARITY: Use precise medical terminology with clear explanations.
+4. COMPREHENSIVENESS: Provide detailed explanations covering mechanisms, symptoms, diagnosis, and treatment when relevant.
+5. CONTEXT: If the provided documents lack sufficient information, state this clearly and explain what information is missing.
+6. SAFETY: Always include appropriate medical disclaimers. Never provide personal diagnoses or treatment recommendations.
+7. EMERGENCIES: If the query involves emergency symptoms, advise immediate medical attention.
+8. STRUCTURE: Organize complex answers with clear sections (e.g., Definition, Causes, Symptoms, Treatment).
+
+Remember: Your role is to educate based on medical literature, not to replace professional medical consultation."""
+    
+    def _complete(self, prompt: str) -> str:
+        """Generate the completion of a prompt."""
+        raise NotImplementedError
+    
+    async def _acomplete(self, prompt: str) -> str:
+        """Generate the completion of a prompt without blocking the event loop."""
+        raise NotImplementedError
+    
+    def _stream(self, prompt: str) -> Iterator[str]:
+        """Yield the completion of a prompt as it is generated."""
+        raise NotImplementedError
+    
+    def _astream(self, prompt: str) -> AsyncIterator[str]:
+        """Yield the completion of a prompt as it is generated (async)."""
+        raise NotImplementedError
+    
+    def load_tokenizer(self):
+        """Load the prompt tokenizer now instead of on the first request."""
+        return self.context_builder.counter.tokenizer
+    
+    def stats(self) -> Dict[str, Any]:
+        """Backend name, model, context packing totals and backend-specific counters."""
+        return {'backend': self.backend, 'model': self.model, 'context': self.context_builder.stats()}
+    
+    def _fallback_response(self) -> str:
+        """Fallback response when API fails."""
+        return """I apologize, but I'm experiencing technical difficulties accessing the language model. 
+        
+Please try again in a moment. If the issue persists:
+- Check your internet connection
+- Verify the Hugging Face API is accessible
+- Try a different question
+
+For urgent medical concerns, please contact a healthcare provider immediately."""
+    
+    def build_prompt(self, query: str, retrieved_docs: List[Document]) -> str:
+        """Build the generation prompt from the question and retrieved chunks."""
+        return self._build_prompt(query, retrieved_docs)[0]
+    
+    def _build_prompt(self, query: str, retrieved_docs: List[Document]) -> Tuple[str, PackedContext]:
+        """Build the prompt with deduplicated, token-budgeted context."""
+        with metrics.span("prompt"):
+            context = self.context_builder.build(retrieved_docs)
+        
+        # Build prompt
+        return f"""{self.system_prompt}
+
+CONTEXT DOCUMENTS:
+{context.text}
+
+USER QUESTION: {query}
+
+ASSISTANT: Based on the provided context, """, context
+    
+    def _format_answer(
+        self,
+        answer: str,
+        retrieved_docs: List[Document],
+        context: Optional[PackedContext] = None
+    ) -> Dict[str, Any]:
+        """Attach the disclaimer, source previews and context packing stats to a generated answer."""
+        result = {
+            "answer": answer + ANSWER_DISCLAIMER,
+            "sources": [
+                {
+                    "source_id": i,
+                    "content": doc.page_content[:200] + "...",
+                    "metadata": doc.metadata
+                }
+                for i, doc in enumerate(retrieved_docs, 1)
+            ],
+            "warning": False
+        }
+        if context is not None:
+            result["context"] = context.stats()
+        return result
+    
+    def _safety_response(self, query: str, safety_warning: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the safety warning response for the query, if any.
+        
+        safety_warning is the result of an earlier check_query_safety call
+        ("" for a safe query); the query is only classified when it is None.
+        """
+        if safety_warning is None:
+            safety_warning = self.check_query_safety(query)
+        if safety_warning:
+            return {
+                "answer": safety_warning,
+                "sources": [],
+                "warning": True
+            }
+        return None
+    
+    def generate_answer(
+        self, 
+        query: str, 
+        retrieved_docs: List[Document],
+        safety_warning: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Generate answer with citations."""
+        
+        # Safety check
+        safety_response = self._safety_response(query, safety_warning)
+        if safety_response:
+            return safety_response
+        
+        # Generate answer
+        prompt, context = self._build_prompt(query, retrieved_docs)
+        with metrics.span("llm"):
+            answer = self._complete(prompt)
+        return self._format_answer(answer, retrieved_docs, context)
+    
+    async def agenerate_answer(
+        self,
+        query: str,
+        retrieved_docs: List[Document],
+        safety_warning: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Generate answer with citations (async)."""
+        
+        # Safety check
+        safety_response = self._safety_response(query, safety_warning)
+        if safety_response:
+            return safety_response
+        
+        # Generate answer; tokenizing the context is CPU work, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        prompt, context = await loop.run_in_executor(None, self._build_prompt, query, retrieved_docs)
+        with metrics.span("llm"):
+            answer = await self._acomplete(prompt)
+        return self._format_answer(answer, retrieved_docs, context)
+    
+    def stream_answer(
+        self,
+        query: str,
+        retrieved_docs: List[Document],
+        safety_warning: Optional[str] = None
+    ) -> Iterator[str]:
+        """Yield the answer text as it is generated.
+        
+        The concatenated pieces equal generate_answer(...)['answer']. Raises
+        StreamInterrupted if the backend fails after the first token.
+        """
+        safety_response = self._safety_response(query, safety_warning)
+        if safety_response:
+            yield safety_response["answer"]
+            return
+        
+        prompt = self.build_prompt(query, retrieved_docs)
+        start = time.perf_counter()
+        # closing: a consumer that stops early also stops the backend stream
+        with closing(self._stream(prompt)) as tokens:
+            for i, token in enumerate(tokens):
+                if i == 0:
+                    metrics.observe(STAGE_METRIC, time.perf_counter() - start, stage="llm_first_token")
+                yield token
+        metrics.observe(STAGE_METRIC, time.perf_counter() - start, stage="llm")
+        yield ANSWER_DISCLAIMER
+    
+    async def astream_answer(
+        self,
+        query: str,
+        retrieved_docs: List[Document],
+        safety_warning: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Yield the answer text as it is generated (async); see stream_answer."""
+        safety_response = self._safety_response(query, safety_warning)
+        if safety_response:
+            yield safety_response["answer"]
+            return
+        
+        loop = asyncio.get_running_loop()
+        prompt = await loop.run_in_executor(None, self.build_prompt, query, retrieved_docs)
+        start = time.perf_counter()
+        first = True
+        async with aclosing(self._astream(prompt)) as tokens:
+            async for token in tokens:
+                if first:
+                    metrics.observe(STAGE_METRIC, time.perf_counter() - start, stage="llm_first_token")
+                    first = False
+                yield token
+        metrics.observe(STAGE_METRIC, time.perf_counter() - start, stage="llm")
+        yield ANSWER_DISCLAIMER
+    
+    def check_query_safety(self, query: str) -> str:
+        """Check for emergency or inappropriate queries; returns the warning text or ""."""
+        return self.safety.classify(query).warning
+
+
+def create_llm(backend: Optional[str] = None) -> BaseLLM:
+    """Create the LLM for a backend name (default settings.llm_backend)."""
+    backend = (backend or settings.llm_backend).lower()
+    if backend == "huggingface":
+        from llm_huggingface import LLM
+        return LLM()
+    if backend in ("local", "stub"):
+        from llm_local import LocalLLM
+        return LocalLLM(stub=backend == "stub")
+    raise ValueError(f"Unknown LLM backend {backend!r}, expected one of {', '.join(BACKENDS)}")
@@ -1,203 +1,105 @@
 """LLM module using Hugging Face Inference API (FREE)."""
 
-from typing import List, Dict, Any
+from typing import Dict, Any, AsyncIterator, Iterator
 import os
-from langchain.schema import Document
 from config import settings
+from llm_base import BaseLLM, StreamInterrupted
+from llm_transport import HTTPX_AVAILABLE, HFTransport, TransportError
 
-try:
-    from huggingface_hub import InferenceClient
-    HF_AVAILABLE = True
-except ImportError:
-    HF_AVAILABLE = False
-    InferenceClient = None
 
-
-class LLM:
+class LLM(BaseLLM):
     """Wrapper for Hugging Face Inference API with medical-specific prompting."""
     
+    backend = "huggingface"
+    
     def __init__(self):
         """Initialize Hugging Face LLM."""
-        if not HF_AVAILABLE:
+        if not HTTPX_AVAILABLE:
             raise ImportError(
-                "Hugging Face Hub not installed. Install with: pip install huggingface-hub"
+                "httpx not installed. Install with: pip install httpx"
             )
         
+        super().__init__(settings.hf_model)
         self.api_key = os.getenv("HUGGINGFACE_API_KEY", "")
-        self.model = settings.hf_model
         
-        # Initialize InferenceClient
-        self.client = InferenceClient(
-            model=self.model,
-            token=self.api_key if self.api_key else None
+        # Pooled keep-alive connections shared by sync and async calls
+        self.transport = HFTransport(
+            self.model,
+            api_key=self.api_key,
+            api_url=settings.hf_api_url,
+            max_connections=settings.llm_max_connections,
+            max_retries=settings.llm_max_retries,
+            backoff_base=settings.llm_backoff_base,
+            backoff_max=settings.llm_backoff_max,
+            deadline=settings.llm_timeout,
+            rate_limit=settings.llm_rate_limit,
+            breaker_failures=settings.llm_breaker_failures,
+            breaker_reset=settings.llm_breaker_reset
         )
         
         print(f"✓ Using Hugging Face API with model: {self.model}")
         if not self.api_key:
             print("⚠️  No HUGGINGFACE_API_KEY found - using free tier (may have rate limits)")
             print("   Get a free API key at: https://huggingface.co/settings/tokens")
-        
-        self.system_prompt = """You are an expert medical information assistant with deep knowledge of anatomy, physiology, pathology, and clinical medicine. Provide accurate, evidence-based answers from the provided medical literature.
-
-RESPONSE GUIDELINES:
-1. ACCURACY: Answer ONLY from the provided context. Do not add external information.
-2. CITATIONS: Cite sources for EVERY medical fact using [Source X] notation.
-3. CLARITY: Use precise medical terminology with clear explanations.
-4. COMPREHENSIVENESS: Provide detailed explanations covering mechanisms, symptoms, diagnosis, and treatment when relevant.
-5. CONTEXT: If the provided documents lack sufficient information, state this clearly and explain what information is missing.
-6. SAFETY: Always include appropriate medical disclaimers. Never provide personal diagnoses or treatment recommendations.
-7. EMERGENCIES: If the query involves emergency symptoms, advise immediate medical attention.
-8. STRUCTURE: Organize complex answers with clear sections (e.g., Definition, Causes, Symptoms, Treatment).
-
-Remember: Your role is to educate based on medical literature, not to replace professional medical consultation."""
     
-    def _call_api(self, prompt: str, max_retries: int = 3) -> str:
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        """Sampling parameters shared by the sync and async clients."""
+        return {
+            'max_new_tokens': settings.max_tokens,
+            'temperature': settings.temperature,
+            'return_full_text': False,
+            'repetition_penalty': 1.1,  # Reduce repetition
+            'top_p': 0.9  # Nucleus sampling for better quality
+        }
+    
+    def _complete(self, prompt: str) -> str:
         """Call Hugging Face Inference API."""
-        for attempt in range(max_retries):
-            try:
-                # Use text_generation with InferenceClient
-                response = self.client.text_generation(
-                    prompt,
-                    max_new_tokens=settings.max_tokens,
-                    temperature=settings.temperature,
-                    return_full_text=False,
-                    repetition_penalty=1.1,  # Reduce repetition
-                    top_p=0.9  # Nucleus sampling for better quality
-                )
-                
-                return response
-                    
-            except Exception as e:
-                error_msg = str(e).lower()
-                
-                # Model loading
-                if "loading" in error_msg or "503" in error_msg:
-                    import time
-                    print(f"Model loading, waiting 10s (attempt {attempt + 1}/{max_retries})...")
-                    time.sleep(10)
-                    continue
-                
-                # Rate limit
-                elif "rate limit" in error_msg or "429" in error_msg:
-                    print(f"Rate limited (attempt {attempt + 1}/{max_retries})")
-                    if attempt < max_retries - 1:
-                        import time
-                        time.sleep(5)
-                        continue
-                
-                print(f"API Error: {e}")
-                if attempt == max_retries - 1:
-                    return self._fallback_response()
-                    
-        return self._fallback_response()
+        try:
+            return self.transport.generate(prompt, self._generation_kwargs())
+        except TransportError as e:
+            print(f"API Error: {e}")
+            return self._fallback_response()
     
-    def _fallback_response(self) -> str:
-        """Fallback response when API fails."""
-        return """I apologize, but I'm experiencing technical difficulties accessing the language model. 
-        
-Please try again in a moment. If the issue persists:
-- Check your internet connection
-- Verify the Hugging Face API is accessible
-- Try a different question
-
-For urgent medical concerns, please contact a healthcare provider immediately."""
+    async def _acomplete(self, prompt: str) -> str:
+        """Call Hugging Face Inference API without blocking the event loop."""
+        try:
+            return await self.transport.agenerate(prompt, self._generation_kwargs())
+        except TransportError as e:
+            print(f"API Error: {e}")
+            return self._fallback_response()
     
-    def generate_answer(
-        self, 
-        query: str, 
-        retrieved_docs: List[Document]
-    ) -> Dict[str, Any]:
-        """Generate answer with citations."""
-        
-        # Safety check
-        safety_warning = self.check_query_safety(query)
-        if safety_warning:
-            return {
-                "answer": safety_warning,
-                "sources": [],
-                "warning": True
-            }
-        
-        # Format context
-        context_parts = []
-        for i, doc in enumerate(retrieved_docs, 1):
-            source = doc.metadata.get("source", "Unknown")
-            context_parts.append(f"[Source {i}] (from {source}):\n{doc.page_content}")
-        
-        context = "\n\n".join(context_parts)
-        
-        # Build prompt
-        prompt = f"""{self.system_prompt}
-
-CONTEXT DOCUMENTS:
-{context}
-
-USER QUESTION: {query}
-
-ASSISTANT: Based on the provided context, """
-        
-        # Generate answer
-        answer = self._call_api(prompt)
-        
-        # Add medical disclaimer
-        disclaimer = "\n\n⚕️ **Medical Disclaimer**: This information is for educational purposes only and should not replace professional medical advice. Please consult a qualified healthcare provider for medical concerns."
-        
-        return {
-            "answer": answer + disclaimer,
-            "sources": [
-                {
-                    "source_id": i,
-                    "content": doc.page_content[:200] + "...",
-                    "metadata": doc.metadata
-                }
-                for i, doc in enumerate(retrieved_docs, 1)
-            ],
-            "warning": False
-        }
+    def _stream(self, prompt: str) -> Iterator[str]:
+        """Stream tokens from the Hugging Face Inference API.
+        
+        Errors before the first token are retried by the transport; once
+        tokens have been sent they raise StreamInterrupted.
+        """
+        started = False
+        try:
+            for token in self.transport.stream(prompt, self._generation_kwargs()):
+                started = True
+                yield token
+        except TransportError as e:
+            print(f"API Error: {e}")
+            if started:
+                raise StreamInterrupted(str(e)) from e
+            yield self._fallback_response()
     
-    def check_query_safety(self, query: str) -> str:
-        """Check for emergency or inappropriate queries."""
-        query_lower = query.lower()
-        
-        # Emergency keywords
-        emergency_keywords = [
-            "emergency", "urgent", "heart attack", "stroke", "bleeding heavily",
-            "can't breathe", "unconscious", "severe pain", "suicide", "overdose",
-            "choking", "seizure"
-        ]
-        
-        if any(keyword in query_lower for keyword in emergency_keywords):
-            return """🚨 **EMERGENCY ALERT** 🚨
-
-If you or someone else is experiencing a medical emergency:
-- Call emergency services immediately (911 in US, 112 in EU, or your local emergency number)
-- Do not wait for online medical information
-- Get immediate professional medical help
-
-This chatbot is NOT designed for emergency situations and cannot replace emergency medical services."""
-        
-        # Personal medical advice
-        personal_keywords = [
-            "should i take", "what should i do", "am i", "do i have",
-            "diagnose me", "treat my", "my symptoms"
-        ]
-        
-        if any(keyword in query_lower for keyword in personal_keywords):
-            return """⚠️ **Personal Medical Advice Warning** ⚠️
-
-I can provide general medical information from my knowledge base, but I cannot:
-- Diagnose your specific condition
-- Prescribe treatments
-- Give personalized medical advice
-
-Please consult with a qualified healthcare provider who can:
-- Examine you properly
-- Review your medical history
-- Provide appropriate diagnosis and treatment
-
-Would you like general information about a medical topic instead?"""
-        
-        return ""
+    async def _astream(self, prompt: str) -> AsyncIterator[str]:
+        """Stream tokens from the Hugging Face Inference API (async)."""
+        started = False
+        try:
+            async for token in self.transport.astream(prompt, self._generation_kwargs()):
+                started = True
+                yield token
+        except TransportError as e:
+            print(f"API Error: {e}")
+            if started:
+                raise StreamInterrupted(str(e)) from e
+            yield self._fallback_response()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), 'transport': self.transport.stats()}
 
 
 # Test if run directly
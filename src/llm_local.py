@@ -0,0 +1,480 @@
+"""In-process CPU text generation with continuous batching.
+
+One scheduler thread owns the model. Every step it admits waiting requests
+into the running batch (prefilling their prompts), runs a single batched
+decode step for all running sequences and retires the ones that finished,
+so a request joins or leaves the batch between any two tokens instead of
+waiting for the current batch to drain.
+
+Two models implement the prefill/decode interface: TransformersModel (a
+small causal LM from the Hugging Face Hub, run with PyTorch on CPU) and
+StubModel (deterministic output with a configurable per-step delay, for
+offline tests and benchmarks).
+"""
+
+import asyncio
+import queue
+import re
+import threading
+import time
+from collections import deque
+from contextlib import aclosing, closing
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional
+
+from config import settings
+from context_builder import TokenCounter
+from llm_base import BaseLLM, StreamInterrupted
+
+_DONE = object()
+
+
+class EngineError(Exception):
+    """Generation failed inside the local engine."""
+
+
+@dataclass
+class _Sequence:
+    """One request in the engine."""
+    prompt: str
+    max_new_tokens: int
+    emit: Callable[[Any], None]
+    state: Any = None
+    generated: int = 0
+    cancelled: bool = False  # The consumer went away; dropped at the next step
+
+
+class BatchingEngine:
+    """Continuous-batching scheduler around a prefill/decode model.
+    
+    model.prefill(prompt, max_new_tokens) returns a per-sequence state and
+    model.decode(states) advances every state by one token, returning the new
+    text piece of each, or None for a sequence that has finished.
+    """
+    
+    def __init__(self, model, max_batch_size: int = 8, max_new_tokens: int = 512):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_new_tokens = max_new_tokens
+        
+        self.requests = 0
+        self.steps = 0
+        self.tokens = 0
+        self.batch_slots = 0  # Sum of batch sizes over steps
+        self.peak_batch = 0
+        self.cancelled = 0
+        self._waiting: Deque[_Sequence] = deque()
+        self._active: List[_Sequence] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+    
+    def submit(self, prompt: str, emit: Callable[[Any], None], max_new_tokens: Optional[int] = None) -> _Sequence:
+        """Queue a prompt; emit receives text pieces, then _DONE or an EngineError."""
+        seq = _Sequence(prompt, max_new_tokens or self.max_new_tokens, emit)
+        with self._cond:
+            if self._closed:
+                raise EngineError("engine is closed")
+            self._waiting.append(seq)
+            self.requests += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="llm-engine", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return seq
+    
+    def cancel(self, seq: _Sequence):
+        """Stop generating for a sequence whose consumer is gone, freeing its batch slot."""
+        with self._cond:
+            if seq.cancelled:
+                return
+            seq.cancelled = True
+            self.cancelled += 1
+            try:
+                self._waiting.remove(seq)
+            except ValueError:
+                pass  # Running: the scheduler drops it before the next decode step
+    
+    def stream(self, prompt: str, max_new_tokens: Optional[int] = None) -> Iterator[str]:
+        pieces: "queue.Queue" = queue.Queue()
+        seq = self.submit(prompt, pieces.put, max_new_tokens)
+        finished = False
+        try:
+            while True:
+                piece = pieces.get()
+                if piece is _DONE:
+                    finished = True
+                    return
+                if isinstance(piece, EngineError):
+                    finished = True
+                    raise piece
+                yield piece
+        finally:
+            # Closed early (GeneratorExit) or interrupted
+            if not finished:
+                self.cancel(seq)
+    
+    async def astream(self, prompt: str, max_new_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        pieces: "asyncio.Queue" = asyncio.Queue()
+        
+        def emit(piece):
+            try:
+                loop.call_soon_threadsafe(pieces.put_nowait, piece)
+            except RuntimeError:
+                pass  # The consumer's loop is closed
+        
+        seq = self.submit(prompt, emit, max_new_tokens)
+        finished = False
+        try:
+            while True:
+                piece = await pieces.get()
+                if piece is _DONE:
+                    finished = True
+                    return
+                if isinstance(piece, EngineError):
+                    finished = True
+                    raise piece
+                yield piece
+        finally:
+            # Closed early (client disconnected, task cancelled)
+            if not finished:
+                self.cancel(seq)
+    
+    def generate(self, prompt: str, max_new_tokens: Optional[int] = None) -> str:
+        return "".join(self.stream(prompt, max_new_tokens))
+    
+    async def agenerate(self, prompt: str, max_new_tokens: Optional[int] = None) -> str:
+        return "".join([piece async for piece in self.astream(prompt, max_new_tokens)])
+    
+    def close(self):
+        """Stop the scheduler; requests still queued or running fail."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'requests': self.requests,
+                'running': len(self._active),
+                'waiting': len(self._waiting),
+                'steps': self.steps,
+                'tokens': self.tokens,
+                'mean_batch': self.batch_slots / self.steps if self.steps else 0.0,
+                'peak_batch': self.peak_batch,
+                'cancelled': self.cancelled,
+                'max_batch_size': self.max_batch_size,
+            }
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._waiting and not self._active:
+                    self._cond.wait()
+                if self._closed:
+                    for seq in list(self._waiting) + self._active:
+                        seq.emit(EngineError("engine is closed"))
+                    self._waiting.clear()
+                    self._active.clear()
+                    return
+                self._active = [seq for seq in self._active if not seq.cancelled]
+                admitted = []
+                while self._waiting and len(self._active) + len(admitted) < self.max_batch_size:
+                    admitted.append(self._waiting.popleft())
+            
+            # Prefill and decode run outside the lock so submit() never waits on the model
+            for seq in admitted:
+                try:
+                    seq.state = self.model.prefill(seq.prompt, seq.max_new_tokens)
+                except Exception as e:
+                    seq.emit(EngineError(f"prefill failed: {e}"))
+                    continue
+                self._active.append(seq)
+            if not self._active:
+                continue
+            
+            batch = list(self._active)
+            produced = 0
+            finished = set()
+            try:
+                pieces = self.model.decode([seq.state for seq in batch])
+            except Exception as e:
+                for seq in batch:
+                    seq.emit(EngineError(f"decode failed: {e}"))
+                    finished.add(id(seq))
+            else:
+                for seq, piece in zip(batch, pieces):
+                    if seq.cancelled:
+                        finished.add(id(seq))
+                        continue
+                    if piece is not None:
+                        seq.generated += 1
+                        produced += 1
+                        seq.emit(piece)
+                    if piece is None or seq.generated >= seq.max_new_tokens:
+                        seq.emit(_DONE)
+                        finished.add(id(seq))
+            
+            with self._cond:
+                self.steps += 1
+                self.tokens += produced
+                self.batch_slots += len(batch)
+                self.peak_batch = max(self.peak_batch, len(batch))
+                self._active = [seq for seq in self._active if id(seq) not in finished]
+
+
+class StubTokenizer:
+    """One token per word, keeping the whitespace before it (ids are the pieces)."""
+    
+    _PIECE_RE = re.compile(r"\s*\S+|\s+")
+    
+    def encode(self, text: str, add_special_tokens: bool = False) -> List[str]:
+        return self._PIECE_RE.findall(text)
+    
+    def decode(self, ids: List[str]) -> str:
+        return "".join(ids)
+
+
+class StubModel:
+    """Deterministic stand-in model for offline tests and benchmarks.
+    
+    The answer cites [Source 1] and repeats the question from the prompt.
+    Every decode step sleeps step_delay whatever the batch size, like a
+    memory-bound forward pass, so batching gains show up in timings.
+    """
+    
+    def __init__(self, step_delay: float = 0.0, prefill_delay: float = 0.0):
+        self.step_delay = step_delay
+        self.prefill_delay = prefill_delay
+        self.tokenizer = StubTokenizer()
+    
+    def prefill(self, prompt: str, max_new_tokens: int) -> Deque[str]:
+        if self.prefill_delay:
+            time.sleep(self.prefill_delay)
+        match = re.search(r"USER QUESTION: (.*)", prompt)
+        question = match.group(1).strip() if match else prompt[-200:].strip()
+        return deque(self.tokenizer.encode(f"According to [Source 1], this is a stub answer to: {question}"))
+    
+    def decode(self, states: List[Deque[str]]) -> List[Optional[str]]:
+        if self.step_delay:
+            time.sleep(self.step_delay)
+        return [state.popleft() if state else None for state in states]
+
+
+@dataclass
+class _LMState:
+    """KV cache and decoding position of one sequence."""
+    cache: tuple  # Legacy layout: per layer (keys, values) of shape [1, heads, length, head_dim]
+    length: int
+    next_id: int
+    ids: List[int] = field(default_factory=list)
+    text: str = ""
+
+
+class TransformersModel:
+    """Causal LM from the Hugging Face Hub on CPU with a per-sequence KV cache.
+    
+    Prompts are prefilled one at a time. A decode step left-pads the caches
+    of all running sequences to a common length, runs one forward pass for
+    the whole batch (padding masked out, positions given per sequence) and
+    splits the grown cache back per sequence.
+    """
+    
+    def __init__(
+        self,
+        model_name: str,
+        model=None,
+        tokenizer=None,
+        temperature: float = 0.0,
+        threads: int = 0
+    ):
+        # Deferred: importing transformers pulls in torch
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        
+        self.torch = torch
+        if threads > 0:
+            torch.set_num_threads(threads)
+        self.tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_name)
+        if model is None:
+            model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32)
+        self.model = model.eval()
+        self.temperature = temperature
+        self.max_context = getattr(model.config, 'max_position_embeddings', 2048)
+        
+        eos = getattr(getattr(model, 'generation_config', None), 'eos_token_id', None)
+        eos = eos if isinstance(eos, (list, tuple)) else [eos]
+        self.eos_ids = {i for i in [*eos, getattr(self.tokenizer, 'eos_token_id', None)] if i is not None}
+    
+    def prefill(self, prompt: str, max_new_tokens: int) -> _LMState:
+        if getattr(self.tokenizer, 'chat_template', None):
+            ids = self.tokenizer.apply_chat_template([{"role": "user", "content": prompt}], add_generation_prompt=True)
+        else:
+            ids = self.tokenizer.encode(prompt)
+        # Keep the end of an over-long prompt: it holds the question
+        ids = list(ids)[-max(1, self.max_context - max_new_tokens):]
+        
+        with self.torch.inference_mode():
+            out = self.model(input_ids=self.torch.tensor([ids]), use_cache=True)
+        return _LMState(_legacy(out.past_key_values), len(ids), self._sample(out.logits[:, -1])[0])
+    
+    def decode(self, states: List[_LMState]) -> List[Optional[str]]:
+        pieces: List[Optional[str]] = []
+        running = []
+        for state in states:
+            if state.next_id in self.eos_ids:
+                pieces.append(None)
+                continue
+            state.ids.append(state.next_id)
+            text = self.tokenizer.decode(state.ids, skip_special_tokens=True)
+            if text.endswith("\ufffd"):
+                # Incomplete multi-byte character: wait for the next token
+                pieces.append("")
+            else:
+                pieces.append(text[len(state.text):])
+                state.text = text
+            running.append(state)
+        
+        if running:
+            self._forward(running)
+        return pieces
+    
+    def _forward(self, states: List[_LMState]):
+        """One batched decode step: feed each state's next_id and sample the following token."""
+        torch = self.torch
+        from transformers import DynamicCache
+        
+        longest = max(state.length for state in states)
+        past = []
+        for layer in range(len(states[0].cache)):
+            keys, values = zip(*(
+                (self._left_pad(state.cache[layer][0], longest), self._left_pad(state.cache[layer][1], longest))
+                for state in states
+            ))
+            past.append((torch.cat(keys), torch.cat(values)))
+        
+        mask = torch.zeros(len(states), longest + 1, dtype=torch.long)
+        for row, state in enumerate(states):
+            mask[row, longest - state.length:] = 1
+        
+        with torch.inference_mode():
+            out = self.model(
+                input_ids=torch.tensor([[state.next_id] for state in states]),
+                past_key_values=DynamicCache.from_legacy_cache(tuple(past)),
+                attention_mask=mask,
+                position_ids=torch.tensor([[state.length] for state in states]),
+                use_cache=True
+            )
+        
+        grown = _legacy(out.past_key_values)
+        next_ids = self._sample(out.logits[:, -1])
+        for row, state in enumerate(states):
+            start = longest - state.length
+            state.cache = tuple((k[row:row + 1, :, start:], v[row:row + 1, :, start:]) for k, v in grown)
+            state.length += 1
+            state.next_id = next_ids[row]
+    
+    def _left_pad(self, tensor, length: int):
+        """Zero-pad a [1, heads, n, head_dim] cache tensor at the front to `length` positions."""
+        missing = length - tensor.shape[2]
+        if missing == 0:
+            return tensor
+        padding = tensor.new_zeros(tensor.shape[0], tensor.shape[1], missing, tensor.shape[3])
+        return self.torch.cat([padding, tensor], dim=2)
+    
+    def _sample(self, logits) -> List[int]:
+        if self.temperature <= 0:
+            return logits.argmax(dim=-1).tolist()
+        probs = self.torch.softmax(logits.float() / self.temperature, dim=-1)
+        return self.torch.multinomial(probs, 1)[:, 0].tolist()
+
+
+def _legacy(cache) -> tuple:
+    return cache.to_legacy_cache() if hasattr(cache, 'to_legacy_cache') else tuple(cache)
+
+
+class LocalLLM(BaseLLM):
+    """In-process generation on CPU: no network round trips or rate limits."""
+    
+    backend = "local"
+    
+    def __init__(self, stub: bool = False, engine: Optional[BatchingEngine] = None):
+        """Initialize the local model (settings.llm_model), or the stub model."""
+        if engine is None:
+            if stub:
+                model = StubModel()
+            else:
+                model = TransformersModel(
+                    settings.llm_model,
+                    temperature=settings.temperature,
+                    threads=settings.local_threads
+                )
+            engine = BatchingEngine(
+                model,
+                max_batch_size=settings.local_max_batch_size,
+                max_new_tokens=settings.max_tokens
+            )
+        self.engine = engine
+        
+        if isinstance(engine.model, StubModel):
+            self.backend = "stub"
+            name = "stub"
+        else:
+            name = settings.llm_model
+        super().__init__(name, TokenCounter(name, tokenizer=engine.model.tokenizer))
+        
+        print(f"✓ Using local {self.backend} model: {self.model} (batches up to {engine.max_batch_size} requests)")
+    
+    def _complete(self, prompt: str) -> str:
+        try:
+            return self.engine.generate(prompt)
+        except EngineError as e:
+            print(f"Local model error: {e}")
+            return self._fallback_response()
+    
+    async def _acomplete(self, prompt: str) -> str:
+        try:
+            return await self.engine.agenerate(prompt)
+        except EngineError as e:
+            print(f"Local model error: {e}")
+            return self._fallback_response()
+    
+    def _stream(self, prompt: str) -> Iterator[str]:
+        started = False
+        try:
+            with closing(self.engine.stream(prompt)) as pieces:
+                for piece in pieces:
+                    started = True
+                    yield piece
+        except EngineError as e:
+            print(f"Local model error: {e}")
+            if started:
+                raise StreamInterrupted(str(e)) from e
+            yield self._fallback_response()
+    
+    async def _astream(self, prompt: str) -> AsyncIterator[str]:
+        started = False
+        try:
+            async with aclosing(self.engine.astream(prompt)) as pieces:
+                async for piece in pieces:
+                    started = True
+                    yield piece
+        except EngineError as e:
+            print(f"Local model error: {e}")
+            if started:
+                raise StreamInterrupted(str(e)) from e
+            yield self._fallback_response()
+    
+    def _fallback_response(self) -> str:
+        """Fallback response when local generation fails."""
+        return """I apologize, but the local language model failed to generate an answer.
+
+Please try again in a moment. If the issue persists, check the server logs.
+
+For urgent medical concerns, please contact a healthcare provider immediately."""
+    
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), 'engine': self.engine.stats()}
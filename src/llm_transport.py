@@ -0,0 +1,386 @@
+"""HTTP transport for the Hugging Face Inference API.
+
+One pooled keep-alive connection set per process (and per event loop for
+async calls), exponential backoff with full jitter that honours Retry-After,
+a token-bucket rate limiter shared by all requests of the process, and a
+circuit breaker that fails fast while the API keeps failing.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from metrics import STAGE_METRIC, metrics
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTPX_AVAILABLE = False
+
+
+DEFAULT_API_URL = "https://api-inference.huggingface.co/models/{model}"
+
+# Status codes worth retrying; other 4xx errors are the caller's fault
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class TransportError(Exception):
+    """A request failed for good (retries exhausted, not retryable, or circuit open)."""
+    
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+    
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status in RETRYABLE_STATUS
+
+
+class CircuitOpenError(TransportError):
+    """The circuit breaker is open; the request was not sent."""
+
+
+class TokenBucket:
+    """Per-process rate limiter: `rate` requests per second with bursts of `capacity`.
+    
+    reserve() takes a token immediately and returns how long the caller must
+    wait for it, so waiters are served in arrival order.
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures.
+    
+    While open, requests fail fast. After `reset_timeout` seconds one probe
+    request is let through (half-open); its success closes the circuit and
+    its failure opens it again.
+    """
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+    
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        # A little jitter so clients told the same Retry-After do not return together
+        delay = max(delay, retry_after + random.uniform(0, base))
+    return delay
+
+
+def parse_retry_after(headers, body: Any = None) -> Optional[float]:
+    """Seconds from a Retry-After header (delta or HTTP date) or HF's estimated_time."""
+    value = headers.get('retry-after') if headers is not None else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    if isinstance(body, dict) and isinstance(body.get('estimated_time'), (int, float)):
+        return float(body['estimated_time'])
+    return None
+
+
+class HFTransport:
+    """Text generation over pooled HTTP connections with retries, rate limiting and a circuit breaker."""
+    
+    def __init__(
+        self,
+        model: str,
+        api_key: str = "",
+        api_url: str = "",
+        max_connections: int = 20,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        deadline: float = 60.0,
+        rate_limit: float = 0.0,
+        breaker_failures: int = 5,
+        breaker_reset: float = 30.0,
+        http_transport=None
+    ):
+        if not HTTPX_AVAILABLE:
+            raise ImportError("httpx is required for the Hugging Face transport. Install with: pip install httpx")
+        
+        self.url = (api_url or DEFAULT_API_URL).format(model=model)
+        self.headers = {'Authorization': f"Bearer {api_key}"} if api_key else {}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.rate_limiter = TokenBucket(rate_limit)
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset)
+        
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=60.0
+        )
+        self._timeout = httpx.Timeout(deadline, connect=5.0)
+        # Custom httpx transport (e.g. httpx.MockTransport in tests); None = real network
+        self._http_transport = http_transport
+        self._client = httpx.Client(
+            limits=self._limits, timeout=self._timeout, headers=self.headers, transport=http_transport
+        )
+        # httpx async pools are bound to the event loop that created them
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+        
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self._stats_lock = threading.Lock()
+    
+    # -- public API --------------------------------------------------------
+    
+    def generate(self, prompt: str, parameters: Dict[str, Any]) -> str:
+        """Generated text for a prompt."""
+        payload = {'inputs': prompt, 'parameters': parameters}
+        for attempt, deadline in self._attempts():
+            self._wait(self.rate_limiter.reserve(), deadline)
+            try:
+                response = self._client.post(self.url, json=payload, timeout=self._remaining(deadline))
+                return self._succeed(_generated_text(self._check(response)))
+            except Exception as e:
+                self._wait(self._on_error(e, attempt, deadline), deadline)
+    
+    async def agenerate(self, prompt: str, parameters: Dict[str, Any]) -> str:
+        """generate() without blocking the event loop."""
+        payload = {'inputs': prompt, 'parameters': parameters}
+        client = self._async_client()
+        for attempt, deadline in self._attempts():
+            await self._await(self.rate_limiter.reserve(), deadline)
+            try:
+                response = await client.post(self.url, json=payload, timeout=self._remaining(deadline))
+                return self._succeed(_generated_text(self._check(response)))
+            except Exception as e:
+                await self._await(self._on_error(e, attempt, deadline), deadline)
+    
+    def stream(self, prompt: str, parameters: Dict[str, Any]) -> Iterator[str]:
+        """Yield generated tokens. Only failures before the first token are retried."""
+        payload = {'inputs': prompt, 'parameters': parameters, 'stream': True}
+        for attempt, deadline in self._attempts():
+            self._wait(self.rate_limiter.reserve(), deadline)
+            started = False
+            try:
+                with self._client.stream('POST', self.url, json=payload, timeout=self._remaining(deadline)) as response:
+                    if response.status_code >= 400:
+                        response.read()
+                        self._check(response)
+                    for line in response.iter_lines():
+                        token = _sse_token(line)
+                        if token:
+                            started = True
+                            yield token
+                self._succeed(None)
+                return
+            except Exception as e:
+                if started:
+                    self._record_failure()
+                    raise TransportError(f"stream interrupted: {e}") from e
+                self._wait(self._on_error(e, attempt, deadline), deadline)
+    
+    async def astream(self, prompt: str, parameters: Dict[str, Any]) -> AsyncIterator[str]:
+        """stream() without blocking the event loop."""
+        payload = {'inputs': prompt, 'parameters': parameters, 'stream': True}
+        client = self._async_client()
+        for attempt, deadline in self._attempts():
+            await self._await(self.rate_limiter.reserve(), deadline)
+            started = False
+            try:
+                async with client.stream('POST', self.url, json=payload, timeout=self._remaining(deadline)) as response:
+                    if response.status_code >= 400:
+                        await response.aread()
+                        self._check(response)
+                    async for line in response.aiter_lines():
+                        token = _sse_token(line)
+                        if token:
+                            started = True
+                            yield token
+                self._succeed(None)
+                return
+            except Exception as e:
+                if started:
+                    self._record_failure()
+                    raise TransportError(f"stream interrupted: {e}") from e
+                await self._await(self._on_error(e, attempt, deadline), deadline)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Request, retry and failure counters and the circuit state."""
+        with self._stats_lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'circuit': self.breaker.state,
+            }
+    
+    def close(self):
+        self._client.close()
+    
+    # -- retry machinery ---------------------------------------------------
+    
+    def _attempts(self) -> Iterator:
+        """Yield (attempt, deadline) while the circuit allows the request."""
+        deadline = time.monotonic() + self.deadline
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                with self._stats_lock:
+                    self.rejected += 1
+                raise CircuitOpenError("circuit breaker open: Hugging Face API is failing")
+            with self._stats_lock:
+                self.requests += 1
+                if attempt:
+                    self.retries += 1
+            yield attempt, deadline
+    
+    def _on_error(self, error: Exception, attempt: int, deadline: float) -> float:
+        """Record a failed attempt and return the delay before the next one, or raise."""
+        if not isinstance(error, TransportError):
+            # Connection errors and timeouts
+            error = TransportError(f"{type(error).__name__}: {error}")
+        if not error.retryable:
+            # The API answered, so this does not count against the circuit
+            self.breaker.record_success()
+            raise error
+        self._record_failure()
+        
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_max, error.retry_after)
+        if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+            raise error
+        metrics.inc("llm_retries_total", reason=str(error.status or "connection"))
+        metrics.observe(STAGE_METRIC, delay, stage="retry_wait")
+        print(f"⚠️  LLM API error ({error}), retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+        return delay
+    
+    def _check(self, response) -> Any:
+        """Decoded JSON body of a successful response; TransportError otherwise."""
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        if response.status_code >= 400:
+            detail = body.get('error') if isinstance(body, dict) else response.text[:200]
+            raise TransportError(
+                f"HTTP {response.status_code}: {detail}",
+                status=response.status_code,
+                retry_after=parse_retry_after(response.headers, body)
+            )
+        return body
+    
+    def _succeed(self, value):
+        self.breaker.record_success()
+        return value
+    
+    def _record_failure(self):
+        self.breaker.record_failure()
+        with self._stats_lock:
+            self.failures += 1
+    
+    def _remaining(self, deadline: float) -> float:
+        return max(0.1, deadline - time.monotonic())
+    
+    def _wait(self, delay: float, deadline: float):
+        if delay > 0:
+            time.sleep(min(delay, self._remaining(deadline)))
+    
+    async def _await(self, delay: float, deadline: float):
+        if delay > 0:
+            await asyncio.sleep(min(delay, self._remaining(deadline)))
+    
+    def _async_client(self) -> "httpx.AsyncClient":
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                limits=self._limits, timeout=self._timeout, headers=self.headers, transport=self._http_transport
+            )
+            self._async_clients[loop] = client
+        return client
+
+
+def _generated_text(body: Any) -> str:
+    if isinstance(body, list) and body:
+        body = body[0]
+    if isinstance(body, dict) and 'generated_text' in body:
+        return body['generated_text']
+    raise TransportError(f"unexpected response: {str(body)[:200]}", status=502)
+
+
+def _sse_token(line: str) -> Optional[str]:
+    """Token text of one text-generation server-sent event line."""
+    if not line.startswith('data:'):
+        return None
+    data = json.loads(line[5:].strip())
+    if 'error' in data:
+        raise TransportError(f"stream error: {data['error']}", status=503)
+    token = data.get('token') or {}
+    return None if token.get('special') else token.get('text')
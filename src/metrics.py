@@ -0,0 +1,171 @@
+"""Latency histograms and counters, exposed in Prometheus text format.
+
+Observations go into fixed log-spaced buckets (factor sqrt(2) from 0.1 ms to
+about 2 minutes), so recording costs a bisect and a locked increment and
+memory does not grow with traffic. Percentiles are interpolated within the
+bucket, which bounds their error by the bucket width.
+
+    with metrics.span("search"):
+        ...
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import settings
+
+DEFAULT_BUCKETS: Tuple[float, ...] = tuple(0.0001 * math.sqrt(2) ** i for i in range(42))
+
+STAGE_METRIC = "rag_stage_seconds"
+
+HELP = {
+    STAGE_METRIC: "Time spent per pipeline stage",
+    "http_request_seconds": "HTTP request latency by route",
+    "llm_retries_total": "LLM API attempts that were retried, by reason",
+}
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+    """Cumulative-bucket histogram of non-negative values (seconds)."""
+    
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # Last slot: above the largest bound
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        slot = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+    
+    def percentile(self, q: float) -> float:
+        """Estimated q-th percentile (0-100); 0.0 when empty."""
+        with self._lock:
+            counts, total, largest = list(self.counts), self.count, self.max
+        if total == 0:
+            return 0.0
+        rank = q / 100 * total
+        seen = 0
+        for slot, n in enumerate(counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[slot - 1] if slot > 0 else 0.0
+                upper = min(self.bounds[slot], largest) if slot < len(self.bounds) else largest
+                return lower + (upper - lower) * max(0.0, rank - seen) / n
+            seen += n
+        return largest
+    
+    def summary(self) -> Dict[str, float]:
+        """Count, mean and p50/p95/p99 in milliseconds."""
+        with self._lock:
+            count, total = self.count, self.sum
+        return {
+            'count': count,
+            'mean_ms': round(total / count * 1000, 3) if count else 0.0,
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p95_ms': round(self.percentile(95) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+        }
+
+
+class Metrics:
+    """Registry of labelled histograms and counters."""
+    
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._histograms: Dict[_Key, Histogram] = {}
+        self._counters: Dict[_Key, float] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, name: str, seconds: float, **labels: str):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        histogram.observe(seconds)
+    
+    def inc(self, name: str, value: float = 1, **labels: str):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    @contextmanager
+    def span(self, stage: str):
+        """Time a pipeline stage (recorded even if it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(STAGE_METRIC, time.perf_counter() - start, stage=stage)
+    
+    def summary(self, name: str = STAGE_METRIC, label: str = "stage") -> Dict[str, Dict[str, float]]:
+        """Percentile summary per value of one label of a histogram."""
+        with self._lock:
+            items = [(dict(labels).get(label, ""), h) for (n, labels), h in self._histograms.items() if n == name]
+        return {value: histogram.summary() for value, histogram in sorted(items, key=lambda item: item[0])}
+    
+    def counters(self, name: str) -> Dict[Tuple[Tuple[str, str], ...], float]:
+        with self._lock:
+            return {labels: value for (n, labels), value in self._counters.items() if n == name}
+    
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            counters = sorted(self._counters.items(), key=lambda item: item[0])
+        
+        lines: List[str] = []
+        described = set()
+        for (name, labels), histogram in histograms:
+            if name not in described:
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+                described.add(name)
+            with histogram._lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, n in zip(histogram.bounds, counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels, le=f'{bound:.6g}')} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total:.9g}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            if name not in described:
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+                described.add(name)
+            lines.append(f"{name}{_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+    
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], le: Optional[str] = None) -> str:
+    pairs = list(labels) + ([("le", le)] if le is not None else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+# Process-wide registry
+metrics = Metrics(enabled=settings.metrics_enabled)
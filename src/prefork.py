@@ -0,0 +1,163 @@
+"""Preforking multi-process server.
+
+The parent binds the listening socket, runs a preload step once (the API
+builds the read-only retriever there: embedding model, index, chunk store,
+BM25) and then forks the workers. Workers inherit the preloaded objects
+copy-on-write and the index and chunk store are mmap'd, so each extra worker
+costs its private state (LLM client, caches) rather than a full pipeline.
+Every worker runs its own event loop on the shared socket and the kernel
+spreads connections between them; workers that die are replaced.
+
+POSIX only (needs os.fork).
+"""
+
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Callable, Dict, Optional
+
+
+def fork_supported() -> bool:
+    return hasattr(os, "fork")
+
+
+def limit_threads(threads: int):
+    """Cap the math-library thread pools already loaded in this process."""
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+    if 'faiss' in sys.modules:
+        sys.modules['faiss'].omp_set_num_threads(threads)
+
+
+class PreforkServer:
+    """Bind once, preload once, fork `workers` processes that each call `serve(sock)`."""
+    
+    def __init__(
+        self,
+        serve: Callable[[socket.socket], None],
+        host: str,
+        port: int,
+        workers: int,
+        preload: Optional[Callable[[], None]] = None,
+        threads_per_worker: int = 0,
+        backlog: int = 2048
+    ):
+        if not fork_supported():
+            raise RuntimeError("Prefork workers need os.fork (not available on this platform)")
+        self.serve = serve
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.preload = preload
+        # Split the cores so workers do not oversubscribe each other
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.backlog = backlog
+        self.sock: Optional[socket.socket] = None
+        self.children: Dict[int, int] = {}  # pid -> worker number
+        self.stopping = False
+        self._parent_pid = os.getpid()
+    
+    def start(self) -> "PreforkServer":
+        """Bind, preload and fork the workers."""
+        self.sock = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(self.backlog)  # Connections queue here while the preload runs
+        self.port = self.sock.getsockname()[1]
+        
+        if self.preload is not None:
+            self.preload()
+        # Keep the preloaded objects out of the GC's reach so collections in the
+        # workers do not write to (and un-share) their pages
+        gc.freeze()
+        
+        for number in range(self.workers):
+            self._spawn(number)
+        return self
+    
+    def run(self):
+        """Start, then supervise the workers until SIGINT/SIGTERM."""
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        self.start()
+        print(f"✓ {self.workers} workers serving on {self.host}:{self.port} "
+              f"({self.threads_per_worker} threads each)")
+        try:
+            while self.children:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                except InterruptedError:
+                    continue
+                number = self.children.pop(pid, None)
+                if number is None or self.stopping:
+                    continue
+                print(f"⚠️  Worker {number} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+                time.sleep(1)  # Do not spin if workers crash on startup
+                if not self.stopping:
+                    self._spawn(number)
+        finally:
+            self.stop()
+    
+    def stop(self, timeout: float = 30.0):
+        """Ask every worker to shut down gracefully, kill stragglers, close the socket."""
+        if os.getpid() != self._parent_pid:
+            return
+        self.stopping = True
+        for pid in list(self.children):
+            _signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        while self.children and time.monotonic() < deadline:
+            for pid in list(self.children):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0]:
+                        del self.children[pid]
+                except ChildProcessError:
+                    del self.children[pid]
+            time.sleep(0.05)
+        for pid in list(self.children):
+            _signal(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            del self.children[pid]
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+    
+    def _handle_stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            _signal(pid, signal.SIGTERM)
+    
+    def _spawn(self, number: int):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = number
+            return
+        
+        # Worker: default signal handling (the server installs its own), own thread budget
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            limit_threads(self.threads_per_worker)
+            self.serve(self.sock)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # Never return into the parent's call stack
+            os._exit(code)
+
+
+def _signal(pid: int, signum: int):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
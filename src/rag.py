@@ -1,27 +1,63 @@
 """Main RAG system orchestration."""
 
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, AsyncIterator, Iterator, List, Optional, Tuple
 from pathlib import Path
+import asyncio
+import atexit
 import sys
 
 # Add src to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
+from langchain.schema import Document
+
 from retriever import Retriever
-from llm_huggingface import LLM  # Optimized Hugging Face API
-from config import settings
+from llm_base import BaseLLM, StreamInterrupted, create_llm
+from answer_cache import SemanticAnswerCache
+from embeddings import normalize_query
+from metrics import metrics
+from single_flight import SingleFlight
+from config import settings, print_model_info
+from startup import startup_timer
 
 
 class RAGSystem:
     """Complete RAG pipeline for medical Q&A."""
     
-    def __init__(self, vector_store_path: Optional[Path] = None):
-        """Initialize RAG system."""
+    _executor: Optional[ThreadPoolExecutor] = None
+    
+    def __init__(
+        self,
+        vector_store_path: Optional[Path] = None,
+        retriever: Optional[Retriever] = None,
+        llm=None
+    ):
+        """Initialize RAG system (a prebuilt retriever or LLM replaces the configured one)."""
         print("🏥 Initializing Medical RAG System...")
         
         # Initialize components
-        self.retriever = Retriever(vector_store_path)
-        self.llm = LLM()
+        self.retriever = retriever or Retriever(vector_store_path)
+        with startup_timer.phase("init LLM client"):
+            self.llm = llm or create_llm()
+        if isinstance(self.llm, BaseLLM):
+            # Otherwise the first request waits for the download
+            with startup_timer.phase("load tokenizer"):
+                self.llm.load_tokenizer()
+        
+        self.answer_cache = None
+        if settings.answer_cache_enabled:
+            with startup_timer.phase("load answer cache"):
+                self.answer_cache = SemanticAnswerCache(
+                    path=settings.answer_cache_path,
+                    threshold=settings.answer_cache_threshold,
+                    ttl=settings.answer_cache_ttl,
+                    max_size=settings.answer_cache_size,
+                    namespace=self._cache_namespace()
+                )
+            atexit.register(self.answer_cache.save)
+        
+        self.single_flight = SingleFlight() if settings.coalesce_requests else None
         
         print("✓ RAG system ready!\n")
     
@@ -31,32 +67,317 @@ class RAGSystem:
         top_k: Optional[int] = None,
         include_disclaimer: bool = True
     ) -> Dict[str, Any]:
-        """Process a user query through the RAG pipeline."""
+        """Process a user query through the RAG pipeline.
+        
+        Concurrent calls with the same normalized question and parameters
+        share one computation (see SingleFlight).
+        """
+        with metrics.span("total"):
+            if self.single_flight is None:
+                return self._query(question, top_k, include_disclaimer)
+            result = self.single_flight.do(
+                self._flight_key(question, top_k, include_disclaimer),
+                lambda: self._query(question, top_k, include_disclaimer)
+            )
+            return self._for_caller(result, question)
+    
+    def _query(self, question: str, top_k: Optional[int], include_disclaimer: bool) -> Dict[str, Any]:
+        safety_check, chunk_ids, docs, result = self._prepare(question, top_k)
+        if not docs:
+            return self._no_results(question, safety_check, include_disclaimer)
+        
+        if result is None:
+            result = self.llm.generate_answer(question, docs, safety_check)
+            self._cache_answer(question, chunk_ids, result, safety_check)
+        
+        return self._finish(question, docs, result, safety_check, include_disclaimer)
+    
+    async def aquery(
+        self,
+        question: str,
+        top_k: Optional[int] = None,
+        include_disclaimer: bool = True
+    ) -> Dict[str, Any]:
+        """Process a user query without blocking the event loop.
+        
+        Safety check, embedding and FAISS search run on a bounded thread pool;
+        the LLM call uses the async client, so concurrent requests overlap
+        their network waits. Identical concurrent questions are coalesced
+        as in query().
+        """
+        with metrics.span("total"):
+            if self.single_flight is None:
+                return await self._aquery(question, top_k, include_disclaimer)
+            result = await self.single_flight.ado(
+                self._flight_key(question, top_k, include_disclaimer),
+                lambda: self._aquery(question, top_k, include_disclaimer)
+            )
+            return self._for_caller(result, question)
+    
+    async def _aquery(self, question: str, top_k: Optional[int], include_disclaimer: bool) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        
+        safety_check, chunk_ids, docs, result = await loop.run_in_executor(
+            executor, self._prepare, question, top_k
+        )
+        if not docs:
+            return self._no_results(question, safety_check, include_disclaimer)
+        
+        if result is None:
+            result = await self.llm.agenerate_answer(question, docs, safety_check)
+            await loop.run_in_executor(
+                executor, self._cache_answer, question, chunk_ids, result, safety_check
+            )
+        
+        return self._finish(question, docs, result, safety_check, include_disclaimer)
+    
+    def query_batch(
+        self,
+        questions: List[str],
+        top_k: Optional[int] = None,
+        include_disclaimer: bool = True,
+        concurrency: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Answer many questions; see aquery_batch."""
+        return asyncio.run(self.aquery_batch(questions, top_k, include_disclaimer, concurrency))
+    
+    async def aquery_batch(
+        self,
+        questions: List[str],
+        top_k: Optional[int] = None,
+        include_disclaimer: bool = True,
+        concurrency: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Answer many questions with one batched retrieval.
+        
+        All questions are embedded in one encode call and searched in one
+        multi-query FAISS search; LLM calls then run concurrently, at most
+        `concurrency` (default settings.llm_concurrency) at a time. Results are
+        returned in input order; a failed question gets an 'error' entry
+        instead of failing the whole batch.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        semaphore = asyncio.Semaphore(concurrency or settings.llm_concurrency)
+        
+        prepared = await loop.run_in_executor(executor, self._prepare_batch, questions, top_k)
+        
+        async def answer(question: str, safety_check: str, chunk_ids, docs, result) -> Dict[str, Any]:
+            if not docs:
+                return self._no_results(question, safety_check, include_disclaimer)
+            if result is None:
+                async with semaphore:
+                    result = await self.llm.agenerate_answer(question, docs, safety_check)
+                await loop.run_in_executor(
+                    executor, self._cache_answer, question, chunk_ids, result, safety_check
+                )
+            return self._finish(question, docs, result, safety_check, include_disclaimer)
+        
+        outcomes = await asyncio.gather(
+            *(answer(question, *item) for question, item in zip(questions, prepared)),
+            return_exceptions=True
+        )
+        
+        return [
+            {'query': question, 'error': f"Error processing query: {outcome}"}
+            if isinstance(outcome, Exception) else outcome
+            for question, outcome in zip(questions, outcomes)
+        ]
+    
+    def stream_query(
+        self,
+        question: str,
+        top_k: Optional[int] = None,
+        include_disclaimer: bool = True
+    ) -> Iterator[Dict[str, Any]]:
+        """Process a query, yielding events as the answer is generated.
+        
+        Events are {'type': 'start', 'query', 'sources', 'warning'}, then one
+        {'type': 'token', 'text'} per generated piece, then
+        {'type': 'done', 'answer', 'disclaimer', 'cached'}.
+        """
+        safety_check, chunk_ids, docs, result = self._prepare(question, top_k)
+        if not docs:
+            yield from self._result_events(self._no_results(question, safety_check, include_disclaimer))
+            return
+        if result is not None:
+            yield from self._result_events(self._finish(question, docs, result, safety_check, include_disclaimer))
+            return
+        
+        yield self._start_event(question, docs, safety_check)
+        parts = []
+        try:
+            for text in self.llm.stream_answer(question, docs, safety_check):
+                parts.append(text)
+                yield {'type': 'token', 'text': text}
+        except StreamInterrupted as e:
+            # A partial answer is sent as is but never cached
+            yield from self._interrupted_events(''.join(parts), e, include_disclaimer)
+            return
+        
+        result = {'answer': ''.join(parts)}
+        self._cache_answer(question, chunk_ids, result, safety_check)
+        yield self._done_event(result['answer'], include_disclaimer)
+    
+    async def astream_query(
+        self,
+        question: str,
+        top_k: Optional[int] = None,
+        include_disclaimer: bool = True
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Async form of stream_query for the API server."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        
+        safety_check, chunk_ids, docs, result = await loop.run_in_executor(
+            executor, self._prepare, question, top_k
+        )
+        if not docs:
+            for event in self._result_events(self._no_results(question, safety_check, include_disclaimer)):
+                yield event
+            return
+        if result is not None:
+            for event in self._result_events(self._finish(question, docs, result, safety_check, include_disclaimer)):
+                yield event
+            return
+        
+        yield self._start_event(question, docs, safety_check)
+        parts = []
+        try:
+            async for text in self.llm.astream_answer(question, docs, safety_check):
+                parts.append(text)
+                yield {'type': 'token', 'text': text}
+        except StreamInterrupted as e:
+            for event in self._interrupted_events(''.join(parts), e, include_disclaimer):
+                yield event
+            return
+        
+        result = {'answer': ''.join(parts)}
+        await loop.run_in_executor(
+            executor, self._cache_answer, question, chunk_ids, result, safety_check
+        )
+        yield self._done_event(result['answer'], include_disclaimer)
+    
+    def _start_event(self, question: str, docs: List[Document], safety_check: str) -> Dict[str, Any]:
+        """First streaming event: sources are known before generation starts."""
+        return {
+            'type': 'start',
+            'query': question,
+            'sources': self.retriever.format_sources(docs),
+            'warning': safety_check or None
+        }
+    
+    def _done_event(self, answer: str, include_disclaimer: bool, cached: bool = False) -> Dict[str, Any]:
+        """Last streaming event with the complete answer."""
+        return {
+            'type': 'done',
+            'answer': answer,
+            'disclaimer': settings.medical_disclaimer if include_disclaimer else None,
+            'cached': cached
+        }
+    
+    def _interrupted_events(self, answer: str, error: Exception, include_disclaimer: bool) -> Iterator[Dict[str, Any]]:
+        """Close a stream whose generation failed after the first token."""
+        yield {'type': 'error', 'detail': f"Answer generation was interrupted: {error}"}
+        yield self._done_event(answer, include_disclaimer)
+    
+    def _result_events(self, result: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Stream an already complete result as start, token and done events."""
+        yield {
+            'type': 'start',
+            'query': result['query'],
+            'sources': result['sources'],
+            'warning': result.get('warning')
+        }
+        yield {'type': 'token', 'text': result['answer']}
+        yield self._done_event(result['answer'], result.get('disclaimer') is not None, result.get('cached', False))
+    
+    def _cache_namespace(self) -> str:
+        """Answer cache key space: answers from another backend, model or embedder are not reused."""
+        backend = getattr(self.llm, 'backend', type(self.llm).__name__)
+        model = getattr(self.llm, 'model', '')
+        return f"{backend}:{model}|{settings.embedding_model}"
+    
+    def _for_caller(self, result: Dict[str, Any], question: str) -> Dict[str, Any]:
+        """A coalesced result echoes each caller's own spelling of the question."""
+        return result if result.get('query') == question else {**result, 'query': question}
+    
+    def _flight_key(self, question: str, top_k: Optional[int], include_disclaimer: bool) -> Tuple:
+        """Calls with equal keys produce the same response."""
+        return (normalize_query(question), top_k or self.retriever.default_k, include_disclaimer)
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Thread pool for blocking retrieval work called from async code."""
+        if self._executor is None:
+            workers = settings.retrieval_workers
+            batcher = getattr(self.retriever, 'batcher', None)
+            if batcher is not None:
+                # Threads mostly wait on the shared forward pass; fewer would cap the batch
+                workers = max(workers, batcher.max_batch_size)
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix="retrieval"
+            )
+        return self._executor
+    
+    def _prepare(self, question: str, top_k: Optional[int]) -> Tuple[str, List[str], List[Document], Optional[Dict[str, Any]]]:
+        """Safety check, retrieval and answer cache lookup (blocking)."""
         
         # Check query safety
-        safety_check = self.llm.check_query_safety(question)
+        with metrics.span("safety"):
+            safety_check = self.llm.check_query_safety(question)
         
         # Retrieve relevant documents
         if top_k is None:
-            top_k = settings.top_k
-        
-        docs = self.retriever.retrieve(question, k=top_k)
+            top_k = self.retriever.default_k
         
+        chunk_ids, docs = self.retriever.retrieve_with_ids(question, k=top_k)
         if not docs:
-            return {
-                'answer': "I couldn't find relevant information in the knowledge base to answer your question. Please rephrase or ask about a different topic.",
-                'sources': [],
-                'query': question,
-                'warning': safety_check.get('message'),
-                'disclaimer': settings.medical_disclaimer if include_disclaimer else None
-            }
+            return safety_check, chunk_ids, docs, None
         
-        # Generate answer
-        result = self.llm.generate_answer(question, docs)
+        # Reuse an answer for a near-identical question with the same sources;
+        # flagged questions always get the safety response instead
+        cached = None if safety_check else self._cached_answer(question, chunk_ids, docs)
+        return safety_check, chunk_ids, docs, cached
+    
+    def _prepare_batch(self, questions: List[str], top_k: Optional[int]) -> List[Tuple[str, List[str], List[Document], Optional[Dict[str, Any]]]]:
+        """Batched form of _prepare: one encode and one FAISS search for all questions."""
+        if top_k is None:
+            top_k = self.retriever.default_k
         
-        # Add safety warning if present
-        if safety_check.get('message'):
-            result['warning'] = safety_check['message']
+        retrieved = self.retriever.retrieve_batch(questions, k=top_k)
+        prepared = []
+        for question, (chunk_ids, docs) in zip(questions, retrieved):
+            with metrics.span("safety"):
+                safety_check = self.llm.check_query_safety(question)
+            cached = self._cached_answer(question, chunk_ids, docs) if docs and not safety_check else None
+            prepared.append((safety_check, chunk_ids, docs, cached))
+        return prepared
+    
+    def _no_results(self, question: str, safety_check: str, include_disclaimer: bool) -> Dict[str, Any]:
+        """Response when retrieval found nothing."""
+        return {
+            'answer': "I couldn't find relevant information in the knowledge base to answer your question. Please rephrase or ask about a different topic.",
+            'sources': [],
+            'query': question,
+            'warning': safety_check or None,
+            'disclaimer': settings.medical_disclaimer if include_disclaimer else None
+        }
+    
+    def _finish(
+        self,
+        question: str,
+        docs: List[Document],
+        result: Dict[str, Any],
+        safety_check: str,
+        include_disclaimer: bool
+    ) -> Dict[str, Any]:
+        """Attach query, sources, warning and disclaimer to a generated answer."""
+        result['query'] = question
+        with metrics.span("format"):
+            result['sources'] = self.retriever.format_sources(result.pop('docs', docs))
+        result['warning'] = safety_check or None
         
         # Add medical disclaimer
         if include_disclaimer:
@@ -64,6 +385,34 @@ class RAGSystem:
         
         return result
     
+    def _cached_answer(self, question: str, chunk_ids, docs) -> Optional[Dict[str, Any]]:
+        """Look up a semantically cached answer for this question and chunk set."""
+        if self.answer_cache is None:
+            return None
+        
+        with metrics.span("answer_cache"):
+            hit = self.answer_cache.lookup(self.retriever.embeddings.embed_query(question), chunk_ids)
+        if hit is None:
+            return None
+        
+        # Present sources in the cached order so [Source N] citations still match
+        answer, cached_ids = hit
+        by_id = dict(zip(chunk_ids, docs))
+        return {
+            'answer': answer,
+            'docs': [by_id[chunk_id] for chunk_id in cached_ids],
+            'cached': True
+        }
+    
+    def _cache_answer(self, question: str, chunk_ids, result: Dict[str, Any], safety_check: str):
+        """Cache a freshly generated answer unless it is a warning or a fallback."""
+        if self.answer_cache is None or safety_check:
+            return
+        if result['answer'].startswith(self.llm._fallback_response()):
+            return
+        
+        self.answer_cache.store(self.retriever.embeddings.embed_query(question), chunk_ids, result['answer'])
+    
     def format_response(self, result: Dict[str, Any]) -> str:
         """Format the response for display."""
         output = []
@@ -98,6 +447,7 @@ class RAGSystem:
 
 def main():
     """CLI interface for testing."""
+    print_model_info()
     print("\n" + "="*60)
     print("🏥 Medical RAG Chatbot - Interactive Mode")
     print("="*60)
@@ -0,0 +1,138 @@
+"""Cross-encoder reranking of retrieved chunks."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+
+from embeddings import normalize_query
+
+# Each call skipped for being over budget shrinks the cost estimate by this
+# factor, so one slow pass (e.g. the cold first predict) cannot switch
+# reranking off for good: a later call gets through and re-measures
+SKIP_DECAY = 0.9
+
+
+class CrossEncoderReranker:
+    """Reorders candidate chunks by cross-encoder relevance.
+    
+    All uncached (query, chunk) pairs of a call are scored in one batched
+    forward pass and pair scores are kept in an LRU cache. Reranking is
+    skipped (candidates keep their retrieval order) when the estimated
+    scoring time exceeds the latency budget or too many calls are already
+    running, so the stage degrades to plain retrieval under load.
+    """
+    
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        model=None,
+        batch_size: int = 32,
+        cache_size: int = 20000,
+        budget_ms: float = 200.0,
+        max_concurrent: int = 2
+    ):
+        if model is None:
+            # Deferred: importing sentence-transformers pulls in torch
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(model_name, device='cpu')
+        self.model = model
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.budget_ms = budget_ms
+        self.max_concurrent = max_concurrent
+        
+        self.hits = 0
+        self.misses = 0
+        self.reranked = 0
+        self.skipped = 0
+        # Moving average of scoring cost per pair, learned from completed passes
+        # and decayed by skipped ones
+        self.ms_per_pair: Optional[float] = None
+        self._in_flight = 0
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def rerank(self, query: str, ids: List[str], docs: List[Document], top_n: int) -> List[int]:
+        """Indices of the best top_n candidates, best first."""
+        return self.rerank_batch([query], [ids], [docs], top_n)[0]
+    
+    def rerank_batch(
+        self,
+        queries: Sequence[str],
+        ids: Sequence[List[str]],
+        docs: Sequence[List[Document]],
+        top_n: int
+    ) -> List[List[int]]:
+        """rerank() for many queries, scoring every uncached pair in one pass."""
+        keys = [[(normalize_query(q), chunk_id) for chunk_id in chunk_ids] for q, chunk_ids in zip(queries, ids)]
+        scores: Dict[Tuple[str, str], float] = {}
+        misses: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        
+        with self._lock:
+            for query, query_keys, query_docs in zip(queries, keys, docs):
+                for key, doc in zip(query_keys, query_docs):
+                    if key in scores or key in misses:
+                        continue
+                    score = self._cache.get(key)
+                    if score is not None:
+                        self._cache.move_to_end(key)
+                        self.hits += 1
+                        scores[key] = score
+                    else:
+                        self.misses += 1
+                        misses[key] = (query, doc.page_content)  # Score the query as typed
+            
+            over_budget = (
+                self.ms_per_pair is not None and len(misses) * self.ms_per_pair > self.budget_ms
+            )
+            if misses and (over_budget or self._in_flight >= self.max_concurrent):
+                self.skipped += len(queries)
+                if over_budget:
+                    self.ms_per_pair *= SKIP_DECAY
+                return [list(range(min(top_n, len(query_keys)))) for query_keys in keys]
+            if misses:
+                self._in_flight += 1
+        
+        if misses:
+            try:
+                start = time.perf_counter()
+                predicted = self.model.predict(list(misses.values()), batch_size=self.batch_size)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+            
+            with self._lock:
+                per_pair = elapsed_ms / len(misses)
+                self.ms_per_pair = per_pair if self.ms_per_pair is None else 0.8 * self.ms_per_pair + 0.2 * per_pair
+                for key, score in zip(misses, predicted):
+                    scores[key] = float(score)
+                    if self.cache_size > 0:
+                        self._cache[key] = float(score)
+                        self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        
+        with self._lock:
+            self.reranked += len(queries)
+        return [
+            sorted(range(len(query_keys)), key=lambda i: scores[query_keys[i]], reverse=True)[:top_n]
+            for query_keys in keys
+        ]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Pair score cache counters and how often reranking was skipped."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'cache_size': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'reranked': self.reranked,
+                'skipped': self.skipped,
+                'ms_per_pair': self.ms_per_pair,
+            }
@@ -1,36 +1,95 @@
 """Retriever module for semantic search over vector store."""
 
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
 
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain.schema import Document
 
+from ann_index import set_search_params
+from bm25 import BM25Index, reciprocal_rank_fusion
+from chunk_store import ChunkStore, has_store, open_index
 from config import settings
+from embeddings import CachedEmbeddings, EmbeddingBatcher
+from metrics import metrics
+from startup import startup_timer
 
 
 class Retriever:
     """Handles semantic search and document retrieval."""
     
-    def __init__(self, vector_store_path: Path = None):
-        """Initialize retriever with vector store."""
+    def __init__(
+        self,
+        vector_store_path: Path = None,
+        embeddings=None,
+        nprobe: int = None,
+        ef_search: int = None,
+        mode: str = None,
+        reranker=None
+    ):
+        """Initialize retriever with vector store, ANN search parameters, mode (dense/hybrid) and reranker."""
         if vector_store_path is None:
             vector_store_path = settings.vector_store_dir
+        self.mode = mode if mode is not None else settings.retrieval_mode
+        if self.mode not in ('dense', 'hybrid'):
+            raise ValueError(f"Unknown retrieval mode: {self.mode}")
+        
+        if embeddings is None:
+            # Deferred: importing sentence-transformers pulls in torch
+            with startup_timer.phase("import embedding backend"):
+                from langchain_huggingface import HuggingFaceEmbeddings
+            with startup_timer.phase("load embedding model"):
+                embeddings = HuggingFaceEmbeddings(
+                    model_name=settings.embedding_model,
+                    model_kwargs={'device': 'cpu'},
+                    encode_kwargs={'normalize_embeddings': True, 'batch_size': settings.embed_batch_size}
+                )
+            if settings.embed_batching:
+                embeddings = EmbeddingBatcher(
+                    embeddings,
+                    max_batch_size=settings.embed_batch_size,
+                    max_wait_ms=settings.embed_batch_wait_ms
+                )
+        self.batcher = embeddings if isinstance(embeddings, EmbeddingBatcher) else None
+        # Repeated questions skip the transformer forward pass
+        self.embeddings = CachedEmbeddings(embeddings, max_size=settings.query_cache_size)
         
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=settings.embedding_model,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True, 'batch_size': 8}
-        )
+        if reranker is None and settings.rerank_enabled:
+            from reranker import CrossEncoderReranker
+            with startup_timer.phase("load reranker"):
+                reranker = CrossEncoderReranker(
+                    settings.rerank_model,
+                    cache_size=settings.rerank_cache_size,
+                    budget_ms=settings.rerank_budget_ms,
+                    max_concurrent=settings.rerank_max_concurrent
+                )
+        self.reranker = reranker
         
         # Load vector store
         try:
-            self.vector_store = FAISS.load_local(
-                str(vector_store_path),
-                self.embeddings,
-                allow_dangerous_deserialization=True
-            )
+            with startup_timer.phase("load vector store"):
+                if not has_store(vector_store_path):
+                    raise FileNotFoundError(
+                        "no chunk store found (stores from older versions need 'python src/ingest.py --full')"
+                    )
+                # Opening is O(1): pages are read on demand and shared between workers
+                self.index = open_index(vector_store_path, use_mmap=settings.mmap_index)
+                self.chunks = ChunkStore(vector_store_path, use_mmap=settings.mmap_index)
+                if len(self.chunks) != self.index.ntotal:
+                    raise ValueError("chunk store and index sizes differ; re-run ingestion")
+                self.set_search_params(
+                    nprobe=nprobe if nprobe is not None else settings.ivf_nprobe,
+                    ef_search=ef_search if ef_search is not None else settings.hnsw_ef_search
+                )
+                
+                self.bm25 = None
+                if self.mode == 'hybrid':
+                    if BM25Index.exists(vector_store_path):
+                        self.bm25 = BM25Index.load(vector_store_path, use_mmap=settings.mmap_index)
+                    else:
+                        print("⚠️  No BM25 index in the vector store (re-run ingestion), using dense retrieval")
+                        self.mode = 'dense'
             print(f"✓ Loaded vector store from {vector_store_path}")
         except Exception as e:
             raise RuntimeError(
@@ -38,22 +97,116 @@ class Retriever:
                 f"Please run 'python src/ingest.py' first. Error: {e}"
             )
     
+    def set_search_params(self, nprobe: int = None, ef_search: int = None):
+        """Set IVF nprobe / HNSW efSearch (ignored by index types without them)."""
+        set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+    
+    @property
+    def default_k(self) -> int:
+        """Chunks returned when k is not given (fewer when a reranker picks them)."""
+        return settings.rerank_top_n if self.reranker is not None else settings.top_k
+    
     def retrieve(self, query: str, k: int = None) -> List[Document]:
         """Retrieve top-k most relevant document chunks."""
         if k is None:
-            k = settings.top_k
+            k = self.default_k
         
-        # Perform similarity search
-        docs = self.vector_store.similarity_search(query, k=k)
+        _, docs = self.retrieve_with_ids(query, k=k)
         return docs
     
+    def retrieve_with_ids(self, query: str, k: int = None) -> Tuple[List[str], List[Document]]:
+        """Retrieve top-k chunks together with their docstore ids."""
+        if k is None:
+            k = self.default_k
+        
+        with metrics.span("embed"):
+            vector = np.array([self.embeddings.embed_query(query)], dtype=np.float32)
+        return self._rerank([query], [self._lookup(self._search([query], vector, self._depth(k))[0])], k)[0]
+    
+    def retrieve_batch(self, queries: List[str], k: int = None) -> List[Tuple[List[str], List[Document]]]:
+        """Retrieve top-k chunks for many queries with one encode and one search."""
+        if k is None:
+            k = self.default_k
+        if not queries:
+            return []
+        
+        with metrics.span("embed"):
+            vectors = self.embeddings.embed_queries(queries)
+        candidates = [self._lookup(positions) for positions in self._search(queries, vectors, self._depth(k))]
+        return self._rerank(queries, candidates, k)
+    
+    def _depth(self, k: int) -> int:
+        """Candidates to retrieve for a final top-k."""
+        return max(k, settings.rerank_candidates) if self.reranker is not None else k
+    
+    def _rerank(
+        self,
+        queries: List[str],
+        candidates: List[Tuple[List[str], List[Document]]],
+        k: int
+    ) -> List[Tuple[List[str], List[Document]]]:
+        """Keep the reranker's top-k of each candidate list (all pairs scored in one pass)."""
+        if self.reranker is None:
+            return candidates
+        
+        with metrics.span("rerank"):
+            orders = self.reranker.rerank_batch(
+                queries, [ids for ids, _ in candidates], [docs for _, docs in candidates], k
+            )
+        return [
+            ([ids[i] for i in order], [docs[i] for i in order])
+            for (ids, docs), order in zip(candidates, orders)
+        ]
+    
+    def _search(self, queries: List[str], vectors: np.ndarray, k: int) -> List[List[int]]:
+        """Top-k chunk positions per query: dense, or dense and BM25 fused by RRF."""
+        if self.mode == 'dense':
+            with metrics.span("search"):
+                _, indices = self.index.search(vectors, k)
+            return indices.tolist()
+        
+        depth = max(k, settings.hybrid_candidates)
+        with metrics.span("search"):
+            _, dense = self.index.search(vectors, depth)
+        with metrics.span("bm25"):
+            return [
+                reciprocal_rank_fusion([dense_row, self.bm25.search(query, depth)[1]], k, rrf_k=settings.rrf_k)
+                for query, dense_row in zip(queries, dense)
+            ]
+    
+    def _lookup(self, positions) -> Tuple[List[str], List[Document]]:
+        """Map FAISS result positions to chunk ids and documents."""
+        ids, docs = [], []
+        for i in positions:
+            if i == -1:
+                # Fewer than k chunks in the index
+                continue
+            doc_id, doc = self.chunks.lookup(int(i))
+            ids.append(doc_id)
+            docs.append(doc)
+        return ids, docs
+    
     def retrieve_with_scores(self, query: str, k: int = None) -> List[tuple[Document, float]]:
-        """Retrieve top-k most relevant chunks with similarity scores."""
+        """Retrieve top-k most relevant chunks with L2 distance scores (dense search only)."""
         if k is None:
             k = settings.top_k
         
-        docs_with_scores = self.vector_store.similarity_search_with_score(query, k=k)
-        return docs_with_scores
+        vector = np.array([self.embeddings.embed_query(query)], dtype=np.float32)
+        distances, indices = self.index.search(vector, k)
+        _, docs = self._lookup(indices[0])
+        return list(zip(docs, (float(d) for d, i in zip(distances[0], indices[0]) if i != -1)))
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Query embedding cache statistics."""
+        return self.embeddings.stats()
+    
+    def batch_stats(self) -> Dict[str, Any]:
+        """Query embedding micro-batch statistics (empty when batching is off)."""
+        return self.batcher.stats() if self.batcher is not None else {}
+    
+    def rerank_stats(self) -> Dict[str, Any]:
+        """Reranker pair cache and skip statistics (empty when reranking is off)."""
+        return self.reranker.stats() if self.reranker is not None else {}
     
     def format_sources(self, documents: List[Document]) -> List[Dict[str, Any]]:
         """Format retrieved documents as source citations."""
@@ -0,0 +1,164 @@
+"""Query safety classification with a precompiled multi-phrase matcher.
+
+All phrases of all categories are compiled into one regular expression shaped
+like a trie, so a query is scanned once in C whatever the number of phrases,
+instead of one substring test per phrase. The scan reports a match at every
+position (phrases may overlap) and the highest priority category wins.
+
+Extra phrases (e.g. other languages) can be added from a JSON file mapping
+category to a list of phrases, see settings.safety_phrases_path.
+"""
+
+import json
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+EMERGENCY = "emergency"
+PERSONAL_ADVICE = "personal_advice"
+
+# Categories in priority order
+DEFAULT_PHRASES: Dict[str, List[str]] = {
+    EMERGENCY: [
+        "emergency", "urgent", "heart attack", "stroke", "bleeding heavily",
+        "can't breathe", "unconscious", "severe pain", "suicide", "overdose",
+        "choking", "seizure"
+    ],
+    PERSONAL_ADVICE: [
+        "should i take", "what should i do", "am i", "do i have",
+        "diagnose me", "treat my", "my symptoms"
+    ],
+}
+
+WARNINGS: Dict[str, str] = {
+    EMERGENCY: """🚨 **EMERGENCY ALERT** 🚨
+
+If you or someone else is experiencing a medical emergency:
+- Call emergency services immediately (911 in US, 112 in EU, or your local emergency number)
+- Do not wait for online medical information
+- Get immediate professional medical help
+
+This chatbot is NOT designed for emergency situations and cannot replace emergency medical services.""",
+    PERSONAL_ADVICE: """⚠️ **Personal Medical Advice Warning** ⚠️
+
+I can provide general medical information from my knowledge base, but I cannot:
+- Diagnose your specific condition
+- Prescribe treatments
+- Give personalized medical advice
+
+Please consult with a qualified healthcare provider who can:
+- Examine you properly
+- Review your medical history
+- Provide appropriate diagnosis and treatment
+
+Would you like general information about a medical topic instead?""",
+}
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_QUOTES = str.maketrans({"\u2019": "'", "\u2018": "'", "\u02bc": "'"})
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold and normalize Unicode, apostrophes and whitespace."""
+    text = unicodedata.normalize("NFKC", text).translate(_QUOTES).casefold()
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+@dataclass(frozen=True)
+class SafetyVerdict:
+    """Outcome of one classification; category is None for a safe query."""
+    category: Optional[str] = None
+    phrase: Optional[str] = None
+    
+    @property
+    def warning(self) -> str:
+        """Warning text to show instead of an answer, or "" if safe."""
+        return WARNINGS.get(self.category, "") if self.category else ""
+
+
+class SafetyClassifier:
+    """Substring match of a query against phrase lists, by category priority."""
+    
+    def __init__(self, phrases: Dict[str, Iterable[str]]):
+        self.priority = {category: rank for rank, category in enumerate(phrases)}
+        self._category: Dict[str, str] = {}
+        for category, category_phrases in phrases.items():
+            for phrase in category_phrases:
+                phrase = normalize_text(phrase)
+                if phrase and (phrase not in self._category or self._outranks(category, self._category[phrase])):
+                    self._category[phrase] = category
+        
+        # The regex reports the longest phrase starting at each position; a
+        # shorter phrase that is its prefix may belong to a better category
+        self._best: Dict[str, str] = {}
+        for phrase in self._category:
+            best = self._category[phrase]
+            for end in range(1, len(phrase)):
+                prefix_category = self._category.get(phrase[:end])
+                if prefix_category and self._outranks(prefix_category, best):
+                    best = prefix_category
+            self._best[phrase] = best
+        
+        # Zero-width lookahead: finditer tries every start position, so overlapping matches are seen
+        self.pattern = re.compile(f"(?=({_trie_regex(self._category)}))") if self._category else None
+    
+    @classmethod
+    def from_file(cls, path: Optional[Path] = None) -> "SafetyClassifier":
+        """Default phrases plus those of a JSON file {category: [phrases]}, if given."""
+        phrases = {category: list(values) for category, values in DEFAULT_PHRASES.items()}
+        if path:
+            with open(path, 'r', encoding='utf-8') as f:
+                for category, values in json.load(f).items():
+                    phrases.setdefault(category, []).extend(values)
+        return cls(phrases)
+    
+    def __len__(self) -> int:
+        return len(self._category)
+    
+    def classify(self, query: str) -> SafetyVerdict:
+        if self.pattern is None:
+            return SafetyVerdict()
+        top = next(iter(self.priority))
+        verdict = SafetyVerdict()
+        for match in self.pattern.finditer(normalize_text(query)):
+            phrase = match.group(1)
+            category = self._best[phrase]
+            if verdict.category is None or self._outranks(category, verdict.category):
+                verdict = SafetyVerdict(category, phrase)
+                if category == top:
+                    break
+        return verdict
+    
+    def _outranks(self, category: str, other: str) -> bool:
+        return self.priority[category] < self.priority[other]
+
+
+def _trie_regex(phrases: Iterable[str]) -> str:
+    """Regex matching any phrase, longest first, with one branch per distinct next character."""
+    trie: dict = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        # Optional group is tried before stopping here, so longer phrases win
+        return group + "?" if "" in node else group
+    
+    return build(trie)
+
+
+@lru_cache(maxsize=None)
+def get_classifier(path: str = "") -> SafetyClassifier:
+    """Shared classifier, compiled once per phrase file."""
+    return SafetyClassifier.from_file(Path(path) if path else None)
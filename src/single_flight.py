@@ -0,0 +1,76 @@
+"""Single-flight coalescing of identical in-flight calls."""
+
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Shares one in-progress call among concurrent callers with the same key.
+    
+    The first caller for a key (the leader) runs the call; callers arriving
+    while it runs wait for its outcome instead of repeating the work. The key
+    is forgotten as soon as the call finishes, so nothing is served after the
+    fact and there is no staleness window. Followers receive a deep copy of
+    the result and see the leader's exception if it fails.
+    
+    do() is for threads, ado() for coroutines on one event loop; the two do
+    not share calls with each other.
+    """
+    
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls: Dict[Hashable, Future] = {}
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._lock = threading.Lock()
+    
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            return copy.deepcopy(future.result())
+        
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+    
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(key)
+        if task is not None and task.get_loop() is loop:
+            self.coalesced += 1
+            # Shielded: a follower that disconnects must not cancel the shared call
+            return copy.deepcopy(await asyncio.shield(task))
+        
+        task = loop.create_task(fn())
+        self._tasks[key] = task
+        self.leaders += 1
+        task.add_done_callback(lambda done: self._tasks.pop(key, None) if self._tasks.get(key) is done else None)
+        return await asyncio.shield(task)
+    
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.coalesced
+        return {
+            'in_flight': len(self._calls) + len(self._tasks),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'coalesced_ratio': self.coalesced / calls if calls else 0.0,
+        }
@@ -0,0 +1,103 @@
+"""Startup timing and background initialization."""
+
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class StartupTimer:
+    """Records how long each startup phase takes."""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ready_at: Optional[float] = None
+        self.phases: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def phase(self, name: str):
+        """Time a named startup phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases.append((name, time.perf_counter() - start))
+    
+    def mark_ready(self):
+        """Record the moment the system became ready to serve."""
+        self.ready_at = time.perf_counter()
+    
+    def report(self) -> Dict[str, Any]:
+        """Startup breakdown in seconds."""
+        with self._lock:
+            phases = {name: round(seconds, 3) for name, seconds in self.phases}
+        return {
+            'phases': phases,
+            'time_to_ready': round(self.ready_at - self.started, 3) if self.ready_at else None,
+        }
+    
+    def print_report(self):
+        """Print the startup breakdown."""
+        report = self.report()
+        print("\n⏱️  Startup time breakdown:")
+        for name, seconds in report['phases'].items():
+            print(f"   {name:<28}{seconds:>8.2f}s")
+        if report['time_to_ready'] is not None:
+            print(f"   {'ready after':<28}{report['time_to_ready']:>8.2f}s\n")
+
+
+class BackgroundInitializer:
+    """Builds an object on a background thread and reports its state.
+    
+    State is 'idle' until start(), then 'warming', then 'ready' or 'failed'.
+    """
+    
+    def __init__(self, factory: Callable[[], Any], name: str = "system"):
+        self.factory = factory
+        self.name = name
+        self.value: Any = None
+        self.error: Optional[str] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        if self._thread is None:
+            return 'idle'
+        if not self._ready.is_set():
+            return 'warming'
+        return 'failed' if self.error is not None else 'ready'
+    
+    def start(self) -> "BackgroundInitializer":
+        """Start building in the background (idempotent)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-init", daemon=True)
+                self._thread.start()
+        return self
+    
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """Wait for the object and return it, raising if initialization failed."""
+        self.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError(f"{self.name} is still warming up")
+        if self.error is not None:
+            raise RuntimeError(f"{self.name} failed to initialize: {self.error}")
+        return self.value
+    
+    def _run(self):
+        try:
+            self.value = self.factory()
+        except Exception as e:
+            self.error = str(e)
+            traceback.print_exc()
+        finally:
+            self._ready.set()
+
+
+# Process-wide startup timer
+startup_timer = StartupTimer()
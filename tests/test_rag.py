@@ -1,5 +1,9 @@
 """Unit tests for Medical RAG Chatbot."""
 
+import asyncio
+import time
+
+import numpy as np
 import pytest
 from pathlib import Path
 import sys
@@ -9,6 +13,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from config import settings
 from langchain.schema import Document
+from langchain_community.embeddings import DeterministicFakeEmbedding
 
 
 class TestChunking:
@@ -34,6 +39,1339 @@ class TestChunking:
             assert len(chunk.page_content) <= settings.chunk_size + settings.chunk_overlap
 
 
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic offline embeddings that count embedded texts."""
+    
+    size: int = 32
+    embedded: int = 0
+    queries: int = 0
+    
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+    
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+
+class TestIncrementalIngest:
+    """Test manifest-based incremental ingestion."""
+    
+    def _write(self, directory, name, text):
+        (directory / name).write_text(text, encoding='utf-8')
+    
+    def test_only_changed_files_are_embedded(self, tmp_path):
+        """Unchanged files are skipped, changed and removed files are replaced."""
+        from ingest import DocumentIngester, IngestManifest, MANIFEST_NAME
+        
+        raw, store = tmp_path / "raw", tmp_path / "store"
+        raw.mkdir()
+        store.mkdir()
+        self._write(raw, "a.txt", "Diabetes affects blood sugar. " * 10)
+        self._write(raw, "b.txt", "Hypertension is high blood pressure. " * 10)
+        
+        embeddings = CountingEmbeddings()
+        ingester = DocumentIngester(embeddings=embeddings)
+        
+        store_a = ingester.ingest(data_dir=raw, store_path=store)
+        first = embeddings.embedded
+        assert first > 0
+        
+        # Nothing changed: nothing is embedded
+        ingester.ingest(data_dir=raw, store_path=store)
+        assert embeddings.embedded == first
+        
+        # One file changed, one removed
+        self._write(raw, "a.txt", "Type 2 diabetes is linked to insulin resistance.")
+        (raw / "b.txt").unlink()
+        vector_store = ingester.ingest(data_dir=raw, store_path=store)
+        assert embeddings.embedded == first + 1
+        
+        manifest = IngestManifest.load(store / MANIFEST_NAME)
+        assert set(manifest.files) == {"a.txt"}
+        entry = manifest.files["a.txt"]
+        assert entry['faiss_ids'] == [0]
+        assert vector_store.index.ntotal == 1
+        assert vector_store.index_to_docstore_id[0] == entry['chunk_ids'][0]
+    
+    def test_settings_change_invalidates_manifest(self):
+        """Manifests built with other chunking settings are not reused."""
+        from ingest import IngestManifest
+        
+        manifest = IngestManifest(settings_key={'chunk_size': -1})
+        assert not manifest.is_compatible()
+        assert IngestManifest().is_compatible()
+
+
+def write_text_pdf(path, page_texts):
+    """Write a minimal PDF with one line of text per page."""
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+    
+    font = DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    })
+    writer = PdfWriter()
+    for text in page_texts:
+        page = writer.add_blank_page(width=300, height=100)
+        stream = DecodedStreamObject()
+        stream.set_data(f"BT /F1 12 Tf 10 50 Td ({text}) Tj ET".encode())
+        page[NameObject('/Contents')] = writer._add_object(stream)
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})
+        })
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+class TestParallelExtraction:
+    """Test process-pool PDF extraction."""
+    
+    def test_parallel_matches_sequential_page_order(self, tmp_path, monkeypatch):
+        """Page ranges from several workers are reassembled in page order."""
+        import ingest
+        from ingest import DocumentIngester
+        
+        monkeypatch.setattr(ingest, "PDF_PAGES_PER_TASK", 2)
+        write_text_pdf(tmp_path / "a.pdf", [f"Alpha page {i}" for i in range(1, 8)])
+        write_text_pdf(tmp_path / "b.pdf", [f"Beta page {i}" for i in range(1, 4)])
+        (tmp_path / "c.txt").write_text("Plain text file", encoding='utf-8')
+        
+        def load(workers):
+            ingester = DocumentIngester(embeddings=CountingEmbeddings(), workers=workers)
+            return ingester.load_documents(tmp_path)
+        
+        sequential, parallel = load(1), load(3)
+        
+        assert [d.page_content for d in parallel] == [d.page_content for d in sequential]
+        assert [d.metadata for d in parallel] == [d.metadata for d in sequential]
+        assert [d.metadata.get('page') for d in parallel[:7]] == list(range(1, 8))
+
+
+class TestStreamingIngest:
+    """Test the generator-based ingest pipeline."""
+    
+    def test_stream_matches_list_pipeline(self, tmp_path):
+        """load -> split as generators yields the same chunks as the list methods."""
+        from ingest import DocumentIngester
+        
+        write_text_pdf(tmp_path / "a.pdf", [f"Renal page {i}" for i in range(1, 5)])
+        (tmp_path / "b.txt").write_text("Cardiac output. " * 200, encoding='utf-8')
+        
+        ingester = DocumentIngester(embeddings=CountingEmbeddings())
+        files = ingester.list_files(tmp_path)
+        
+        listed = ingester.chunk_documents(ingester.load_documents(tmp_path))
+        streamed = list(ingester.iter_chunks(ingester.iter_documents(files)))
+        
+        assert [c.page_content for c in streamed] == [c.page_content for c in listed]
+        assert [c.metadata for c in streamed] == [c.metadata for c in listed]
+    
+    def test_memory_limit_shrinks_batches(self, monkeypatch):
+        """Batches flush early and shrink while RSS is above the limit."""
+        import ingest
+        from ingest import DocumentIngester, MIN_EMBED_BATCH_SIZE
+        
+        monkeypatch.setattr(ingest, "current_rss_mb", lambda: 10_000.0)
+        ingester = DocumentIngester(embeddings=CountingEmbeddings(), batch_size=100, memory_limit_mb=512)
+        items = ((str(i), Document(page_content=f"chunk {i}")) for i in range(200))
+        
+        batches = list(ingester.iter_embedded_batches(items))
+        sizes = [len(ids) for ids, _, _ in batches]
+        
+        assert sum(sizes) == 200
+        assert max(sizes) < 100
+        assert sizes[-2] == MIN_EMBED_BATCH_SIZE
+        assert all(matrix.shape == (len(ids), 32) for ids, _, matrix in batches)
+
+
+class TestQueryEmbeddingCache:
+    """Test the query embedding LRU cache."""
+    
+    def test_normalized_repeats_hit_cache(self):
+        """Case and whitespace variants of a query reuse one embedding."""
+        from embeddings import CachedEmbeddings
+        
+        base = CountingEmbeddings()
+        cached = CachedEmbeddings(base, max_size=2)
+        
+        first = cached.embed_query("What are the symptoms of diabetes?")
+        second = cached.embed_query("  what are the symptoms   of DIABETES? ")
+        
+        assert first == second
+        assert base.queries == 1
+        assert cached.stats()['hits'] == 1
+        assert cached.stats()['misses'] == 1
+    
+    def test_lru_eviction(self):
+        """The least recently used query is evicted at capacity."""
+        from embeddings import CachedEmbeddings
+        
+        cached = CachedEmbeddings(CountingEmbeddings(), max_size=2)
+        cached.embed_query("a")
+        cached.embed_query("b")
+        cached.embed_query("a")
+        cached.embed_query("c")
+        
+        assert list(cached._cache) == ["a", "c"]
+        assert cached.stats()['size'] == 2
+    
+    def test_miss_embeds_original_text(self):
+        """Normalization only builds the cache key; the model sees the query as typed."""
+        from embeddings import CachedEmbeddings
+        
+        class RecordingEmbeddings(CountingEmbeddings):
+            texts: list = []
+            
+            def embed_documents(self, texts):
+                self.texts.extend(texts)
+                return super().embed_documents(texts)
+            
+            def embed_query(self, text):
+                self.texts.append(text)
+                return super().embed_query(text)
+        
+        base = RecordingEmbeddings(texts=[])
+        cached = CachedEmbeddings(base)
+        single = cached.embed_query("Is HbA1c  raised in Type 2 DM?")
+        batch = cached.embed_queries(["ACE inhibitors", "is hba1c raised in type 2 dm?", "ace INHIBITORS"])
+        
+        assert base.texts == ["Is HbA1c  raised in Type 2 DM?", "ACE inhibitors"]
+        assert batch[1].tolist() == pytest.approx(single)
+        assert batch[0].tolist() == batch[2].tolist()
+
+
+class TestEmbeddingBatcher:
+    """Test the query embedding micro-batcher."""
+    
+    def test_concurrent_queries_share_forward_pass(self):
+        """Concurrent queries are encoded together and each caller gets its own vector."""
+        from concurrent.futures import ThreadPoolExecutor
+        from embeddings import EmbeddingBatcher
+        
+        class Recording(CountingEmbeddings):
+            batches: list = []
+            
+            def embed_documents(self, texts):
+                self.batches.append(len(texts))
+                return super().embed_documents(texts)
+        
+        base = Recording()
+        batcher = EmbeddingBatcher(base, max_batch_size=8, max_wait_ms=50)
+        texts = [f"question {i % 12}" for i in range(16)]
+        
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            vectors = list(pool.map(batcher.embed_query, texts))
+        batcher.close()
+        
+        assert vectors == [CountingEmbeddings().embed_query(text) for text in texts]
+        assert len(base.batches) < len(texts)
+        assert max(base.batches) <= 8
+        assert batcher.stats()['embedded'] == 16
+        assert base.queries == 0
+    
+    def test_errors_reach_every_caller(self):
+        """A failed forward pass fails each query in the batch, and the batcher keeps serving."""
+        from embeddings import EmbeddingBatcher
+        
+        class Flaky(CountingEmbeddings):
+            def embed_documents(self, texts):
+                if any("boom" in text for text in texts):
+                    raise RuntimeError("encoder failed")
+                return super().embed_documents(texts)
+        
+        batcher = EmbeddingBatcher(Flaky(), max_wait_ms=0)
+        with pytest.raises(RuntimeError, match="encoder failed"):
+            batcher.embed_query("boom")
+        assert len(batcher.embed_query("fine")) == 32
+        batcher.close()
+
+
+class StubLLM:
+    """Offline LLM test double that counts generations."""
+    
+    def __init__(self, delay: float = 0.0):
+        self.calls = 0
+        self.delay = delay
+    
+    def check_query_safety(self, query):
+        return ""
+    
+    def _fallback_response(self):
+        return "fallback"
+    
+    def generate_answer(self, query, retrieved_docs, safety_warning=None):
+        self.calls += 1
+        return {"answer": f"answer #{self.calls}", "sources": [], "warning": False}
+    
+    async def agenerate_answer(self, query, retrieved_docs, safety_warning=None):
+        await asyncio.sleep(self.delay)
+        return self.generate_answer(query, retrieved_docs, safety_warning)
+    
+    def stream_answer(self, query, retrieved_docs, safety_warning=None):
+        answer = self.generate_answer(query, retrieved_docs, safety_warning)['answer']
+        yield from answer.partition(" ")
+    
+    async def astream_answer(self, query, retrieved_docs, safety_warning=None):
+        for token in self.stream_answer(query, retrieved_docs, safety_warning):
+            await asyncio.sleep(self.delay)
+            yield token
+
+
+@pytest.fixture
+def offline_rag(tmp_path):
+    """RAGSystem over a small on-disk index with offline embeddings and LLM."""
+    from ingest import DocumentIngester
+    from retriever import Retriever
+    from rag import RAGSystem
+    from answer_cache import SemanticAnswerCache
+    from single_flight import SingleFlight
+    
+    raw, store = tmp_path / "raw", tmp_path / "store"
+    raw.mkdir()
+    store.mkdir()
+    for name, text in [
+        ("diabetes.txt", "Diabetes symptoms include increased thirst and frequent urination."),
+        ("hypertension.txt", "Hypertension is high blood pressure that can lead to heart disease."),
+        ("cold.txt", "The common cold is a viral infection of the upper respiratory tract."),
+    ]:
+        (raw / name).write_text(text, encoding='utf-8')
+    DocumentIngester(embeddings=CountingEmbeddings()).ingest(data_dir=raw, store_path=store)
+    
+    rag = RAGSystem.__new__(RAGSystem)
+    rag.retriever = Retriever(store, embeddings=CountingEmbeddings())
+    rag.llm = StubLLM()
+    rag.answer_cache = SemanticAnswerCache(path=tmp_path / "answer_cache.json", threshold=0.99)
+    rag.single_flight = SingleFlight()
+    return rag
+
+
+class TestSemanticAnswerCache:
+    """Test the semantic answer cache."""
+    
+    def test_repeat_question_skips_llm(self, offline_rag):
+        """A repeated question with the same sources reuses the cached answer."""
+        first = offline_rag.query("What are the symptoms of diabetes?", top_k=2)
+        second = offline_rag.query("what are the symptoms of  diabetes?", top_k=2)
+        
+        assert offline_rag.llm.calls == 1
+        assert second['answer'] == first['answer']
+        assert second.get('cached') is True
+        assert [s['source'] for s in second['sources']] == [s['source'] for s in first['sources']]
+    
+    def test_safety_flagged_question_skips_cache(self, offline_rag):
+        """A flagged question whose embedding matches a cached one still goes to the LLM with its warning."""
+        question = "What are the symptoms of diabetes?"
+        offline_rag.query(question, top_k=2)
+        
+        warnings = []
+        offline_rag.llm.check_query_safety = lambda query: "🚨 emergency"
+        generate = offline_rag.llm.generate_answer
+        offline_rag.llm.generate_answer = lambda query, docs, safety_warning=None: (
+            warnings.append(safety_warning) or generate(query, docs, safety_warning)
+        )
+        
+        flagged = offline_rag.query(question, top_k=2)
+        batched = offline_rag.query_batch([question], top_k=2)[0]
+        
+        assert warnings == ["🚨 emergency", "🚨 emergency"]
+        assert flagged.get('cached') is None and batched.get('cached') is None
+        assert flagged['warning'] == "🚨 emergency"
+    
+    def test_different_sources_miss(self):
+        """Similar queries that retrieved other chunks do not hit."""
+        from answer_cache import SemanticAnswerCache
+        
+        cache = SemanticAnswerCache(threshold=0.9)
+        cache.store([1.0, 0.0], ["a", "b"], "cached")
+        
+        assert cache.lookup([1.0, 0.01], ["b", "a"]) == ("cached", ["a", "b"])
+        assert cache.lookup([1.0, 0.01], ["a", "c"]) is None
+        assert cache.lookup([0.0, 1.0], ["a", "b"]) is None
+    
+    def test_namespace_follows_active_backend(self, offline_rag, tmp_path, monkeypatch):
+        """Answers persisted under one LLM backend are not loaded under another."""
+        from llm_base import create_llm
+        from rag import RAGSystem
+        
+        monkeypatch.setattr(settings, "answer_cache_path", tmp_path / "shared_cache.json")
+        stub = RAGSystem(retriever=offline_rag.retriever, llm=create_llm("stub"))
+        stub.query("What are the symptoms of diabetes?", top_k=2)
+        stub.answer_cache.save()
+        stub.llm.engine.close()
+        assert stub.answer_cache.stats()['size'] == 1
+        
+        other = StubLLM()
+        other.backend, other.model = "huggingface", settings.hf_model
+        hf = RAGSystem(retriever=offline_rag.retriever, llm=other)
+        
+        assert stub._cache_namespace().startswith("stub:")
+        assert hf._cache_namespace() == f"huggingface:{settings.hf_model}|{settings.embedding_model}"
+        assert hf.answer_cache.stats()['size'] == 0
+    
+    def test_ttl_and_persistence(self, tmp_path, monkeypatch):
+        """Entries survive a reload and expire after the TTL."""
+        import answer_cache
+        from answer_cache import SemanticAnswerCache
+        
+        path = tmp_path / "cache.json"
+        cache = SemanticAnswerCache(path=path, ttl=60)
+        cache.store([0.6, 0.8], ["a"], "persisted")
+        cache.save()
+        
+        reloaded = SemanticAnswerCache(path=path, ttl=60)
+        assert reloaded.lookup([0.6, 0.8], ["a"]) == ("persisted", ["a"])
+        
+        now = answer_cache.time.time()
+        monkeypatch.setattr(answer_cache.time, "time", lambda: now + 120)
+        assert reloaded.lookup([0.6, 0.8], ["a"]) is None
+        assert reloaded.stats()['size'] == 0
+        assert reloaded.stats()['expired'] == 1
+    
+    def test_capacity_evicts_least_recently_used(self):
+        """A full cache drops the entry hit least recently and counts the eviction."""
+        from answer_cache import SemanticAnswerCache
+        
+        cache = SemanticAnswerCache(max_size=2)
+        cache.store([1.0, 0.0], ["a"], "first")
+        cache.store([0.0, 1.0], ["b"], "second")
+        cache.lookup([1.0, 0.0], ["a"])
+        cache.store([0.6, 0.8], ["c"], "third")
+        
+        assert cache.lookup([0.0, 1.0], ["b"]) is None
+        assert cache.lookup([1.0, 0.0], ["a"]) == ("first", ["a"])
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['evictions']) == (2, 1, 1)
+
+
+class TestAsyncQuery:
+    """Test the non-blocking query path."""
+    
+    def test_concurrent_queries_overlap(self, offline_rag):
+        """Concurrent aquery calls wait on the LLM at the same time."""
+        offline_rag.answer_cache = None
+        offline_rag.llm = StubLLM(delay=0.3)
+        questions = ["diabetes", "hypertension", "cold", "heart disease"]
+        
+        async def run():
+            return await asyncio.gather(*(offline_rag.aquery(q, top_k=1) for q in questions))
+        
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+        
+        assert offline_rag.llm.calls == len(questions)
+        assert [r['query'] for r in results] == questions
+        assert elapsed < 0.3 * len(questions) / 2
+
+
+class TestRequestCoalescing:
+    """Test single-flight coalescing of identical in-flight questions."""
+    
+    def test_concurrent_identical_questions_share_one_call(self, offline_rag):
+        """Identical questions share one LLM call; other parameters do not coalesce."""
+        offline_rag.answer_cache = None
+        offline_rag.llm = StubLLM(delay=0.2)
+        
+        async def run():
+            return await asyncio.gather(
+                *(offline_rag.aquery(q, top_k=1) for q in ["Flu symptoms?", "flu  SYMPTOMS?", "Flu symptoms?"]),
+                offline_rag.aquery("Flu symptoms?", top_k=2)
+            )
+        
+        results = asyncio.run(run())
+        
+        assert offline_rag.llm.calls == 2
+        assert results[0]['answer'] == results[1]['answer'] == results[2]['answer']
+        assert results[0] is not results[1]
+        assert [r['query'] for r in results] == ["Flu symptoms?", "flu  SYMPTOMS?", "Flu symptoms?", "Flu symptoms?"]
+        assert offline_rag.single_flight.stats()['coalesced'] == 2
+        assert offline_rag.single_flight.stats()['in_flight'] == 0
+    
+    def test_threaded_followers_keep_their_question(self, offline_rag):
+        """query() followers on other threads get the shared answer under their own question."""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        offline_rag.answer_cache = None
+        offline_rag.llm = StubLLM()
+        offline_rag.llm.generate_answer = lambda *args, g=offline_rag.llm.generate_answer: time.sleep(0.2) or g(*args)
+        questions = ["Flu symptoms?", "FLU symptoms?", "flu symptoms? "]
+        
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            results = list(pool.map(lambda q: offline_rag.query(q, top_k=1), questions))
+        
+        assert offline_rag.llm.calls == 1
+        assert [r['query'] for r in results] == questions
+        assert len({r['answer'] for r in results}) == 1
+    
+    def test_threads_share_result_and_errors(self):
+        """Followers on other threads get the leader's result or exception; finished keys are not reused."""
+        from concurrent.futures import ThreadPoolExecutor
+        from single_flight import SingleFlight
+        
+        flight = SingleFlight()
+        calls = []
+        
+        def slow(value):
+            calls.append(value)
+            time.sleep(0.2)
+            if value == "bad":
+                raise ValueError(value)
+            return {"answer": value}
+        
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda _: flight.do("q", lambda: slow("ok")), range(4)))
+        assert calls == ["ok"]
+        assert all(r == {"answer": "ok"} for r in results)
+        
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(flight.do, "q", lambda: slow("bad")) for _ in range(2)]
+        assert all(isinstance(f.exception(), ValueError) for f in futures)
+        assert calls == ["ok", "bad"]
+
+
+class TestStreaming:
+    """Test token streaming."""
+    
+    def test_stream_query_events(self, offline_rag):
+        """Tokens concatenate to the final answer, which is then cached."""
+        events = list(offline_rag.stream_query("What are the symptoms of diabetes?", top_k=2))
+        
+        assert [e['type'] for e in events] == ['start', 'token', 'token', 'token', 'done']
+        assert len(events[0]['sources']) == 2
+        assert "".join(e['text'] for e in events if e['type'] == 'token') == events[-1]['answer']
+        
+        replay = list(offline_rag.stream_query("What are the symptoms of diabetes?", top_k=2))
+        assert replay[-1]['answer'] == events[-1]['answer']
+        assert replay[-1]['cached'] is True
+        assert offline_rag.llm.calls == 1
+    
+    def test_chat_stream_endpoint(self, offline_rag, monkeypatch):
+        """/chat/stream sends Server-Sent Events ending with the full answer."""
+        import json
+        import app_api
+        from fastapi.testclient import TestClient
+        
+        monkeypatch.setattr(app_api, "rag_system", offline_rag)
+        response = TestClient(app_api.app).post("/chat/stream", json={"query": "common cold", "top_k": 1})
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [
+            json.loads(line[len("data: "):])
+            for line in response.text.splitlines() if line.startswith("data: ")
+        ]
+        assert events[0]['type'] == 'start'
+        assert events[-1] == {
+            'type': 'done',
+            'answer': "answer #1",
+            'disclaimer': settings.medical_disclaimer,
+            'cached': False
+        }
+
+
+class TestBatchQuery:
+    """Test batched retrieval and batch answering."""
+    
+    def test_retrieve_batch_matches_single(self, offline_rag):
+        """One multi-query search returns the same chunks as per-query searches."""
+        retriever = offline_rag.retriever
+        queries = ["diabetes thirst", "blood pressure", "viral infection"]
+        
+        batched = retriever.retrieve_batch(queries, k=2)
+        retriever.embeddings.clear()
+        single = [retriever.retrieve_with_ids(q, k=2) for q in queries]
+        
+        assert [ids for ids, _ in batched] == [ids for ids, _ in single]
+    
+    def test_batch_endpoint_limits_concurrency(self, offline_rag, monkeypatch):
+        """/chat/batch answers in input order with at most `concurrency` LLM calls in flight."""
+        import app_api
+        from fastapi.testclient import TestClient
+        
+        in_flight, peak = 0, 0
+        llm = StubLLM()
+        
+        async def agenerate_answer(query, retrieved_docs, safety_warning=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.05)
+            in_flight -= 1
+            return {"answer": f"re: {query}", "sources": [], "warning": False}
+        
+        llm.agenerate_answer = agenerate_answer
+        offline_rag.llm = llm
+        offline_rag.answer_cache = None
+        monkeypatch.setattr(app_api, "rag_system", offline_rag)
+        
+        queries = [f"question {i}" for i in range(6)]
+        response = TestClient(app_api.app).post(
+            "/chat/batch", json={"queries": queries, "top_k": 1, "concurrency": 2}
+        )
+        
+        assert response.status_code == 200
+        results = response.json()['results']
+        assert [r['answer'] for r in results] == [f"re: {q}" for q in queries]
+        assert all(len(r['sources']) == 1 for r in results)
+        assert peak == 2
+
+
+class TestLazyStartup:
+    """Test deferred initialization and the startup report."""
+    
+    def test_importing_api_does_not_load_models(self):
+        """The API module imports without pulling in torch or the RAG stack."""
+        import subprocess
+        import sys
+        
+        code = "import sys; import app_api; print('torch' in sys.modules, 'rag' in sys.modules)"
+        src_dir = str(Path(__file__).parent.parent / "src")
+        out = subprocess.run([sys.executable, "-c", code], cwd=src_dir, capture_output=True, text=True, check=True)
+        assert out.stdout.split() == ["False", "False"]
+    
+    def test_health_reports_warming(self, offline_rag, monkeypatch):
+        """/health is 503 'warming' until the background build finishes."""
+        import threading
+        import app_api
+        from fastapi.testclient import TestClient
+        from startup import BackgroundInitializer
+        
+        release = threading.Event()
+        
+        def factory():
+            release.wait(5)
+            app_api.rag_system = offline_rag
+            return offline_rag
+        
+        monkeypatch.setattr(app_api, "rag_system", None)
+        monkeypatch.setattr(app_api, "rag_initializer", BackgroundInitializer(factory).start())
+        client = TestClient(app_api.app)
+        
+        response = client.get("/health")
+        assert response.status_code == 503
+        assert response.json()['status'] == "warming"
+        assert client.post("/chat", json={"query": "cold"}).status_code == 503
+        
+        release.set()
+        app_api.rag_initializer.get(timeout=5)
+        assert client.get("/health").json()['status'] == "healthy"
+    
+    def test_startup_timer_report(self):
+        """Phases are recorded by name and time to ready is reported."""
+        from startup import StartupTimer
+        
+        timer = StartupTimer()
+        with timer.phase("load"):
+            time.sleep(0.01)
+        assert timer.report()['time_to_ready'] is None
+        
+        timer.mark_ready()
+        report = timer.report()
+        assert report['phases']['load'] >= 0.01
+        assert report['time_to_ready'] >= report['phases']['load']
+
+
+class TestMmapStore:
+    """Test the memory-mapped index and chunk store."""
+    
+    def test_chunk_store_round_trip(self, tmp_path):
+        """Text and metadata are read back by position with their original types."""
+        from chunk_store import ChunkStore
+        
+        docs = [
+            Document(page_content="Fièvre et toux", metadata={'source': 'a.pdf', 'page': 1, 'file_type': 'pdf'}),
+            Document(page_content="", metadata={'source': 'b.csv', 'row': 2, 'dose': '5 mg', 'page': "ii"}),
+            Document(page_content="Blood pressure", metadata={}),
+            Document(page_content="Flu", metadata={'source': 'a.pdf', 'category': 'Infectious Disease', 'index': 0}),
+        ]
+        ChunkStore.write(tmp_path, ["a", "b", "c", "d"], docs)
+        store = ChunkStore(tmp_path)
+        
+        assert len(store) == 4
+        assert [store.lookup(i) for i in range(4)] == list(zip("abcd", docs))
+        assert store.strings == ['a.pdf', 'pdf', 'b.csv', 'Infectious Disease']
+    
+    def test_store_has_no_pickle(self, offline_rag, tmp_path):
+        """Ingest writes no pickle and the retriever searches the mmap'd matrix."""
+        from chunk_store import FlatVectorIndex
+        
+        store = tmp_path / "store"
+        assert not list(store.glob("*.pkl"))
+        
+        retriever = offline_rag.retriever
+        assert isinstance(retriever.index, FlatVectorIndex)
+        assert isinstance(retriever.index.vectors, np.memmap)
+        assert isinstance(retriever.chunks.meta, np.memmap)
+    
+    def test_search_matches_faiss_flat_index(self, offline_rag):
+        """In-place search returns the same chunks and distances as IndexFlatL2."""
+        import faiss
+        
+        retriever = offline_rag.retriever
+        index = faiss.IndexFlatL2(retriever.index.d)
+        index.add(np.asarray(retriever.index.vectors))
+        
+        for query in ["diabetes thirst", "blood pressure"]:
+            vector = np.array([retriever.embeddings.embed_query(query)], dtype=np.float32)
+            expected_distances, expected_positions = index.search(vector, 3)
+            actual = retriever.retrieve_with_scores(query, k=3)
+            assert [d.page_content for d, _ in actual] == [
+                retriever.chunks.text(int(i)) for i in expected_positions[0]
+            ]
+            assert np.allclose([s for _, s in actual], expected_distances[0], atol=1e-5)
+    
+    def test_incremental_ingest_reloads_store(self, offline_rag, tmp_path):
+        """A second ingest reads the chunk store back without re-embedding anything."""
+        from ingest import DocumentIngester
+        
+        embeddings = CountingEmbeddings()
+        vector_store = DocumentIngester(embeddings=embeddings).ingest(
+            data_dir=tmp_path / "raw", store_path=tmp_path / "store"
+        )
+        
+        assert embeddings.embedded == 0
+        ids, docs = offline_rag.retriever.retrieve_with_ids("common cold", k=3)
+        assert [vector_store.docstore.search(i) for i in ids] == docs
+
+
+class TestAnnIndex:
+    """Test approximate nearest neighbour index options."""
+    
+    def test_hnsw_store_matches_exact_search(self, offline_rag, tmp_path):
+        """Re-ingesting with an HNSW spec rebuilds only the index and keeps results."""
+        import faiss
+        from ingest import DocumentIngester
+        from retriever import Retriever
+        
+        expected = offline_rag.retriever.retrieve_with_ids("blood pressure", k=3)
+        embeddings = CountingEmbeddings()
+        store = tmp_path / "store"
+        DocumentIngester(embeddings=embeddings, index_type="HNSW16").ingest(data_dir=tmp_path / "raw", store_path=store)
+        
+        assert embeddings.embedded == 0
+        assert (store / "index.faiss").exists()
+        retriever = Retriever(store, embeddings=CountingEmbeddings(), ef_search=32)
+        assert isinstance(retriever.index, faiss.IndexHNSWFlat)
+        assert retriever.index.hnsw.efSearch == 32
+        assert retriever.retrieve_with_ids("blood pressure", k=3) == expected
+    
+    def test_untrainable_spec_falls_back_to_flat(self, tmp_path):
+        """IVF needs enough vectors to train; smaller corpora keep exact search."""
+        import json
+        from ingest import DocumentIngester
+        
+        (tmp_path / "raw").mkdir()
+        (tmp_path / "raw" / "a.txt").write_text("Asthma narrows the airways.", encoding='utf-8')
+        store = tmp_path / "store"
+        DocumentIngester(embeddings=CountingEmbeddings(), index_type="IVF64,PQ8").ingest(
+            data_dir=tmp_path / "raw", store_path=store
+        )
+        
+        assert not (store / "index.faiss").exists()
+        meta = json.loads((store / "index.json").read_text())
+        assert meta['spec'] == "IVF64,PQ8" and meta['built'] == "Flat"
+    
+    def test_search_params(self):
+        """nprobe is applied to IVF indexes (capped at nlist) and ignored elsewhere."""
+        from ann_index import build_index, set_search_params
+        from chunk_store import FlatVectorIndex
+        
+        vectors = np.random.default_rng(0).standard_normal((400, 8)).astype(np.float32)
+        index = build_index("IVF4,Flat", vectors)
+        set_search_params(index, nprobe=16, ef_search=32)
+        assert index.nprobe == 4
+        set_search_params(FlatVectorIndex(vectors), nprobe=16)
+
+
+class TestHybridRetrieval:
+    """Test BM25 sparse retrieval and rank fusion."""
+    
+    def test_bm25_matches_reference_scores(self):
+        """Vectorized scoring equals a direct Okapi BM25 computation."""
+        import math
+        from bm25 import BM25Index, tokenize
+        
+        texts = [
+            "Metformin is first-line therapy for type 2 diabetes (ICD E11.9).",
+            "Insulin therapy for type 1 diabetes; HbA1c target 7.0.",
+            "Lisinopril lowers blood pressure.",
+            "Diabetes diabetes diabetes and metformin dosing.",
+        ]
+        index = BM25Index.build(texts)
+        scores, positions = index.search("metformin diabetes e11.9", k=4)
+        
+        docs = [tokenize(t) for t in texts]
+        avgdl = sum(map(len, docs)) / len(docs)
+        
+        def reference(doc):
+            total = 0.0
+            for term in {"metformin", "diabetes", "e11.9"}:
+                df = sum(term in d for d in docs)
+                tf = doc.count(term)
+                idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                total += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * len(doc) / avgdl))
+            return total
+        
+        expected = sorted(((reference(d), i) for i, d in enumerate(docs) if reference(d) > 0), reverse=True)
+        assert positions.tolist() == [i for _, i in expected]
+        assert np.allclose(scores, [score for score, _ in expected], rtol=1e-5)
+        assert "e11.9" in tokenize("ICD E11.9")
+    
+    def test_reciprocal_rank_fusion(self):
+        """Chunks ranked well by both rankers come first; -1 padding is ignored."""
+        from bm25 import reciprocal_rank_fusion
+        
+        assert reciprocal_rank_fusion([[3, 1, 2, -1], [1, 4]], k=3) == [1, 3, 4]
+    
+    def test_hybrid_retriever_finds_exact_term(self, offline_rag, tmp_path):
+        """A keyword match is ranked first even when the dense ranking misses it."""
+        from retriever import Retriever
+        
+        retriever = Retriever(tmp_path / "store", embeddings=CountingEmbeddings(), mode="hybrid")
+        for query in ["hypertension", "respiratory", "urination"]:
+            _, docs = retriever.retrieve_with_ids(query, k=1)
+            assert query in docs[0].page_content.lower()
+        
+        queries = ["hypertension", "thirst"]
+        assert retriever.retrieve_batch(queries, k=2) == [retriever.retrieve_with_ids(q, k=2) for q in queries]
+
+
+class KeywordCrossEncoder:
+    """Offline cross-encoder stand-in: scores a pair by shared words."""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def predict(self, pairs, batch_size=32):
+        self.calls.append(len(pairs))
+        return [len(set(q.split()) & set(text.lower().split())) for q, text in pairs]
+
+
+class TestReranker:
+    """Test the cross-encoder rerank stage."""
+    
+    def test_rerank_orders_and_caches_pairs(self):
+        """Candidates are reordered by score and repeated pairs are not rescored."""
+        from reranker import CrossEncoderReranker
+        
+        model = KeywordCrossEncoder()
+        reranker = CrossEncoderReranker(model=model)
+        docs = [Document(page_content=t) for t in ["blood tests", "high blood pressure", "pressure"]]
+        
+        assert reranker.rerank("High blood pressure", ["a", "b", "c"], docs, top_n=2) == [1, 0]
+        assert reranker.rerank("high  blood pressure", ["a", "b", "c"], docs, top_n=2) == [1, 0]
+        assert model.calls == [3]
+        assert reranker.stats()['hits'] == 3
+    
+    def test_over_budget_skips_reranking(self):
+        """When scoring would exceed the budget, retrieval order is kept."""
+        from reranker import CrossEncoderReranker
+        
+        model = KeywordCrossEncoder()
+        reranker = CrossEncoderReranker(model=model, budget_ms=10)
+        reranker.ms_per_pair = 5.0
+        docs = [Document(page_content=t) for t in ["x", "fever", "y"]]
+        
+        assert reranker.rerank("fever", ["a", "b", "c"], docs, top_n=2) == [0, 1]
+        assert model.calls == []
+        assert reranker.stats()['skipped'] == 1
+    
+    def test_reranking_resumes_after_slow_pass(self):
+        """One slow pass does not disable reranking: skips decay the estimate until a pass re-measures it."""
+        from reranker import CrossEncoderReranker
+        
+        class ColdStartCrossEncoder(KeywordCrossEncoder):
+            def predict(self, pairs, batch_size=32):
+                if not self.calls:
+                    time.sleep(0.2)  # Cold first predict
+                return super().predict(pairs, batch_size)
+        
+        model = ColdStartCrossEncoder()
+        reranker = CrossEncoderReranker(model=model, budget_ms=20, cache_size=0)
+        docs = [Document(page_content=t) for t in ["x", "fever", "y"]]
+        
+        results = [reranker.rerank("fever", ["a", "b", "c"], docs, top_n=2) for _ in range(40)]
+        
+        assert reranker.stats()['skipped'] > 0
+        assert len(model.calls) > 2
+        assert results[-1] == [1, 0]
+        assert reranker.ms_per_pair * 3 < reranker.budget_ms
+    
+    def test_retriever_reranks_wider_candidate_set(self, offline_rag, tmp_path):
+        """The retriever scores every candidate of a batch in one pass and keeps the best."""
+        from reranker import CrossEncoderReranker
+        from retriever import Retriever
+        
+        model = KeywordCrossEncoder()
+        retriever = Retriever(
+            tmp_path / "store", embeddings=CountingEmbeddings(), reranker=CrossEncoderReranker(model=model)
+        )
+        results = retriever.retrieve_batch(["blood pressure", "viral infection"], k=1)
+        
+        assert "blood pressure" in results[0][1][0].page_content
+        assert "viral infection" in results[1][1][0].page_content
+        assert model.calls == [6]
+        assert retriever.default_k == settings.rerank_top_n
+
+
+class TestContextPacking:
+    """Test token-budgeted context packing."""
+    
+    @staticmethod
+    def builder(budget=2048):
+        from context_builder import ContextBuilder, TokenCounter
+        
+        counter = TokenCounter("offline")
+        counter._loaded = True  # no tokenizer: 4 characters per token
+        return ContextBuilder(counter, token_budget=budget)
+    
+    def test_overlap_and_duplicates_removed(self):
+        """Splitter overlap is cut, near duplicates are dropped and [Source N] numbers are kept."""
+        text = " ".join(f"word{i}" for i in range(200))
+        first, second = text[:900], text[700:]
+        docs = [
+            Document(page_content=second, metadata={'source': 'a.pdf'}),
+            Document(page_content=second + " extra", metadata={'source': 'b.pdf'}),
+            Document(page_content=first, metadata={'source': 'a.pdf'}),
+        ]
+        packed = self.builder().build(docs)
+        
+        assert packed.source_ids == [1, 3]
+        assert packed.duplicates_dropped == 1
+        assert packed.overlaps_trimmed == 1
+        assert "[Source 3]" in packed.text
+        assert packed.text.count(text[700:900]) == 1
+        assert packed.tokens_saved > 0
+    
+    def test_budget_truncates_then_drops(self):
+        """Chunks fill the budget, the next is truncated and the rest are dropped."""
+        docs = [
+            Document(page_content=f"topic{i} " * 100, metadata={'source': f"{i}.txt"})
+            for i in range(4)
+        ]
+        builder = self.builder(budget=460)
+        packed = builder.build(docs)
+        
+        assert packed.tokens_after <= 460
+        assert packed.source_ids == [1, 2, 3]
+        assert packed.truncated == 1
+        assert packed.chunks_dropped == 1
+        assert builder.stats()['tokens_saved'] == packed.tokens_saved
+    
+    def test_async_prompt_built_off_event_loop(self):
+        """Async generation packs the context on a worker thread and reports the totals in stats."""
+        import threading
+        from llm_base import create_llm
+        
+        llm = create_llm("stub")
+        build = llm.context_builder.build
+        threads = []
+        llm.context_builder.build = lambda docs: threads.append(threading.get_ident()) or build(docs)
+        docs = [Document(page_content="Asthma narrows the airways.", metadata={'source': 'a.txt'})]
+        
+        async def run():
+            await llm.agenerate_answer("What is asthma?", docs, "")
+            return "".join([token async for token in llm.astream_answer("What is asthma?", docs, "")])
+        
+        assert asyncio.run(run())
+        assert len(threads) == 2 and threading.get_ident() not in threads
+        assert llm.stats()['context']['requests'] == 2
+        llm.engine.close()
+
+
+class TestLLMTransport:
+    """Test the pooled HTTP transport for the Inference API."""
+    
+    @staticmethod
+    def transport(handler, **kwargs):
+        import httpx
+        from llm_transport import HFTransport
+        
+        kwargs.setdefault('backoff_base', 0.01)
+        return HFTransport("test/model", http_transport=httpx.MockTransport(handler), **kwargs)
+    
+    def test_retries_honour_retry_after(self):
+        """A 503 with estimated_time and a 429 with Retry-After are retried, then the answer is returned."""
+        import httpx
+        
+        responses = [
+            httpx.Response(503, json={"error": "Model is loading", "estimated_time": 0.05}),
+            httpx.Response(429, headers={"Retry-After": "0"}, json={"error": "Rate limit reached"}),
+            httpx.Response(200, json=[{"generated_text": "Hypertension is..."}]),
+        ]
+        transport = self.transport(lambda request: responses.pop(0))
+        
+        start = time.perf_counter()
+        assert transport.generate("prompt", {}) == "Hypertension is..."
+        assert time.perf_counter() - start >= 0.05
+        assert transport.stats()['retries'] == 2
+        assert transport.stats()['circuit'] == "closed"
+    
+    def test_circuit_breaker_fails_fast(self):
+        """After consecutive failures requests are rejected without touching the network."""
+        import httpx
+        from llm_transport import CircuitOpenError, TransportError
+        
+        calls = []
+        
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(503, json={"error": "overloaded"})
+        
+        transport = self.transport(handler, max_retries=0, breaker_failures=2, breaker_reset=60)
+        for _ in range(2):
+            with pytest.raises(TransportError):
+                transport.generate("prompt", {})
+        with pytest.raises(CircuitOpenError):
+            transport.generate("prompt", {})
+        
+        assert len(calls) == 2
+        assert transport.stats()['circuit'] == "open"
+        assert transport.stats()['rejected'] == 1
+    
+    def test_client_errors_are_not_retried(self):
+        """A 4xx other than 429 fails at once and does not count against the circuit."""
+        import httpx
+        from llm_transport import TransportError
+        
+        calls = []
+        transport = self.transport(lambda r: calls.append(r) or httpx.Response(401, json={"error": "bad token"}))
+        with pytest.raises(TransportError):
+            transport.generate("prompt", {})
+        assert len(calls) == 1
+        assert transport.breaker.failures == 0
+    
+    def test_async_stream_parses_events(self):
+        """Token events are yielded in order and special tokens are skipped."""
+        import httpx
+        import json
+        
+        events = [{"token": {"text": t, "special": t == "</s>"}} for t in ["Rest", " and", " fluids", "</s>"]]
+        body = "".join(f"data:{json.dumps(e)}\n\n" for e in events).encode()
+        transport = self.transport(lambda request: httpx.Response(200, content=body))
+        
+        async def collect():
+            return [token async for token in transport.astream("prompt", {})]
+        
+        assert asyncio.run(collect()) == ["Rest", " and", " fluids"]
+    
+    def test_token_bucket(self):
+        """Bursts up to capacity pass at once, then callers wait 1/rate each."""
+        from llm_transport import TokenBucket
+        
+        bucket = TokenBucket(rate=10, capacity=2)
+        assert bucket.reserve() == 0 and bucket.reserve() == 0
+        assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+        assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+class TestLocalBackend:
+    """Test the in-process LLM backend and its continuous-batching engine."""
+    
+    def test_stub_backend_answers_offline(self, offline_rag):
+        """The whole pipeline runs offline against the deterministic stub model."""
+        from llm_base import create_llm
+        
+        offline_rag.answer_cache = None
+        offline_rag.llm = create_llm("stub")
+        first = offline_rag.query("What causes the common cold?", top_k=1)
+        second = offline_rag.query("What causes the common cold?", top_k=1)
+        
+        assert offline_rag.llm.stats()['backend'] == "stub"
+        assert first['answer'].startswith("According to [Source 1], this is a stub answer to: What causes")
+        assert first['answer'] == second['answer']
+        streamed = "".join(offline_rag.llm.stream_answer("What causes the common cold?", []))
+        assert streamed.startswith("According to [Source 1]")
+    
+    def test_requests_join_running_batch(self):
+        """Concurrent requests share decode steps instead of running one after another."""
+        from llm_local import BatchingEngine, StubModel
+        
+        engine = BatchingEngine(StubModel(step_delay=0.02), max_batch_size=8)
+        prompts = [f"USER QUESTION: question number {i} about fever" for i in range(4)]
+        
+        async def run():
+            return await asyncio.gather(*(engine.agenerate(p) for p in prompts))
+        
+        answers = asyncio.run(run())
+        stats = engine.stats()
+        
+        assert answers == [engine.generate(p) for p in prompts]
+        assert stats['peak_batch'] == 4
+        assert stats['steps'] < stats['tokens'] / 2
+        engine.close()
+    
+    def test_abandoned_streams_free_their_slot(self):
+        """Closing a stream early drops its sequence instead of decoding to the end."""
+        from llm_base import create_llm
+        from llm_local import BatchingEngine, StubModel
+        
+        engine = BatchingEngine(StubModel(step_delay=0.01), max_batch_size=1)
+        prompt = "USER QUESTION: " + "a very long question about fever " * 20
+        
+        stream = engine.stream(prompt)
+        next(stream)
+        stream.close()
+        
+        async def abandon():
+            # The second request waits behind the first (one slot); both are abandoned
+            tasks = [asyncio.ensure_future(engine.agenerate(prompt)) for _ in range(2)]
+            await asyncio.sleep(0.05)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        asyncio.run(abandon())
+        assert engine.generate("USER QUESTION: fever") == "According to [Source 1], this is a stub answer to: fever"
+        stats = engine.stats()
+        assert stats['cancelled'] == 3
+        assert stats['running'] == 0 and stats['waiting'] == 0
+        assert stats['tokens'] < 40
+        engine.close()
+        
+        # Closing the LLM-level stream reaches the engine too
+        llm = create_llm("stub")
+        answer = llm.stream_answer(prompt.removeprefix("USER QUESTION: "), [])
+        next(answer)
+        answer.close()
+        assert llm.engine.stats()['cancelled'] == 1
+        llm.engine.close()
+    
+    def test_failure_mid_stream_is_reported_not_cached(self, offline_rag):
+        """A model that fails after the first tokens ends the stream with an error and caches nothing."""
+        from llm_local import BatchingEngine, LocalLLM, StubModel
+        
+        class FailingModel(StubModel):
+            steps = 0
+            
+            def decode(self, states):
+                self.steps += 1
+                if self.steps == 3:
+                    raise RuntimeError("out of memory")
+                return super().decode(states)
+        
+        offline_rag.llm = LocalLLM(engine=BatchingEngine(FailingModel()))
+        sync_events = list(offline_rag.stream_query("What causes the common cold?", top_k=1))
+        
+        async def collect():
+            offline_rag.llm.engine.model.steps = 0
+            return [event async for event in offline_rag.astream_query("What causes the common cold?", top_k=1)]
+        
+        for events in (sync_events, asyncio.run(collect())):
+            assert [e['type'] for e in events] == ['start', 'token', 'token', 'error', 'done']
+            assert "out of memory" in events[3]['detail']
+            assert events[-1]['answer'] == "According to"
+        assert offline_rag.answer_cache.stats()['size'] == 0
+        offline_rag.llm.engine.close()
+    
+    def test_batched_decode_matches_single(self):
+        """Left-padded batched decoding gives the same tokens as decoding each prompt alone."""
+        from concurrent.futures import ThreadPoolExecutor
+        torch = pytest.importorskip("torch")
+        transformers = pytest.importorskip("transformers")
+        from llm_local import BatchingEngine, TransformersModel
+        
+        class CharTokenizer:
+            eos_token_id = 0
+            
+            def encode(self, text, add_special_tokens=False):
+                return [min(ord(c), 126) + 1 for c in text]
+            
+            def decode(self, ids, skip_special_tokens=True):
+                return "".join(chr(i - 1) for i in ids if i)
+        
+        torch.manual_seed(0)
+        config = transformers.LlamaConfig(
+            vocab_size=128, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+            num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256
+        )
+        model = TransformersModel("tiny", model=transformers.LlamaForCausalLM(config), tokenizer=CharTokenizer())
+        prompts = ["fever", "a much longer prompt about blood pressure", "x"]
+        
+        single = [BatchingEngine(model, max_batch_size=1).generate(p, 16) for p in prompts]
+        engine = BatchingEngine(model, max_batch_size=4)
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            batched = list(pool.map(lambda p: engine.generate(p, 16), prompts))
+        
+        assert batched == single
+        assert engine.stats()['peak_batch'] > 1
+
+
+class TestSafetyClassifier:
+    """Test the compiled safety phrase matcher."""
+    
+    def test_default_phrases(self):
+        """Emergency outranks personal advice; case, spacing and curly apostrophes are normalized."""
+        from safety import EMERGENCY, PERSONAL_ADVICE, SafetyClassifier
+        
+        classifier = SafetyClassifier.from_file()
+        assert classifier.classify("Should I take aspirin?").category == PERSONAL_ADVICE
+        assert classifier.classify("should i take something for a SEIZURE").category == EMERGENCY
+        assert classifier.classify("I can’t   breathe").phrase == "can't breathe"
+        assert classifier.classify("What causes the common cold?").warning == ""
+    
+    def test_matches_naive_scan(self):
+        """Overlapping and prefix phrases give the same verdict as one substring test per phrase."""
+        import random
+        from safety import SafetyClassifier
+        
+        rng = random.Random(0)
+        words = ["chest", "pain", "help", "dose", "take", "me", "i", "now", "fever", "bleeding"]
+        phrases = {
+            "high": {" ".join(rng.choices(words, k=rng.randint(1, 3))) for _ in range(150)},
+            "low": {" ".join(rng.choices(words, k=rng.randint(1, 3))) for _ in range(300)} | {"chest", "chest pain now"},
+        }
+        phrases["high"] |= {"chest pain"}
+        classifier = SafetyClassifier(phrases)
+        
+        for _ in range(300):
+            query = " ".join(rng.choices(words, k=rng.randint(1, 8)))
+            expected = next((c for c in ("high", "low") if any(p in query for p in phrases[c])), None)
+            assert classifier.classify(query).category == expected, query
+    
+    def test_classified_once_per_request(self, offline_rag):
+        """The pipeline passes the verdict to the LLM instead of checking again."""
+        from llm_base import create_llm
+        
+        offline_rag.answer_cache = None
+        offline_rag.llm = create_llm("stub")
+        calls = []
+        classify = offline_rag.llm.safety.classify
+        offline_rag.llm.safety = type("Counting", (), {"classify": lambda self, q: calls.append(q) or classify(q)})()
+        
+        result = offline_rag.query("Is this an emergency?", top_k=1)
+        
+        assert calls == ["Is this an emergency?"]
+        assert result['answer'].startswith("🚨")
+
+
+class TestMetrics:
+    """Test latency histograms and the /metrics and /stats endpoints."""
+    
+    def test_histogram_percentiles(self):
+        """Interpolated percentiles stay within a bucket width of the exact values."""
+        from metrics import Histogram
+        
+        values = np.random.default_rng(0).lognormal(mean=-4, sigma=1, size=20000)
+        histogram = Histogram()
+        for value in values:
+            histogram.observe(float(value))
+        
+        for q in (50, 95, 99):
+            exact = np.percentile(values, q)
+            assert abs(histogram.percentile(q) - exact) / exact < 0.2
+        assert histogram.count == len(values)
+    
+    def test_stage_latency_endpoints(self, offline_rag, monkeypatch):
+        """A /chat request records every stage; /metrics and /stats expose them."""
+        import app_api
+        from fastapi.testclient import TestClient
+        from llm_base import create_llm
+        from metrics import metrics
+        
+        metrics.reset()
+        offline_rag.llm = create_llm("stub")
+        monkeypatch.setattr(app_api, "rag_system", offline_rag)
+        client = TestClient(app_api.app)
+        assert client.post("/chat", json={"query": "common cold", "top_k": 1}).status_code == 200
+        
+        stats = client.get("/stats").json()
+        latency = stats['latency']
+        for stage in ("safety", "embed", "search", "answer_cache", "prompt", "llm", "format", "total"):
+            assert latency[stage]['count'] == 1, stage
+            assert latency[stage]['p50_ms'] <= latency[stage]['p99_ms']
+        assert stats['rerank'] == offline_rag.retriever.rerank_stats()
+        assert stats['answer_cache']['misses'] == 1 and stats['answer_cache']['evictions'] == 0
+        
+        body = client.get("/metrics").text
+        assert '# TYPE rag_stage_seconds histogram' in body
+        assert 'rag_stage_seconds_count{stage="llm"} 1' in body
+        assert 'http_request_seconds_count{route="/chat"} 1' in body
+
+
+class TestLoadTest:
+    """Test the mock Inference API and the load test's saturation detection."""
+    
+    @pytest.fixture(autouse=True)
+    def benchmarks_path(self, monkeypatch):
+        monkeypatch.syspath_prepend(str(Path(__file__).parent.parent / "benchmarks"))
+    
+    def test_mock_endpoint_speaks_inference_api(self, monkeypatch):
+        """The transport gets plain and streamed answers from the mock endpoint."""
+        import httpx
+        import mock_hf
+        from llm_transport import HFTransport
+        
+        monkeypatch.setattr(mock_hf, "config", mock_hf.MockConfig(latency_ms=1, jitter_ms=0, tokens=12))
+        transport = HFTransport(
+            "test/model", api_url="http://mock/models/{model}",
+            http_transport=httpx.ASGITransport(app=mock_hf.app),
+        )
+        prompt = "CONTEXT: ...\nUSER QUESTION: What is asthma?\nANSWER:"
+        
+        async def run():
+            answer = await transport.agenerate(prompt, {})
+            streamed = "".join([token async for token in transport.astream(prompt, {})])
+            return answer, streamed
+        
+        answer, streamed = asyncio.run(run())
+        assert "What is asthma?" in answer
+        assert streamed == answer
+        assert len(answer.split()) == 12
+    
+    def test_find_saturation(self):
+        """Saturation is the first level with flat throughput, errors or a broken SLO."""
+        from loadtest import find_saturation
+        
+        def level(concurrency, rps, p99_ms=100.0, error_rate=0.0):
+            return {'concurrency': concurrency, 'rps': rps, 'p99_ms': p99_ms, 'error_rate': error_rate}
+        
+        growing = [level(1, 10), level(2, 19), level(4, 37)]
+        assert find_saturation(growing) is None
+        assert find_saturation(growing + [level(8, 39), level(16, 40)])['concurrency'] == 8
+        assert find_saturation(growing + [level(8, 70, error_rate=0.05)])['concurrency'] == 8
+        assert find_saturation(growing + [level(8, 70, p99_ms=900)], slo_p99_ms=500)['concurrency'] == 8
+
+
+class TestPrefork:
+    """Test the preforking multi-worker server."""
+    
+    @pytest.mark.skipif(not hasattr(__import__("os"), "fork"), reason="needs os.fork")
+    def test_workers_share_socket_and_preloaded_state(self):
+        """Workers answer on one socket with state built once in the parent, and stop cleanly."""
+        import os
+        import socket
+        from prefork import PreforkServer
+        
+        preloaded = {}
+        
+        def preload():
+            preloaded['parent'] = os.getpid()
+        
+        def serve(sock):
+            while True:
+                conn, _ = sock.accept()
+                with conn:
+                    conn.sendall(f"{os.getpid()} {preloaded['parent']}".encode())
+        
+        server = PreforkServer(serve, "127.0.0.1", 0, workers=2, preload=preload).start()
+        try:
+            assert len(server.children) == 2
+            replies = []
+            for _ in range(10):
+                with socket.create_connection(("127.0.0.1", server.port), timeout=5) as conn:
+                    replies.append(conn.recv(64).decode().split())
+            assert {parent for _, parent in replies} == {str(os.getpid())}
+            assert {int(pid) for pid, _ in replies} <= set(server.children)
+        finally:
+            server.stop(timeout=5)
+        assert server.children == {}
+
+
 class TestRetriever:
     """Test retriever functionality."""
     
@@ -131,7 +1469,7 @@ class TestRAGSystem:
     """Test full RAG system (requires vector store)."""
     
     @pytest.mark.skipif(
-        not (settings.vector_store_dir / "index.faiss").exists(),
+        not (settings.vector_store_dir / "chunks.bin").exists(),
         reason="Vector store not found. Run ingestion first."
     )
     def test_query_execution(self):
@@ -177,6 +1515,9 @@ def test_config_loading():
 
 def test_data_directories_exist():
     """Test that data directories are created."""
+    from config import ensure_directories
+    
+    ensure_directories()
     assert settings.raw_data_dir.exists()
     assert settings.vector_store_dir.exists()
 